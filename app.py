@@ -1,5 +1,6 @@
 from app import create_app
 
 if __name__ == "__main__":
-    app = create_app()
+    # Сервер разработки; в рабочем режиме — serve.py после `flask db upgrade`
+    app = create_app({"AUTO_MIGRATE": True})
     app.run(debug=True)
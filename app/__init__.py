@@ -1,9 +1,30 @@
+import logging
+import time
+
 from flask import Flask
 
 import config
 from app.extensions import db, login_manager
+from app.database import configure_database, init_database
 from app.routes.main import main
 from app.routes.auth import auth
+from app.commands import (
+    db_cli, comments_cli, ratings_cli, recommendations_cli, search_cli, uploads_cli, storage_cli, import_cli,
+    thumbnails_cli, packaging_cli, jobs_cli,
+)
+from app.migrations import init_schema
+from app.watch_events import init_watch_events
+from app.cache import init_cache
+from app.profiling import init_profiling
+from app.passwords import init_passwords
+from app.outbox import init_mail
+from app.thumbnails import init_thumbnails
+from app.packaging import init_packaging
+from app.jobs import init_jobs
+from app.external_ratings import init_external_ratings
+
+
+logger = logging.getLogger(__name__)
 
 
 # Register
@@ -12,17 +33,55 @@ def register_routes(app):
     app.register_blueprint(main)
 
 
-def create_app():
+def register_commands(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(ratings_cli)
+    app.cli.add_command(comments_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(import_cli)
+    app.cli.add_command(thumbnails_cli)
+    app.cli.add_command(packaging_cli)
+    app.cli.add_command(jobs_cli)
+
+
+def create_app(config_overrides=None):
+    """
+    :param config_overrides: Значения, заменяющие config.Config (бенчмарки, отдельные базы)
+    """
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(config.Config)
+    app.config.update(config_overrides or {})
 
     # Инициализация расширений
+    configure_database(app.config)
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+    init_database(app, db)
+    if app.config['AUTO_MIGRATE']:
+        # В рабочем режиме схему обновляет `flask db upgrade` при деплое
+        with app.app_context():
+            init_schema()
     login_manager.init_app(app)
+    init_passwords(app)
+    init_cache(app)
+    init_watch_events(app)
+    init_mail(app)
+    init_jobs(app)
+    init_external_ratings(app)
+    init_profiling(app)
+    init_thumbnails(app)
+    init_packaging(app)
 
     # Регистрация маршрутов
     register_routes(app)
+    register_commands(app)
 
+    elapsed = time.perf_counter() - started
+    app.extensions['startup_seconds'] = elapsed
+    if 'profiling' in app.extensions:
+        app.extensions['profiling'].metrics.startup_seconds = elapsed
+    logger.info("Application created in %.3fs", elapsed)
     return app
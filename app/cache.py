@@ -0,0 +1,273 @@
+import hashlib
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с ограничением размера и временем жизни записей.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileSystemCache:
+    """
+    Кэш в файлах общего каталога: локальная замена разделяемого кэша (Redis)
+    для нескольких процессов на одной машине.
+    """
+
+    def __init__(self, directory, max_entries=10000, ttl=300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if expires_at < time.time():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+        if random.random() < 0.01:
+            self._prune()
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
+
+
+class RedisCache:
+    """
+    Разделяемый кэш в Redis (нужен пакет redis).
+    """
+
+    def __init__(self, url, ttl=300, prefix='watching-show:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key, default=None):
+        raw = self.client.get(self._key(key))
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def create_cache(config, instance_path):
+    """
+    :raises RuntimeError: Если кэш в памяти, а задачи выполняются в других процессах
+    """
+    backend = config['CACHE_BACKEND']
+    ttl = config['CACHE_DEFAULT_TIMEOUT']
+    if backend == 'memory' and (not config['JOBS_BACKGROUND'] or config['JOBS_POOL'] == 'process'):
+        # invalidate_catalog из задачи сбросил бы только кэш процесса исполнителя
+        raise RuntimeError("CACHE_BACKEND=memory is per process, but jobs run in a separate process "
+                           "(JOBS_BACKGROUND=0 or JOBS_POOL=process): use CACHE_BACKEND=filesystem or redis.")
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], ttl=ttl)
+    if backend == 'filesystem':
+        return FileSystemCache(
+            config['CACHE_DIR'] or os.path.join(instance_path, 'cache'),
+            max_entries=config['CACHE_MAX_ENTRIES'],
+            ttl=ttl,
+        )
+    return TTLCache(max_size=config['CACHE_MAX_ENTRIES'], ttl=ttl)
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+CATALOG_VERSION_KEY = 'catalog-version'
+CATALOG_VERSION_TTL = 60 * 60 * 24 * 365
+
+
+def catalog_version():
+    """
+    Текущая версия каталога: входит в ключи всех зависящих от каталога записей,
+    поэтому её смена разом делает их неактуальными.
+    """
+    cache = get_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(CATALOG_VERSION_KEY, version, ttl=CATALOG_VERSION_TTL)
+    return version
+
+
+def invalidate_catalog():
+    """
+    Сбрасывает кэш страниц и фрагментов, построенных по каталогу.
+    Вызывается после добавления контента и изменения оценок.
+    """
+    get_cache().set(CATALOG_VERSION_KEY, uuid.uuid4().hex, ttl=CATALOG_VERSION_TTL)
+
+
+def cached_response(timeout=None):
+    """
+    Кэширует ответ целиком для анонимных GET-запросов и отвечает 304 по ETag.
+
+    Ответы, изменившие сессию или выставившие cookie, ответы с ошибками и запросы
+    с flash-сообщениями не кэшируются.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or current_user.is_authenticated or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            cache = get_cache()
+            key = ('response', catalog_version(), request.full_path)
+            cached = cache.get(key)
+            if cached is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                # Cookie сессии добавляется уже после представления, поэтому смотрим на саму сессию
+                if (response.status_code != 200 or session.modified
+                        or 'Set-Cookie' in response.headers or response.is_streamed):
+                    return response
+                body = response.get_data()
+                cached = (body, response.mimetype, hashlib.sha1(body).hexdigest())
+                cache.set(key, cached, ttl=timeout)
+
+            body, mimetype, etag = cached
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.no_cache = True  # браузер переспрашивает с If-None-Match
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Кэширование фрагментов шаблона:
+
+        {% cache 'top-movies', scope %} ... {% endcache %}
+
+    Если scope равен None, фрагмент рендерится без кэша (например, для
+    персонализированных страниц). Ключ включает версию каталога.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args), [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, name, scope, caller):
+        if scope is None:
+            return caller()
+        cache = get_cache()
+        key = ('fragment', catalog_version(), name, scope)
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            cache.set(key, rendered, ttl=current_app.config['CACHE_FRAGMENT_TIMEOUT'])
+        return rendered
+
+
+def init_cache(app):
+    app.extensions['cache'] = create_cache(app.config, app.instance_path)
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,263 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.ratings import rebuild_rating_aggregates
+from app.comments import rebuild_comment_counters
+from app.recommendations import build_recommendations
+from app.search import rebuild_search_index
+from app.external_ratings import refresh_external_ratings
+from app.uploads import cleanup_uploads
+from app.storage import get_storage
+from app.cache import invalidate_catalog
+from app.migrations import MIGRATIONS, current_version, init_schema, upgrade_schema
+from app.queries import route_queries, explain
+from app.importer import RowError, import_file
+from app.thumbnails import backfill_thumbnails
+from app.packaging import PackagingError, enqueue_missing_packages, vendor_player_script
+from app.jobs import TASKS, JobWorker, cleanup_jobs, enqueue_job
+
+
+db_cli = AppGroup('db', help='Схема базы данных.')
+ratings_cli = AppGroup('ratings', help='Обслуживание агрегатов оценок.')
+comments_cli = AppGroup('comments', help='Обслуживание счётчиков комментариев.')
+recommendations_cli = AppGroup('recommendations', help='Офлайн-построение рекомендаций.')
+search_cli = AppGroup('search', help='Обслуживание полнотекстового индекса.')
+uploads_cli = AppGroup('uploads', help='Обслуживание загрузок по частям.')
+storage_cli = AppGroup('storage', help='Хранилище файлов контента.')
+import_cli = AppGroup('import', help='Массовая загрузка каталога и оценок из CSV/JSONL.')
+thumbnails_cli = AppGroup('thumbnails', help='Варианты обложек.')
+packaging_cli = AppGroup('packaging', help='HLS-упаковка видео.')
+jobs_cli = AppGroup('jobs', help='Очередь фоновых задач.')
+
+
+@db_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Версия схемы, до которой обновить.')
+def upgrade_command(target):
+    """Применяет недостающие миграции схемы и создаёт полнотекстовый индекс."""
+    applied = upgrade_schema(target) if target is not None else init_schema()
+    for number, name in applied:
+        click.echo(f'Applied {number} {name}')
+    click.echo(f'Schema version: {current_version()} (latest {MIGRATIONS[-1][0]}).')
+
+
+@db_cli.command('version')
+def version_command():
+    """Показывает текущую версию схемы."""
+    click.echo(f'Schema version: {current_version()} (latest {MIGRATIONS[-1][0]}).')
+
+
+@db_cli.command('explain')
+@click.option('--strict', is_flag=True, help='Код возврата 1, если есть полное сканирование таблицы.')
+def explain_command(strict):
+    """Печатает планы выполнения запросов маршрутов."""
+    full_scans = []
+    for name, statement in route_queries():
+        lines, full_scan = explain(statement)
+        click.echo(f'{"!! " if full_scan else ""}{name}')
+        for line in lines:
+            click.echo(f'    {line}')
+        if full_scan:
+            full_scans.append(name)
+    if full_scans:
+        click.echo(f'Full table scans in {len(full_scans)} queries: {", ".join(full_scans)}')
+        if strict:
+            sys.exit(1)
+    else:
+        click.echo('No full table scans.')
+
+
+@ratings_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='Записей контента на транзакцию.')
+def rebuild_ratings_command(batch_size):
+    """Пересчитывает rating_sum/rating_count по таблице rating."""
+    updated = rebuild_rating_aggregates(batch_size=batch_size)
+    invalidate_catalog()
+    click.echo(f'Rating aggregates rebuilt for {updated} items.')
+
+
+@comments_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='Записей на транзакцию.')
+def rebuild_comments_command(batch_size):
+    """Пересчитывает comment_count контента и likes_count комментариев."""
+    updated = rebuild_comment_counters(batch_size=batch_size)
+    click.echo(f'Comment counters rebuilt for {updated} rows.')
+
+
+@ratings_cli.command('refresh-external')
+@click.option('--batch-size', default=500, show_default=True, help='Записей каталога на пачку.')
+@click.option('--force', is_flag=True, help='Игнорировать кэш рейтингов.')
+def refresh_external_ratings_command(batch_size, force):
+    """Обновляет external_rating всего каталога из внешнего сервиса."""
+    updated = refresh_external_ratings(batch_size=batch_size, force=force)
+    invalidate_catalog()
+    click.echo(f'External ratings updated for {updated} items.')
+
+
+@recommendations_cli.command('build')
+@click.option('--limit', default=10, show_default=True, help='Рекомендаций каждого типа на пользователя.')
+@click.option('--neighbours', default=50, show_default=True, help='Соседей, хранимых для каждого элемента.')
+def build_recommendations_command(limit, neighbours):
+    """Пересчитывает таблицу рекомендаций по оценкам, просмотрам и предпочтениям."""
+    written = build_recommendations(limit=limit, neighbours=neighbours)
+    click.echo(f'{written} recommendations written.')
+
+
+@search_cli.command('rebuild')
+def rebuild_search_command():
+    """Перестраивает полнотекстовый индекс по фильмам и сериалам."""
+    indexed = rebuild_search_index()
+    click.echo(f'{indexed} items indexed.')
+
+
+@uploads_cli.command('cleanup')
+def cleanup_uploads_command():
+    """Удаляет брошенные незавершённые загрузки и их временные файлы."""
+    removed = cleanup_uploads()
+    click.echo(f'{removed} stale uploads removed.')
+
+
+@storage_cli.command('bench')
+@click.option('--size-mb', default=256, show_default=True, help='Размер тестового файла.')
+def bench_storage_command(size_mb):
+    """Замеряет скорость загрузки в настроенное хранилище (STORAGE_* в конфиге)."""
+    storage = get_storage()
+    with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    try:
+        started = time.perf_counter()
+        url = storage.upload_file(f.name, f'bench/{os.path.basename(f.name)}')
+        elapsed = time.perf_counter() - started
+    finally:
+        os.remove(f.name)
+    click.echo(f'{type(storage).__name__}: {size_mb} MB in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s) -> {url}')
+
+
+def _import_options(command):
+    command = click.argument('path', type=click.Path(exists=True, dir_okay=False))(command)
+    command = click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+                           help='Формат файла; по умолчанию по расширению.')(command)
+    command = click.option('--batch-size', default=5000, show_default=True, help='Строк на транзакцию.')(command)
+    command = click.option('--dry-run', is_flag=True, help='Только проверить строки, ничего не записывая.')(command)
+    command = click.option('--max-errors', default=100, show_default=True,
+                           help='Прервать импорт после стольких ошибок; 0 — без ограничения.')(command)
+    return command
+
+
+def _run_import(kind, path, file_format, batch_size, dry_run, max_errors):
+    def report_error(line_number, message):
+        click.echo(f'{path}:{line_number}: {message}', err=True)
+
+    started = time.perf_counter()
+    try:
+        importer = import_file(
+            kind, path, file_format,
+            batch_size=batch_size, dry_run=dry_run, max_errors=max_errors, on_error=report_error,
+        )
+    except RowError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+    action = 'validated' if dry_run else 'imported'
+    click.echo(f'{importer.imported} of {importer.read} rows {action}, {importer.errors} rejected in {elapsed:.1f}s.')
+
+
+@import_cli.command('movies')
+@_import_options
+def import_movies_command(**options):
+    """Фильмы: title, description, genre, year, video_url, thumbnail_url, external_rating."""
+    _run_import('movies', **options)
+
+
+@import_cli.command('shows')
+@_import_options
+def import_shows_command(**options):
+    """Сериалы: title, description, genre, year, thumbnail_url, external_rating."""
+    _run_import('shows', **options)
+
+
+@import_cli.command('episodes')
+@_import_options
+def import_episodes_command(**options):
+    """Серии: show_id или show_title, season_number, episode_number, title, video_url."""
+    _run_import('episodes', **options)
+
+
+@import_cli.command('ratings')
+@_import_options
+def import_ratings_command(**options):
+    """Оценки: user_id, movie_id или show_id, rating (1–10)."""
+    _run_import('ratings', **options)
+
+
+@thumbnails_cli.command('rebuild')
+def rebuild_thumbnails_command():
+    """Строит недостающие варианты обложек, в том числе после смены размеров или качества."""
+    processed, skipped = backfill_thumbnails()
+    invalidate_catalog()
+    click.echo(f'{processed} thumbnails processed, {skipped} skipped.')
+
+
+@packaging_cli.command('enqueue')
+@click.option('--force', is_flag=True, help='Упаковать заново все видео, а не только неупакованные.')
+def enqueue_packaging_command(force):
+    """Ставит в очередь видео фильмов и серий без HLS-версии."""
+    click.echo(f'{enqueue_missing_packages(force)} videos queued.')
+
+
+@packaging_cli.command('vendor-player')
+def vendor_player_command():
+    """Скачивает hls.js в static/vendor, чтобы страница просмотра не зависела от CDN."""
+    try:
+        path, integrity = vendor_player_script()
+    except (OSError, PackagingError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Saved {path} ({integrity}).')
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', type=int, default=None, help='Задач одновременно; по умолчанию JOBS_CONCURRENCY.')
+@click.option('--pool', type=click.Choice(['thread', 'process']), default=None, help='По умолчанию JOBS_POOL.')
+def jobs_worker_command(concurrency, pool):
+    """Отдельный процесс выполнения задач (вместо фонового потока, JOBS_BACKGROUND = 0)."""
+    if current_app.config['CACHE_BACKEND'] == 'memory':
+        raise click.ClickException('CACHE_BACKEND=memory is per process: use CACHE_BACKEND=filesystem or redis '
+                                   'to run jobs in a separate worker.')
+    worker = JobWorker(current_app._get_current_object(), concurrency=concurrency, pool=pool)
+    click.echo(f'Job worker started: {worker.concurrency} {worker.pool}s.')
+    worker.serve()
+
+
+@jobs_cli.command('run')
+def run_jobs_command():
+    """Выполняет задачи, готовые к запуску, и завершается."""
+    succeeded, failed = current_app.extensions['jobs'].drain()
+    click.echo(f'{succeeded} succeeded, {failed} deferred or failed.')
+
+
+@jobs_cli.command('enqueue')
+@click.argument('name', type=click.Choice(sorted(TASKS)))
+@click.option('--payload', default='{}', help='Аргументы задачи в JSON.')
+@click.option('--priority', type=int, default=None, help='Больше — раньше.')
+@click.option('--idempotency-key', default=None)
+def enqueue_job_command(name, payload, priority, idempotency_key):
+    """Ставит задачу в очередь."""
+    try:
+        payload = json.loads(payload)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--payload')
+    job = enqueue_job(name, payload, priority=priority, idempotency_key=idempotency_key)
+    click.echo(f'Job {job.id} {job.status}.')
+
+
+@jobs_cli.command('cleanup')
+def cleanup_jobs_command():
+    """Удаляет завершённые задачи старше JOBS_RETENTION."""
+    click.echo(f'{cleanup_jobs()} finished jobs removed.')
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Movie, Show, Comment, CommentLike
+from app.pagination import encode_cursor, decode_cursor
+from app.queries import comments_query
+
+
+# Порядок ленты комментариев: (колонка, по убыванию); второй ключ — id.
+# Каждому порядку соответствует индекс (content_id, колонка[, id]) в модели Comment
+COMMENT_SORTS = {
+    'new': (Comment.timestamp, True),
+    'old': (Comment.timestamp, False),
+    'popular': (Comment.likes_count, True),
+}
+
+
+def _cursor_value(comment, column):
+    value = getattr(comment, column.key)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def comments_page(content_type, content_id, sort='new', cursor=None, per_page=20):
+    """
+    Страница комментариев к контенту с keyset-пагинацией.
+
+    :param sort: Ключ из COMMENT_SORTS
+    :param cursor: Курсор предыдущей страницы или None
+    :return: (список Comment с загруженными авторами, курсор следующей страницы или None)
+    :raises ValueError: Если курсор повреждён
+    """
+    column, descending = COMMENT_SORTS[sort]
+    query = comments_query(content_type, content_id)
+    if cursor:
+        value, last_id = decode_cursor(cursor, value_types=(int, str))
+        if column is Comment.timestamp:
+            if not isinstance(value, str):
+                raise ValueError("Invalid cursor")
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, int):
+            raise ValueError("Invalid cursor")
+        if descending:
+            query = query.filter(column <= value, db.tuple_(column, Comment.id) < db.tuple_(value, last_id))
+        else:
+            query = query.filter(column >= value, db.tuple_(column, Comment.id) > db.tuple_(value, last_id))
+
+    order = (column.desc(), Comment.id.desc()) if descending else (column.asc(), Comment.id.asc())
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(_cursor_value(items[-1], column), items[-1].id)
+    return items, next_cursor
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'user': comment.user.username,
+        'content': comment.content,
+        'timestamp': comment.timestamp.isoformat() if comment.timestamp else None,
+        'likes': comment.likes_count,
+    }
+
+
+def like_comment(comment, user_id):
+    """
+    Отмечает комментарий как понравившийся; повторная отметка ничего не меняет.
+
+    :return: Новое значение likes_count
+    """
+    if not CommentLike.query.filter_by(comment_id=comment.id, user_id=user_id).first():
+        db.session.add(CommentLike(comment_id=comment.id, user_id=user_id))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Параллельный запрос того же пользователя успел раньше
+            db.session.rollback()
+    return comment.likes_count
+
+
+def unlike_comment(comment, user_id):
+    """
+    :return: Новое значение likes_count
+    """
+    like = CommentLike.query.filter_by(comment_id=comment.id, user_id=user_id).first()
+    if like:
+        db.session.delete(like)
+        db.session.commit()
+    return comment.likes_count
+
+
+def rebuild_comment_counters(batch_size=1000):
+    """
+    Пересчитывает comment_count фильмов и сериалов и likes_count комментариев.
+
+    :param batch_size: Количество записей в одной транзакции
+    :return: Количество обновлённых записей
+    """
+    targets = (
+        (Movie, 'comment_count', db.select(db.func.count(Comment.id)).where(Comment.movie_id == Movie.id)),
+        (Show, 'comment_count', db.select(db.func.count(Comment.id)).where(Comment.show_id == Show.id)),
+        (Comment, 'likes_count', db.select(db.func.count(CommentLike.id)).where(CommentLike.comment_id == Comment.id)),
+    )
+    updated = 0
+    for model, column, count in targets:
+        max_id = db.session.query(db.func.max(model.id)).scalar() or 0
+        for start in range(0, max_id, batch_size):
+            result = db.session.execute(
+                db.update(model)
+                .where(model.id > start, model.id <= start + batch_size)
+                .values({column: count.scalar_subquery()})
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+    return updated
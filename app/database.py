@@ -0,0 +1,121 @@
+from functools import partial
+
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+
+
+# Ключ SQLALCHEMY_BINDS для движка чтения
+READ_BIND = 'read'
+_WRITER_KEY = 'use_writer'
+
+
+def _is_read(clause):
+    return isinstance(clause, (sa.Select, sa.CompoundSelect)) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """
+    Сессия, направляющая чтение в пул движка READ_BIND, а запись — в основной движок.
+
+    После первой записи (flush или INSERT/UPDATE/DELETE) и до конца транзакции все
+    запросы сессии идут в основной движок, чтобы она видела свои изменения.
+    Если движка чтения нет, сессия ведёт себя как обычная.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and READ_BIND in self._db.engines:
+            if not self._flushing and not self.info.get(_WRITER_KEY) and _is_read(clause):
+                return self._db.engines[READ_BIND]
+            if self._flushing or clause is not None:
+                self.info[_WRITER_KEY] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def read_connection(self):
+        """
+        Соединение для текстовых запросов на чтение (db.text), которые get_bind не может
+        распознать как SELECT. Обычный connection() без выражения отдаёт соединение записи.
+
+        :return: Соединение движка чтения или, после записи в этой транзакции, основного
+        """
+        if READ_BIND in self._db.engines and not self._flushing and not self.info.get(_WRITER_KEY):
+            return self.connection(bind_arguments={'bind': self._db.engines[READ_BIND]})
+        return self.connection()
+
+
+@sa.event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_WRITER_KEY, None)
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def configure_database(config):
+    """
+    Заполняет SQLALCHEMY_ENGINE_OPTIONS и SQLALCHEMY_BINDS по типу базы.
+
+    SQLite: одно соединение записи (запись и так сериализуется блокировкой файла,
+    а в WAL-режиме читатели ей не мешают) и отдельный пул чтения к тому же файлу.
+    Postgres и другие СУБД: размеры пулов из окружения, реплика чтения — DATABASE_READ_URL.
+    Явно заданные SQLALCHEMY_ENGINE_OPTIONS имеют приоритет.
+    """
+    url = sa.engine.make_url(config['SQLALCHEMY_DATABASE_URI'])
+    read_url = config['SQLALCHEMY_READ_URL']
+    if _is_memory_sqlite(url):
+        return
+
+    if url.get_backend_name() == 'sqlite':
+        connect_args = {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}
+        options = {
+            'pool_size': 1,
+            'max_overflow': 0,
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': connect_args,
+        }
+        read_options = {
+            'url': read_url or config['SQLALCHEMY_DATABASE_URI'],
+            'pool_size': config['DB_READ_POOL_SIZE'],
+            'max_overflow': 0,
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': connect_args,
+        }
+    else:
+        options = {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        }
+        read_options = {**options, 'url': read_url, 'pool_size': config['DB_READ_POOL_SIZE']} if read_url else None
+
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    if read_options and config['SQLALCHEMY_READ_SPLIT']:
+        config['SQLALCHEMY_BINDS'] = {READ_BIND: read_options, **config.get('SQLALCHEMY_BINDS', {})}
+
+
+def _apply_sqlite_pragmas(pragmas, read_only, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read_only:
+            # Ошибочно направленная в пул чтения запись падает сразу, а не блокирует файл
+            cursor.execute('PRAGMA query_only = ON')
+    finally:
+        cursor.close()
+
+
+def init_database(app, db):
+    """
+    Подключает настройку соединений к уже созданным движкам приложения.
+    """
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                sa.event.listen(
+                    engine, 'connect',
+                    partial(_apply_sqlite_pragmas, app.config['SQLITE_PRAGMAS'], key == READ_BIND),
+                )
@@ -0,0 +1,297 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import CONTENT_MODELS, ExternalRatingCache
+from app.jobs import PRIORITY_LOW, enqueue_job, task
+from app.cache import invalidate_catalog
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ExternalRatingClient:
+    """
+    Асинхронный клиент внешнего сервиса рейтингов.
+
+    Одна aiohttp-сессия с пулом соединений на весь жизненный цикл клиента,
+    ограничение параллельных запросов, таймауты и повторы с экспоненциальной задержкой.
+    """
+
+    def __init__(self, base_url, concurrency=10, timeout=5, retries=3, backoff=0.5):
+        # aiohttp нужен только при обращении к сервису — процессы сервера не платят за его импорт при старте
+        import aiohttp
+
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['EXTERNAL_RATING_URL'],
+            concurrency=config['EXTERNAL_RATING_CONCURRENCY'],
+            timeout=config['EXTERNAL_RATING_TIMEOUT'],
+            retries=config['EXTERNAL_RATING_RETRIES'],
+            backoff=config['EXTERNAL_RATING_BACKOFF'],
+        )
+
+    async def close(self):
+        await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def fetch(self, title):
+        """
+        Запрашивает рейтинг одного названия.
+
+        :return: Рейтинг (0, если сервис его не знает — ответ 404) или None, если сервис
+                 недоступен или отклонил запрос; None не кэшируется
+        """
+        import aiohttp
+
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self._session.get(self.base_url, params={'title': title}) as response:
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                            return float(data.get('rating', 0) or 0)
+                        if response.status == 404:
+                            return 0.0
+                        if response.status not in RETRY_STATUSES:
+                            # Ошибка запроса или доступа (400, 401, 403): повтор не поможет,
+                            # а рейтинг 0 затёр бы уже известный
+                            logger.error("External rating request for %r rejected: HTTP %d", title, response.status)
+                            return None
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    logger.warning("External rating request for %r failed: %r", title, e)
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+        return None
+
+    async def fetch_many(self, titles):
+        """
+        :return: Словарь {название: рейтинг или None}
+        """
+        titles = list(titles)
+        ratings = await asyncio.gather(*(self.fetch(title) for title in titles))
+        return dict(zip(titles, ratings))
+
+
+class ExternalRatingService:
+    """
+    Долгоживущий клиент для одиночных запросов (задачи, get_external_rating).
+
+    Петля событий работает в фоновом потоке процесса, на ней живёт один
+    ExternalRatingClient, поэтому соединения с сервисом переиспользуются между
+    запросами (keep-alive), а не открываются заново на каждое название.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # Поток запускается при первом запросе; после fork его в дочернем процессе нет
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='external-ratings', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+                self._client = self._call(self._create_client())
+            return self._client
+
+    async def _create_client(self):
+        # aiohttp-сессия создаётся внутри петли, в которой будет работать
+        return ExternalRatingClient.from_config(self.app.config)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def fetch(self, title):
+        """
+        :return: То же, что ExternalRatingClient.fetch
+        """
+        client = self._ensure_started()
+        return self._call(client.fetch(title))
+
+    def stop(self, timeout=5):
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                return
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop.close()
+            self._pid = self._thread = self._loop = self._client = None
+
+
+def _cached_ratings(titles, ttl):
+    fresh_after = datetime.utcnow() - timedelta(seconds=ttl)
+    return dict(
+        db.session.query(ExternalRatingCache.title, ExternalRatingCache.rating)
+        .filter(ExternalRatingCache.title.in_(titles), ExternalRatingCache.fetched_at >= fresh_after)
+    )
+
+
+def _store_ratings(ratings):
+    """
+    Сохраняет успешно полученные рейтинги в кэш (upsert по названию).
+    """
+    now = datetime.utcnow()
+    rows = [
+        {'title': title, 'rating': rating, 'fetched_at': now}
+        for title, rating in ratings.items() if rating is not None
+    ]
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(ExternalRatingCache)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ExternalRatingCache.title],
+                set_={'rating': stmt.excluded.rating, 'fetched_at': stmt.excluded.fetched_at},
+            ),
+            rows,
+        )
+    else:
+        db.session.query(ExternalRatingCache).filter(
+            ExternalRatingCache.title.in_([row['title'] for row in rows])
+        ).delete(synchronize_session=False)
+        db.session.execute(db.insert(ExternalRatingCache), rows)
+
+
+def get_external_rating(title):
+    """
+    Возвращает внешний рейтинг названия, обращаясь к сервису только при промахе кэша.
+
+    :param title: Название фильма или сериала
+    :return: Рейтинг или 0, если сервис недоступен
+    """
+    rating = _fetch_rating(title)
+    return rating if rating is not None else 0
+
+
+def _fetch_rating(title):
+    """
+    :return: Рейтинг из кэша или сервиса; None, если сервис недоступен
+    """
+    config = current_app.config
+    cached = _cached_ratings([title], config['EXTERNAL_RATING_CACHE_TTL'])
+    if title in cached:
+        return cached[title]
+
+    rating = current_app.extensions['external_ratings'].fetch(title)
+    _store_ratings({title: rating})
+    db.session.commit()
+    return rating
+
+
+@task('external_ratings.fetch', priority=PRIORITY_LOW)
+def fetch_content_rating(content_type, content_id):
+    """
+    Заполняет external_rating добавленного фильма или сериала, не дожидаясь
+    `flask ratings refresh-external`.
+    """
+    content = db.session.get(CONTENT_MODELS[content_type], content_id)
+    if content is None:
+        return None
+    rating = _fetch_rating(content.title)
+    if rating is None:
+        # Сервис недоступен — задача повторится с задержкой
+        raise RuntimeError("External rating service is unavailable")
+    content.external_rating = rating
+    db.session.commit()
+    invalidate_catalog()
+    return {'external_rating': rating}
+
+
+def enqueue_rating_fetch(content_type, content_id, user_id=None):
+    return enqueue_job(
+        'external_ratings.fetch', {'content_type': content_type, 'content_id': content_id},
+        idempotency_key=f'external-rating:{content_type}:{content_id}', user_id=user_id,
+    )
+
+
+async def _refresh(config, batch_size, force):
+    updated = 0
+    ttl = 0 if force else config['EXTERNAL_RATING_CACHE_TTL']
+    async with ExternalRatingClient.from_config(config) as client:
+        for model in CONTENT_MODELS.values():
+            last_id = 0
+            while True:
+                batch = db.session.execute(
+                    db.select(model.id, model.title)
+                    .where(model.id > last_id)
+                    .order_by(model.id)
+                    .limit(batch_size)
+                ).all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                titles = {row.title for row in batch}
+                ratings = _cached_ratings(titles, ttl) if ttl else {}
+                missing = titles - ratings.keys()
+                if missing:
+                    fetched = await client.fetch_many(missing)
+                    _store_ratings(fetched)
+                    ratings.update({title: rating for title, rating in fetched.items() if rating is not None})
+
+                rows = [
+                    {'id': row.id, 'external_rating': ratings[row.title]}
+                    for row in batch if row.title in ratings
+                ]
+                if rows:
+                    db.session.execute(db.update(model), rows)
+                db.session.commit()
+                updated += len(rows)
+    return updated
+
+
+def refresh_external_ratings(batch_size=500, force=False):
+    """
+    Обновляет Movie.external_rating/Show.external_rating для всего каталога.
+
+    Каталог читается пачками по id, рейтинги каждой пачки запрашиваются
+    параллельно, а запись в БД идёт одним пакетным UPDATE на пачку.
+
+    :param batch_size: Количество записей в пачке
+    :param force: Игнорировать кэш и запросить все рейтинги заново
+    :return: Количество обновлённых записей
+    """
+    return asyncio.run(_refresh(current_app.config, batch_size, force))
+
+
+def init_external_ratings(app):
+    app.extensions['external_ratings'] = ExternalRatingService(app)
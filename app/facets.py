@@ -0,0 +1,191 @@
+from flask import current_app
+
+from app.cache import catalog_version, get_cache
+from app.extensions import db
+from app.genres import genre_filter, parse_genres
+from app.models import CONTENT_MODELS, Genre
+from app.pagination import after_cursor, keyset_page
+
+
+# Нижние границы корзин рейтинга; последняя включает 10
+RATING_BUCKETS = (8, 6, 4, 2, 0)
+RATING_BUCKET_WIDTH = 2
+
+FACET_FILTERS = {
+    'genre': str,
+    'min_year': int,
+    'max_year': int,
+    'min_rating': float,
+    'max_rating': float,
+}
+
+
+def parse_facet_filters(args):
+    """
+    Фильтры расширенного поиска из параметров запроса; пустые и некорректные значения отбрасываются.
+
+    Параметр year (точный год) оставлен для старых ссылок и задаёт оба конца диапазона.
+
+    :param args: request.args
+    :return: Словарь с ключами из FACET_FILTERS
+    """
+    filters = {}
+    for name, value_type in FACET_FILTERS.items():
+        value = args.get(name, type=value_type)
+        if value not in (None, ''):
+            filters[name] = value
+    year = args.get('year', type=int)
+    if year is not None:
+        filters.setdefault('min_year', year)
+        filters.setdefault('max_year', year)
+    if 'genre' in filters:
+        # Ключ кэша не должен зависеть от регистра и пробелов
+        names = parse_genres(filters.pop('genre'))
+        if names:
+            filters['genre'] = names[0]
+    return filters
+
+
+def _conditions(model, filters, exclude=None):
+    """
+    SQL-условия фильтров. exclude — фасет, собственный фильтр которого не применяется
+    к его счётчикам, чтобы были видны и соседние значения.
+    """
+    conditions = []
+    if 'genre' in filters and exclude != 'genre':
+        conditions.append(genre_filter(model, filters['genre']))
+    if exclude != 'decade':
+        if 'min_year' in filters:
+            conditions.append(model.year >= filters['min_year'])
+        if 'max_year' in filters:
+            conditions.append(model.year <= filters['max_year'])
+    if exclude != 'rating':
+        # Гибридное выражение average_rating совпадает с индексом ix_<модель>_average_rating
+        if 'min_rating' in filters:
+            conditions.append(model.average_rating >= filters['min_rating'])
+        if 'max_rating' in filters:
+            conditions.append(model.average_rating <= filters['max_rating'])
+    return conditions
+
+
+def _inline(value):
+    # Константы выражений группировки подставляются литералами: иначе PostgreSQL
+    # не сопоставит выражение в SELECT с выражением в GROUP BY
+    return db.literal(value, literal_execute=True)
+
+
+def _rating_bucket(model):
+    return db.case(
+        *((model.average_rating >= _inline(bucket), _inline(bucket)) for bucket in RATING_BUCKETS[:-1]),
+        else_=_inline(RATING_BUCKETS[-1]),
+    )
+
+
+def _decade(model):
+    return model.year // _inline(10) * _inline(10)
+
+
+def _count_facets(model, filters):
+    link = model.genres.property.secondary
+    content_id = link.c[f'{model.__tablename__}_id']
+    genres = db.session.execute(
+        db.select(Genre.name, db.func.count())
+        .select_from(link)
+        .join(Genre, Genre.id == link.c.genre_id)
+        .join(model, model.id == content_id)
+        .where(*_conditions(model, filters, exclude='genre'))
+        .group_by(Genre.name)
+        .order_by(db.func.count().desc(), Genre.name)
+    ).all()
+
+    decade = _decade(model)
+    decades = db.session.execute(
+        db.select(decade, db.func.count())
+        .where(model.year.isnot(None), *_conditions(model, filters, exclude='decade'))
+        .group_by(decade)
+        .order_by(decade.desc())
+    ).all()
+
+    bucket = _rating_bucket(model)
+    ratings = db.session.execute(
+        db.select(bucket, db.func.count())
+        .where(*_conditions(model, filters, exclude='rating'))
+        .group_by(bucket)
+        .order_by(bucket.desc())
+    ).all()
+
+    total = db.session.scalar(db.select(db.func.count()).select_from(model).where(*_conditions(model, filters)))
+
+    top = RATING_BUCKETS[0] + RATING_BUCKET_WIDTH
+    return total, {
+        'genre': [{'value': name, 'count': count} for name, count in genres],
+        'decade': [
+            {'value': value, 'min_year': value, 'max_year': value + 9, 'count': count}
+            for value, count in decades
+        ],
+        # Рейтинг округлён до десятых, поэтому корзина [6, 8) — это 6.0–7.9
+        'rating': [
+            {
+                'value': f'{value}-{min(value + RATING_BUCKET_WIDTH, top)}',
+                'min_rating': value,
+                'max_rating': top if value == RATING_BUCKETS[0] else value + RATING_BUCKET_WIDTH - 0.1,
+                'count': count,
+            }
+            for value, count in ratings
+        ],
+    }
+
+
+def facet_counts(content_type, filters):
+    """
+    Количество результатов по жанрам, десятилетиям и корзинам рейтинга.
+
+    Каждый фасет считается одним GROUP BY; результат кэшируется до следующего
+    изменения каталога (ключ включает catalog_version).
+
+    :return: (всего результатов, {'genre': [...], 'decade': [...], 'rating': [...]})
+    """
+    cache = get_cache()
+    key = ('facets', catalog_version(), content_type, tuple(sorted(filters.items())))
+    cached = cache.get(key)
+    if cached is None:
+        cached = _count_facets(CONTENT_MODELS[content_type], filters)
+        cache.set(key, cached, ttl=current_app.config['FACETS_CACHE_TTL'])
+    return cached
+
+
+def facet_results_select(model, filters, cursor=None, limit=20):
+    """
+    SELECT страницы результатов расширенного поиска по убыванию (average_rating, id)
+    после курсора — keyset-пагинация, как у каталога (app/pagination.py).
+
+    В результат добавляется колонка sort_key для построения следующего курсора.
+
+    :raises ValueError: Если курсор повреждён
+    """
+    key = model.average_rating
+    stmt = (
+        db.select(model, key.label('sort_key'))
+        .where(*_conditions(model, filters))
+        .order_by(key.desc(), model.id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        stmt = stmt.where(*after_cursor(key, model.id, cursor))
+    return stmt
+
+
+def faceted_search(content_type, filters, cursor=None, per_page=20):
+    """
+    Расширенный поиск по жанру, диапазонам лет и рейтинга с подсчётом фасетов.
+
+    :param content_type: 'movie' или 'show'
+    :param filters: Результат parse_facet_filters
+    :param cursor: Курсор предыдущей страницы или None
+    :return: (список Movie/Show, курсор следующей страницы или None, всего результатов, фасеты)
+    :raises ValueError: Если курсор повреждён
+    """
+    model = CONTENT_MODELS[content_type]
+    items, next_cursor = keyset_page(facet_results_select(model, filters, cursor, per_page + 1), per_page)
+    total, facets = facet_counts(content_type, filters)
+    return items, next_cursor, total, facets
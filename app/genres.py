@@ -0,0 +1,108 @@
+import re
+
+from app.extensions import db
+from app.models import CONTENT_MODELS, Genre, Movie, Show
+
+
+_SEPARATORS = re.compile(r'[,;/|]')
+
+
+def parse_genres(value):
+    """
+    Разбивает строку жанров ("Drama, Comedy") на нормализованные имена.
+
+    :return: Список уникальных имён в нижнем регистре в исходном порядке
+    """
+    names = []
+    for part in _SEPARATORS.split(value or ''):
+        name = ' '.join(part.split()).lower()[:100]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def genre_filter(model, genre):
+    """
+    Условие "контент относится к жанру" через таблицу связей.
+
+    Поиск идёт по индексу (genre_id, content_id), а не сканированием ilike по строке жанра.
+    """
+    names = parse_genres(genre)
+    if not names:
+        return db.true()
+    link = model.genres.property.secondary
+    content_id = link.c[f'{model.__tablename__}_id']
+    return model.id.in_(
+        db.select(content_id)
+        .join(Genre, Genre.id == link.c.genre_id)
+        .where(Genre.name == names[0])
+    )
+
+
+def _resolve_genres(session, names):
+    with session.no_autoflush:
+        existing = {
+            genre.name: genre
+            for genre in session.query(Genre).filter(Genre.name.in_(names))
+        } if names else {}
+    for name in names:
+        if name not in existing:
+            existing[name] = Genre(name=name)
+            session.add(existing[name])
+    return existing
+
+
+@db.event.listens_for(db.session, 'before_flush')
+def _sync_genres(session, flush_context, instances):
+    # Связи пересчитываются перед записью для всего нового/изменённого контента сразу,
+    # чтобы один и тот же новый жанр не создавался дважды в одной транзакции
+    changed = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, (Movie, Show))
+        and (obj in session.new or db.inspect(obj).attrs.genre.history.has_changes())
+    ]
+    if not changed:
+        return
+    parsed = {obj: parse_genres(obj.genre) for obj in changed}
+    genres = _resolve_genres(session, {name for names in parsed.values() for name in names})
+    for obj, names in parsed.items():
+        obj.genres = [genres[name] for name in names]
+
+
+def rebuild_genre_links(batch_size=1000):
+    """
+    Заполняет таблицу genre и связи movie_genre/show_genre по строковым колонкам genre.
+    Используется миграцией и после массовых вставок в обход ORM.
+
+    :return: Количество обработанных записей контента
+    """
+    processed = 0
+    for model in CONTENT_MODELS.values():
+        link = model.genres.property.secondary
+        content_column = f'{model.__tablename__}_id'
+        last_id = 0
+        while True:
+            batch = db.session.execute(
+                db.select(model.id, model.genre)
+                .where(model.id > last_id)
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            parsed = {row.id: parse_genres(row.genre) for row in batch}
+            genres = _resolve_genres(db.session, {name for names in parsed.values() for name in names})
+            db.session.flush()
+            ids = list(parsed)
+            db.session.execute(db.delete(link).where(link.c[content_column].in_(ids)))
+            rows = [
+                {content_column: content_id, 'genre_id': genres[name].id}
+                for content_id, names in parsed.items() for name in names
+            ]
+            if rows:
+                db.session.execute(db.insert(link), rows)
+            db.session.commit()
+            processed += len(batch)
+    return processed
@@ -0,0 +1,77 @@
+from flask import current_app, has_app_context
+from sqlalchemy.orm import make_transient_to_detached, object_session
+
+from app.cache import get_cache
+from app.extensions import db
+from app.models import User
+
+
+INVALIDATE_KEY = 'identity_cache_invalidate'
+
+
+def _cache_key(user_id):
+    return ('user', user_id)
+
+
+def _column_values(user):
+    # В общем кэше (файлы, Redis) лежат только значения колонок, а не ORM-объект
+    return {column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs}
+
+
+def _detached_user(values):
+    # Объект не принадлежит ни одной сессии и никогда не меняется запросами
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+def load_user(user_id):
+    """
+    Пользователь для Flask-Login без запроса к базе, пока он есть в кэше.
+
+    Строка пользователя хранится в общем кэше приложения (CACHE_BACKEND), поэтому
+    изменение пользователя в одном процессе сбрасывает её для всех воркеров.
+    Из кэша собирается отсоединённый объект и присоединяется к текущей сессии через
+    merge(load=False): получается обычный объект User — связи подгружаются лениво,
+    изменения сохраняются при commit.
+
+    :param user_id: Идентификатор из сессии
+    :return: User или None
+    """
+    ttl = current_app.config['IDENTITY_CACHE_TTL']
+    if not ttl:
+        return db.session.get(User, user_id)
+    cache = get_cache()
+    values = cache.get(_cache_key(user_id))
+    if values is not None:
+        return db.session.merge(_detached_user(values), load=False)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache.set(_cache_key(user_id), _column_values(user), ttl=ttl)
+    return user
+
+
+def invalidate_user(user_id):
+    if current_app.config['IDENTITY_CACHE_TTL']:
+        get_cache().delete(_cache_key(user_id))
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Сбрасываем после фиксации транзакции, иначе параллельный запрос
+    # может успеть положить в кэш ещё старую строку
+    object_session(target).info.setdefault(INVALIDATE_KEY, set()).add(target.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    user_ids = session.info.pop(INVALIDATE_KEY, ())
+    if user_ids and has_app_context():
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop(INVALIDATE_KEY, None)
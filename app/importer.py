@@ -0,0 +1,329 @@
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+
+from werkzeug.datastructures import MultiDict
+
+from app.extensions import db
+from app.forms import MovieForm
+from app.models import User, Movie, Show, Season, Episode
+from app.ratings import rebuild_rating_aggregates, upsert_ratings
+from app.genres import rebuild_genre_links
+from app.search import rebuild_search_index
+from app.cache import invalidate_catalog
+
+
+class RowError(ValueError):
+    """
+    Строка файла не прошла проверку и пропущена.
+    """
+
+
+def read_rows(path, file_format=None):
+    """
+    Построчно читает CSV с заголовком или JSONL, не загружая файл в память.
+
+    :param file_format: 'csv' или 'jsonl'; по умолчанию по расширению файла
+    :return: Итератор (номер строки, dict)
+    """
+    file_format = file_format or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv')
+    with open(path, encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, RowError(f"invalid JSON: {e.msg}")
+                    continue
+                yield line_number, row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+def _value(row, key):
+    value = row.get(key)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in (None, '') else value
+
+
+def _int(row, key, required=True):
+    value = _value(row, key)
+    if value is None:
+        if required:
+            raise RowError(f"{key} is required")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{key} must be an integer")
+
+
+def _validate_content(row):
+    """
+    Поля каталога проверяются теми же правилами, что и MovieForm в add_content.
+    """
+    form = MovieForm(
+        formdata=MultiDict({
+            key: str(row[key]) for key in ('title', 'description', 'genre', 'year')
+            if _value(row, key) is not None
+        }),
+        meta={'csrf': False},
+    )
+    if not form.validate():
+        raise RowError('; '.join(f"{field}: {', '.join(errors)}" for field, errors in form.errors.items()))
+    values = {
+        'title': form.title.data.strip(),
+        'description': form.description.data,
+        'genre': form.genre.data.strip(),
+        'year': form.year.data,
+        'thumbnail_url': _value(row, 'thumbnail_url') or '',
+    }
+    external_rating = _value(row, 'external_rating')
+    if external_rating is not None:
+        try:
+            values['external_rating'] = float(external_rating)
+        except (TypeError, ValueError):
+            raise RowError("external_rating must be a number")
+    return values
+
+
+class _Importer(ABC):
+    """
+    Общий цикл импорта: проверка строк, запись пачками по batch_size строк
+    в отдельных транзакциях и пересчёт производных данных в конце.
+    """
+    kind = None  # имя команды `flask import <kind>` и ключ в IMPORTERS
+
+    def __init__(self, batch_size=5000, dry_run=False, max_errors=100, on_error=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.on_error = on_error
+        self.read = 0
+        self.imported = 0
+        self.errors = 0
+
+    @abstractmethod
+    def prepare(self, row):
+        """
+        :return: Значения для вставки
+        :raises RowError: Если строка некорректна
+        """
+
+    @abstractmethod
+    def write(self, rows):
+        """
+        Вставляет пачку подготовленных значений; транзакцию фиксирует run.
+        """
+
+    def finish(self):
+        """
+        Пересчитывает то, что при обычном сохранении делают обработчики событий ORM.
+        """
+
+    def run(self, rows):
+        batch = []
+        try:
+            for line_number, row in rows:
+                self.read += 1
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    batch.append(self.prepare(row))
+                except RowError as e:
+                    self.errors += 1
+                    if self.on_error:
+                        self.on_error(line_number, str(e))
+                    if self.max_errors and self.errors >= self.max_errors:
+                        raise RowError(f"too many invalid rows ({self.errors}), import aborted at line {line_number}")
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            if batch:
+                self._flush(batch)
+        finally:
+            # Уже зафиксированные пачки остаются в базе и при прерванном импорте,
+            # поэтому производные данные пересчитываются в любом случае
+            if self.imported and not self.dry_run:
+                db.session.rollback()
+                self.finish()
+        return self
+
+    def _flush(self, batch):
+        if not self.dry_run:
+            self.write(batch)
+            db.session.commit()
+        self.imported += len(batch)
+
+
+class MovieImporter(_Importer):
+    """
+    Колонки: title, description, genre, year, video_url, thumbnail_url, external_rating.
+    """
+    kind = 'movies'
+
+    def prepare(self, row):
+        values = _validate_content(row)
+        values['video_url'] = _value(row, 'video_url')
+        if values['video_url'] is None:
+            raise RowError("video_url is required")
+        return values
+
+    def write(self, rows):
+        db.session.execute(db.insert(Movie), rows)
+
+    def finish(self):
+        rebuild_genre_links()
+        rebuild_search_index()
+        invalidate_catalog()
+
+
+class ShowImporter(_Importer):
+    """
+    Колонки: title, description, genre, year, thumbnail_url, external_rating.
+    """
+    kind = 'shows'
+
+    def prepare(self, row):
+        return _validate_content(row)
+
+    def write(self, rows):
+        db.session.execute(db.insert(Show), rows)
+
+    def finish(self):
+        rebuild_genre_links()
+        rebuild_search_index()
+        invalidate_catalog()
+
+
+class EpisodeImporter(_Importer):
+    """
+    Колонки: show_id или show_title, season_number, episode_number, title, video_url.
+    Недостающие сезоны создаются.
+    """
+    kind = 'episodes'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._show_ids = set(db.session.scalars(db.select(Show.id)))
+        self._show_ids_by_title = None
+        self._seasons = {
+            (row.show_id, row.season_number): row.id
+            for row in db.session.execute(db.select(Season.show_id, Season.season_number, Season.id))
+        }
+
+    def _show_id(self, row):
+        show_id = _int(row, 'show_id', required=False)
+        if show_id is None:
+            title = _value(row, 'show_title')
+            if title is None:
+                raise RowError("show_id or show_title is required")
+            if self._show_ids_by_title is None:
+                self._show_ids_by_title = {}
+                for show_id, show_title in db.session.execute(db.select(Show.id, Show.title).order_by(Show.id)):
+                    # При одинаковых названиях берём первый сериал
+                    self._show_ids_by_title.setdefault(show_title.lower(), show_id)
+            show_id = self._show_ids_by_title.get(title.lower())
+            if show_id is None:
+                raise RowError(f"show {title!r} not found")
+        elif show_id not in self._show_ids:
+            raise RowError(f"show {show_id} not found")
+        return show_id
+
+    def prepare(self, row):
+        title = _value(row, 'title')
+        video_url = _value(row, 'video_url')
+        if title is None or video_url is None:
+            raise RowError("title and video_url are required")
+        return {
+            'show_id': self._show_id(row),
+            'season_number': _int(row, 'season_number'),
+            'episode_number': _int(row, 'episode_number'),
+            'title': title,
+            'video_url': video_url,
+        }
+
+    def write(self, rows):
+        missing = {(row['show_id'], row['season_number']) for row in rows} - self._seasons.keys()
+        if missing:
+            db.session.execute(
+                db.insert(Season),
+                [{'show_id': show_id, 'season_number': number} for show_id, number in sorted(missing)],
+            )
+            for row in db.session.execute(
+                db.select(Season.show_id, Season.season_number, Season.id)
+                .where(Season.show_id.in_({show_id for show_id, _ in missing}))
+            ):
+                self._seasons[row.show_id, row.season_number] = row.id
+        db.session.execute(db.insert(Episode), [
+            {
+                'season_id': self._seasons[row['show_id'], row['season_number']],
+                'episode_number': row['episode_number'],
+                'title': row['title'],
+                'video_url': row['video_url'],
+            }
+            for row in rows
+        ])
+
+
+class RatingImporter(_Importer):
+    """
+    Колонки: user_id, movie_id или show_id, rating (1–10, как в rate_content).
+    Повторная оценка того же контента пользователем заменяет предыдущую.
+    """
+    kind = 'ratings'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Множества id ограничены размером каталога, а не импортируемого файла
+        self._user_ids = set(db.session.scalars(db.select(User.id)))
+        self._content_ids = {
+            'movie': set(db.session.scalars(db.select(Movie.id))),
+            'show': set(db.session.scalars(db.select(Show.id))),
+        }
+
+    def prepare(self, row):
+        user_id = _int(row, 'user_id')
+        if user_id not in self._user_ids:
+            raise RowError(f"user {user_id} not found")
+        movie_id = _int(row, 'movie_id', required=False)
+        show_id = _int(row, 'show_id', required=False)
+        if (movie_id is None) == (show_id is None):
+            raise RowError("exactly one of movie_id and show_id is required")
+        content_type, content_id = ('movie', movie_id) if movie_id is not None else ('show', show_id)
+        if content_id not in self._content_ids[content_type]:
+            raise RowError(f"{content_type} {content_id} not found")
+        rating = _int(row, 'rating')
+        if not 1 <= rating <= 10:
+            raise RowError("rating must be between 1 and 10")
+        return content_type, {'user_id': user_id, f'{content_type}_id': content_id, 'rating': rating}
+
+    def write(self, rows):
+        for content_type in ('movie', 'show'):
+            upsert_ratings(content_type, [values for kind, values in rows if kind == content_type])
+
+    def finish(self):
+        rebuild_rating_aggregates()
+        invalidate_catalog()
+
+
+IMPORTERS = {importer.kind: importer for importer in (MovieImporter, ShowImporter, EpisodeImporter, RatingImporter)}
+
+
+def import_file(kind, path, file_format=None, **options):
+    """
+    Импортирует файл каталога или оценок.
+
+    :param kind: Ключ из IMPORTERS
+    :param options: batch_size, dry_run, max_errors, on_error(номер строки, сообщение)
+    :return: Импортёр со счётчиками read, imported, errors
+    :raises RowError: Если превышено max_errors
+    """
+    return IMPORTERS[kind](**options).run(read_rows(path, file_format))
@@ -0,0 +1,391 @@
+import atexit
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+
+class PermanentJobError(Exception):
+    """
+    Задача не может быть выполнена в принципе — повторять её бессмысленно.
+    """
+
+
+class Task:
+    """
+    Зарегистрированная фоновая задача; аргументы — JSON-совместимый словарь payload.
+    """
+
+    def __init__(self, name, fn, priority=PRIORITY_NORMAL, max_attempts=None):
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+
+TASKS = {}
+
+
+def task(name, priority=PRIORITY_NORMAL, max_attempts=None):
+    """
+    Регистрирует функцию как фоновую задачу под именем name.
+
+    :param max_attempts: По умолчанию JOBS_MAX_ATTEMPTS
+    """
+    def decorator(fn):
+        TASKS[name] = Task(name, fn, priority, max_attempts)
+        return fn
+    return decorator
+
+
+def enqueue_job(name, payload=None, priority=None, idempotency_key=None, user_id=None, delay=0):
+    """
+    Ставит задачу в очередь; выполнит её фоновый поток, `flask jobs worker` или worker.py.
+
+    Фиксирует текущую транзакцию: задача сохраняется вместе с изменениями, ради которых поставлена.
+
+    :param payload: Аргументы функции задачи
+    :param priority: Больше — раньше; по умолчанию приоритет задачи
+    :param idempotency_key: Повторный вызов с тем же ключом вернёт уже созданную задачу
+    :param user_id: Владелец — только он видит статус задачи в /jobs/<id>
+    :param delay: Секунд до первой попытки
+    :return: Job
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown job {name!r}")
+    if idempotency_key is not None:
+        existing = db.session.scalar(db.select(Job).filter_by(idempotency_key=idempotency_key))
+        if existing is not None:
+            return existing
+
+    job = Job(
+        name=name,
+        payload=payload or {},
+        priority=TASKS[name].priority if priority is None else priority,
+        idempotency_key=idempotency_key,
+        user_id=user_id,
+        next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Ту же задачу одновременно поставил другой запрос
+        db.session.rollback()
+        if idempotency_key is None:
+            raise
+        return db.session.scalar(db.select(Job).filter_by(idempotency_key=idempotency_key))
+
+    if current_app.config['JOBS_BACKGROUND']:
+        current_app.extensions['jobs'].wake()
+    return job
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.last_error if job.status == 'failed' else None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def run_task(name, payload):
+    return TASKS[name].fn(**payload)
+
+
+_process_app = None
+
+
+def _init_process(config):
+    # Процесс пула создаёт своё приложение: задачам нужны конфигурация и соединение с базой
+    global _process_app
+    from app import create_app
+    _process_app = create_app(config)
+
+
+def _run_in_process(name, payload):
+    with _process_app.app_context():
+        return run_task(name, payload)
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+
+class JobWorker:
+    """
+    Выполнение задач из таблицы job в пуле потоков или процессов (JOBS_POOL).
+
+    Задачи забираются пачками по числу свободных мест в пуле, по убыванию
+    приоритета, с пометкой claim_token, поэтому несколько исполнителей не выполнят
+    одну задачу дважды; упавшие задачи повторяются с экспоненциальной задержкой до max_attempts.
+    Так выполняются и письма (app/outbox.py), и упаковка видео (app/packaging.py).
+
+    Пока задача выполняется, исполнитель раз в JOBS_HEARTBEAT_INTERVAL обновляет её
+    claimed_at, поэтому по JOBS_CLAIM_TIMEOUT забираются только задачи упавших исполнителей,
+    а не просто долгие.
+    """
+
+    def __init__(self, app, concurrency=None, pool=None):
+        self.app = app
+        config = app.config
+        self.concurrency = concurrency or config['JOBS_CONCURRENCY']
+        self.pool = pool or config['JOBS_POOL']
+        self.max_attempts = config['JOBS_MAX_ATTEMPTS']
+        self.retry_delay = config['JOBS_RETRY_DELAY']
+        self.max_retry_delay = config['JOBS_MAX_RETRY_DELAY']
+        self.poll_interval = config['JOBS_POLL_INTERVAL']
+        self.claim_timeout = config['JOBS_CLAIM_TIMEOUT']
+        self.heartbeat_interval = config['JOBS_HEARTBEAT_INTERVAL']
+        self._heartbeat_at = time.monotonic()
+        self._executor = None
+        self._running = {}  # Future -> (id задачи, claim_token)
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    # Фоновый поток в процессе сервера
+
+    def wake(self):
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _ensure_started(self):
+        # Как и у очереди писем, поток запускается при первой задаче, а не до fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self.serve, name='jobs', daemon=True)
+                self._thread.start()
+
+    def serve(self):
+        """
+        Выполняет задачи, пока не вызван stop; используется фоновым потоком и worker.py.
+        """
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception:
+                logger.exception("Job worker iteration failed")
+            self._wakeup.wait(self.poll_interval)
+        self._shutdown_executor()
+
+    def stop(self, timeout=10):
+        """
+        Новые задачи больше не забираются; уже запущенные дорабатывают.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    # Выполнение
+
+    def drain(self):
+        """
+        Выполняет задачи, пока в очереди есть готовые к запуску.
+
+        :return: (выполнено, отложено или провалено)
+        """
+        succeeded = failed = 0
+        while True:
+            if not self._stopping:
+                self._submit_claimed()
+            if not self._running:
+                break
+            # Периодически просыпаемся, чтобы занять освободившиеся места новыми задачами
+            done, _ = wait(list(self._running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                if self._finish(future):
+                    succeeded += 1
+                else:
+                    failed += 1
+            self._heartbeat()
+        return succeeded, failed
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        if not self._running or now - self._heartbeat_at < self.heartbeat_interval:
+            return
+        self._heartbeat_at = now
+        db.session.execute(
+            db.update(Job)
+            .where(Job.claim_token.in_({token for _, token in self._running.values()}), Job.status == 'running')
+            .values(claimed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.pool == 'process':
+                config = {key: value for key, value in self.app.config.items() if key.isupper() and _picklable(value)}
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.concurrency,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process,
+                    initargs=(config,),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+        return self._executor
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _run_in_thread(self, name, payload):
+        with self.app.app_context():
+            return run_task(name, payload)
+
+    def _submit_claimed(self):
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return
+        for job in self._claim(free):
+            if job.name not in TASKS:
+                self._fail(job, job.claim_token, f"Unknown job {job.name!r}")
+                continue
+            if self.pool == 'process':
+                future = self._get_executor().submit(_run_in_process, job.name, job.payload)
+            else:
+                future = self._get_executor().submit(self._run_in_thread, job.name, job.payload)
+            self._running[future] = (job.id, job.claim_token)
+
+    def _claim(self, limit):
+        now = datetime.utcnow()
+        due = db.or_(
+            db.and_(Job.status == 'queued', Job.next_attempt_at <= now),
+            # Задачи исполнителя, упавшего посреди работы
+            db.and_(Job.status == 'running', Job.claimed_at < now - timedelta(seconds=self.claim_timeout)),
+        )
+        ids = db.session.scalars(
+            db.select(Job.id).where(due)
+            .order_by(Job.priority.desc(), Job.next_attempt_at, Job.id)
+            .limit(limit)
+        ).all()
+        if not ids:
+            db.session.commit()
+            return []
+        token = uuid.uuid4().hex
+        db.session.execute(
+            db.update(Job)
+            .where(Job.id.in_(ids), due)
+            .values(status='running', claim_token=token, claimed_at=now, started_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return db.session.scalars(
+            db.select(Job).where(Job.claim_token == token).order_by(Job.priority.desc(), Job.id)
+        ).all()
+
+    def _finish(self, future):
+        job_id, token = self._running.pop(future)
+        job = db.session.get(Job, job_id)
+        try:
+            result = future.result()
+        except PermanentJobError as e:
+            self._fail(job, token, str(e))
+            return False
+        except BrokenProcessPool as e:
+            # Процесс пула упал (например, по памяти) — пересоздаём пул, задачу повторяем
+            self._executor = None
+            self._retry(job, token, e)
+            return False
+        except Exception as e:
+            self._retry(job, token, e)
+            return False
+        return self._release(
+            job, token, status='succeeded', result=result, last_error=None, finished_at=datetime.utcnow()
+        )
+
+    def _release(self, job, token, **values):
+        """
+        Записывает итог попытки, только если задача всё ещё занята этим исполнителем:
+        задачу, забранную другим исполнителем по JOBS_CLAIM_TIMEOUT, не перезаписываем.
+
+        :return: Итог записан
+        """
+        released = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job.id, Job.claim_token == token)
+            .values(attempts=Job.attempts + 1, claim_token=None, **values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not released:
+            logger.warning("Job %d %s was claimed by another worker, outcome discarded", job.id, job.name)
+        return bool(released)
+
+    def _retry(self, job, token, error):
+        registered = TASKS.get(job.name)
+        max_attempts = (registered.max_attempts if registered else None) or self.max_attempts
+        attempts = job.attempts + 1
+        if attempts >= max_attempts:
+            self._fail(job, token, repr(error))
+            return
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        if self._release(
+            job, token, status='queued', last_error=repr(error),
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+        ):
+            logger.warning("Job %d %s failed, retrying in %.0fs: %r", job.id, job.name, delay, error)
+
+    def _fail(self, job, token, error):
+        attempts = job.attempts + 1
+        if self._release(job, token, status='failed', last_error=error, finished_at=datetime.utcnow()):
+            logger.error("Job %d %s failed after %d attempts: %s", job.id, job.name, attempts, error)
+
+
+def cleanup_jobs():
+    """
+    Удаляет завершённые задачи старше JOBS_RETENTION; их ключи идемпотентности освобождаются.
+
+    :return: Количество удалённых задач
+    """
+    finished_before = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_RETENTION'])
+    deleted = db.session.execute(
+        db.delete(Job).where(Job.status.in_(FINISHED_STATUSES), Job.finished_at < finished_before)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def init_jobs(app):
+    app.extensions['jobs'] = JobWorker(app)
@@ -0,0 +1,304 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy.sql import visitors
+
+from app.extensions import db
+from app.models import Movie, Show, Rating, Comment, Job
+from app.ratings import rebuild_rating_aggregates
+from app.genres import rebuild_genre_links
+from app.comments import rebuild_comment_counters
+from app.search import init_search_index
+
+
+logger = logging.getLogger(__name__)
+
+# Таблица версий хранится отдельно от метаданных моделей, чтобы create_all её не трогал
+schema_version = db.Table(
+    'schema_version',
+    db.MetaData(),
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(100), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+
+def _connection():
+    return db.session.connection()
+
+
+def _columns(table_name):
+    return {column['name'] for column in db.inspect(_connection()).get_columns(table_name)}
+
+
+def _add_missing_columns(model, names):
+    """
+    Добавляет в существующую таблицу колонки модели, которых в ней ещё нет.
+    """
+    table = model.__table__
+    existing = _columns(table.name)
+    preparer = _connection().dialect.identifier_preparer
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+              f"{column.type.compile(dialect=_connection().dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        db.session.execute(db.text(ddl))
+
+
+def _index_columns(index):
+    return {
+        element.name
+        for expression in index.expressions
+        for element in visitors.iterate(expression)
+        if isinstance(element, db.Column)
+    }
+
+
+def _create_missing_indexes():
+    """
+    Создаёт индексы из метаданных моделей, которых ещё нет в базе.
+
+    Индексы по колонкам, которые добавит более поздняя миграция, пропускаются —
+    их создаст та миграция.
+    """
+    connection = _connection()
+    if connection.dialect.name == 'sqlite':
+        # Инспектор SQLite не отражает индексы по выражениям, имена берём из sqlite_master
+        existing = set(db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    else:
+        inspector = db.inspect(connection)
+        existing = {
+            index['name']
+            for table_name in inspector.get_table_names()
+            for index in inspector.get_indexes(table_name)
+        }
+    inspector = db.inspect(connection)
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and _index_columns(index) <= columns:
+                logger.info("Creating index %s", index.name)
+                index.create(connection)
+
+
+def _initial():
+    # Новая база получает сразу актуальную схему; в старой создаются только недостающие таблицы
+    db.metadata.create_all(_connection(), checkfirst=True)
+
+
+def _content_rating_aggregates():
+    _add_missing_columns(Movie, ('rating_sum', 'rating_count'))
+    _add_missing_columns(Show, ('rating_sum', 'rating_count'))
+
+    if 'movie_id' not in _columns('rating'):
+        # В исходной схеме у rating не было movie_id, а show_id ссылался на movie
+        connection = _connection()
+        if connection.dialect.name == 'sqlite':
+            db.session.execute(db.text('ALTER TABLE rating RENAME TO _rating_old'))
+            # Без индексов: уникальные создаст миграция hot_path_indexes после удаления дублей
+            db.session.execute(db.schema.CreateTable(Rating.__table__))
+            db.session.execute(db.text(
+                'INSERT INTO rating (id, rating, user_id, show_id) '
+                'SELECT id, rating, user_id, show_id FROM _rating_old'
+            ))
+            db.session.execute(db.text('DROP TABLE _rating_old'))
+        else:
+            for foreign_key in db.inspect(connection).get_foreign_keys('rating'):
+                if foreign_key['constrained_columns'] == ['show_id'] and foreign_key['referred_table'] == 'movie':
+                    db.session.execute(db.text(f'ALTER TABLE rating DROP CONSTRAINT {foreign_key["name"]}'))
+            db.session.execute(db.text('ALTER TABLE rating ADD COLUMN movie_id INTEGER REFERENCES movie (id)'))
+            db.session.execute(db.text('ALTER TABLE rating ALTER COLUMN show_id DROP NOT NULL'))
+            db.session.execute(db.text('ALTER TABLE rating ADD FOREIGN KEY (show_id) REFERENCES show (id)'))
+    db.session.commit()
+    rebuild_rating_aggregates()
+
+
+def _hot_path_indexes():
+    # Перед уникальными индексами оставляем только последнюю оценку пользователя на контент
+    for column in (Rating.movie_id, Rating.show_id):
+        latest = (
+            db.select(db.func.max(Rating.id))
+            .where(column.isnot(None))
+            .group_by(Rating.user_id, column)
+        )
+        duplicates = db.session.execute(
+            db.delete(Rating).where(column.isnot(None), Rating.id.notin_(latest))
+        ).rowcount
+        if duplicates:
+            logger.warning("Removed %d duplicate ratings by %s", duplicates, column.name)
+            db.session.commit()
+            rebuild_rating_aggregates()
+    _create_missing_indexes()
+
+
+def _genres():
+    db.session.commit()
+    rebuild_genre_links()
+
+
+def _comment_counters():
+    _add_missing_columns(Movie, ('comment_count',))
+    _add_missing_columns(Show, ('comment_count',))
+    _add_missing_columns(Comment, ('likes_count',))
+    _initial()
+    _create_missing_indexes()
+    db.session.commit()
+    rebuild_comment_counters()
+
+
+def _password_hash_length():
+    # Хэши scrypt не помещаются в 128 символов; SQLite длину VARCHAR не проверяет
+    if _connection().dialect.name != 'sqlite':
+        db.session.execute(db.text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+
+
+def _mail_outbox():
+    _initial()
+
+
+def _thumbnail_hashes():
+    _add_missing_columns(Movie, ('thumbnail_hash',))
+    _add_missing_columns(Show, ('thumbnail_hash',))
+
+
+def _video_packages():
+    _initial()
+
+
+def _jobs():
+    _initial()
+
+
+def _facet_indexes():
+    _create_missing_indexes()
+
+
+def _queues_on_jobs():
+    # Письма и упаковка видео стали задачами таблицы job: незавершённые элементы прежних
+    # очередей ставятся задачами, таблица outbox_message и колонки очереди video_package удаляются
+    from app.jobs import PRIORITY_HIGH, PRIORITY_LOW
+
+    tables = set(db.inspect(_connection()).get_table_names())
+    jobs = []
+    if 'outbox_message' in tables:
+        rows = db.session.execute(db.text(
+            "SELECT subject, sender, recipients, body FROM outbox_message WHERE status IN ('pending', 'sending')"
+        )).all()
+        for subject, sender, recipients, body in rows:
+            # SQLite отдаёт JSON-колонку строкой
+            recipients = json.loads(recipients) if isinstance(recipients, str) else recipients
+            jobs.append({
+                'name': 'mail.send', 'priority': PRIORITY_HIGH,
+                'payload': {'subject': subject, 'recipients': recipients, 'body': body, 'sender': sender},
+            })
+        db.session.execute(db.text('DROP TABLE outbox_message'))
+
+    if 'video_package' in tables and 'next_attempt_at' in _columns('video_package'):
+        package_ids = db.session.scalars(db.text(
+            "SELECT id FROM video_package WHERE status IN ('pending', 'processing')"
+        )).all()
+        for package_id in package_ids:
+            token = uuid.uuid4().hex
+            db.session.execute(
+                db.text("UPDATE video_package SET status = 'pending', claim_token = :token WHERE id = :id"),
+                {'token': token, 'id': package_id},
+            )
+            jobs.append({
+                'name': 'packaging.package', 'priority': PRIORITY_LOW,
+                'payload': {'package_id': package_id, 'token': token},
+            })
+        db.session.execute(db.text('DROP INDEX IF EXISTS ix_video_package_status_next_attempt'))
+        for column in ('next_attempt_at', 'attempts', 'claimed_at'):
+            db.session.execute(db.text(f'ALTER TABLE video_package DROP COLUMN {column}'))
+
+    if jobs:
+        db.session.execute(db.insert(Job), jobs)
+        logger.info("Moved %d queued mails and video packages to jobs", len(jobs))
+
+
+def _average_rating_keyset():
+    # Расширенный поиск листается курсором по (average_rating, id): индекс пересоздаётся с id
+    for table_name in ('movie', 'show'):
+        db.session.execute(db.text(f'DROP INDEX IF EXISTS ix_{table_name}_average_rating'))
+    _create_missing_indexes()
+
+
+# (версия, имя, функция); функции идемпотентны, чтобы базы, созданные через
+# create_all до появления миграций, можно было довести до актуальной схемы
+MIGRATIONS = [
+    (1, 'initial', _initial),
+    (2, 'content_rating_aggregates', _content_rating_aggregates),
+    (3, 'hot_path_indexes', _hot_path_indexes),
+    (4, 'genres', _genres),
+    (5, 'comment_counters', _comment_counters),
+    (6, 'password_hash_length', _password_hash_length),
+    (7, 'mail_outbox', _mail_outbox),
+    (8, 'thumbnail_hashes', _thumbnail_hashes),
+    (9, 'video_packages', _video_packages),
+    (10, 'jobs', _jobs),
+    (11, 'facet_indexes', _facet_indexes),
+    (12, 'queues_on_jobs', _queues_on_jobs),
+    (13, 'average_rating_keyset', _average_rating_keyset),
+]
+
+
+def init_schema():
+    """
+    Доводит базу до актуальной схемы вместе с полнотекстовым индексом.
+
+    Вызывается командой `flask db upgrade` при деплое, а не каждым процессом
+    сервера при старте (см. AUTO_MIGRATE).
+
+    :return: Список применённых (версия, имя)
+    """
+    applied = upgrade_schema()
+    init_search_index()
+    return applied
+
+
+def pending_migrations():
+    """
+    :return: Миграции, которые ещё не применены к базе
+    """
+    version = current_version()
+    # Соединение записи не держим, см. upgrade_schema
+    db.session.commit()
+    return [(number, name) for number, name, _ in MIGRATIONS if number > version]
+
+
+def current_version():
+    schema_version.create(_connection(), checkfirst=True)
+    return db.session.execute(db.select(db.func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade_schema(target=None):
+    """
+    Применяет недостающие миграции по порядку; каждая отмечается в schema_version.
+
+    :param target: Версия, до которой обновить; по умолчанию последняя
+    :return: Список применённых (версия, имя)
+    """
+    applied = []
+    version = current_version()
+    for number, name, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        logger.info("Applying migration %d %s", number, name)
+        migrate()
+        db.session.execute(db.insert(schema_version).values(version=number, name=name, applied_at=datetime.utcnow()))
+        db.session.commit()
+        applied.append((number, name))
+    # Возвращаем соединение записи в пул: у SQLite оно одно, см. app/database.py
+    db.session.commit()
+    return applied
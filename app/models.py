@@ -1,6 +1,9 @@
 from app.extensions import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
+from app.passwords import hash_password, verify_password, password_needs_rehash
 from datetime import datetime
 
 
@@ -8,17 +11,114 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     watch_history = db.relationship("WatchHistory", backref="user", lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        return password_needs_rehash(self.password_hash)
 
-class Movie(db.Model):
+
+def _inline(value):
+    return db.literal(value, literal_execute=True)
+
+
+class _round(FunctionElement):
+    """
+    round(значение, знаков) для выражения average_rating.
+    """
+    type = db.Float()
+    name = 'round'
+    inherit_cache = True
+
+
+@compiles(_round)
+def _compile_round(element, compiler, **kw):
+    return f"round({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(_round, 'postgresql')
+def _compile_round_postgresql(element, compiler, **kw):
+    # В PostgreSQL нет round(double precision, integer) — округляется numeric
+    value, digits = element.clauses
+    return f"round(CAST({compiler.process(value, **kw)} AS NUMERIC), {compiler.process(digits, **kw)})"
+
+
+class RatedContentMixin:
+    """
+    Денормализованные агрегаты пользовательских оценок.
+
+    rating_sum/rating_count поддерживаются обработчиками событий Rating в той же
+    транзакции, поэтому average_rating читается без запроса к таблице rating
+    и может использоваться в фильтрах и сортировке SQL.
+    """
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @hybrid_property
+    def average_rating(self):
+        user_rating_avg = self.rating_sum / self.rating_count if self.rating_count else 0
+        return round((user_rating_avg + (self.external_rating or 0)) / 2, 1)
+
+    @average_rating.inplace.expression
+    @classmethod
+    def _average_rating_expression(cls):
+        # Константы подставляются в SQL литералами, чтобы выражение совпадало с индексом
+        user_rating_avg = db.case(
+            (cls.rating_count > _inline(0), db.cast(cls.rating_sum, db.Float) / cls.rating_count),
+            else_=_inline(0.0),
+        )
+        return _round(
+            (user_rating_avg + db.func.coalesce(cls.external_rating, _inline(0))) / _inline(2.0),
+            _inline(1),
+        )
+
+
+class CommentedContentMixin:
+    """
+    Денормализованное количество комментариев; поддерживается обработчиками событий Comment.
+    """
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class ThumbnailMixin:
+    """
+    Хэш исходного изображения обложки; варианты размеров лежат под этим хэшем,
+    см. app/thumbnails.py. Пока он пуст, шаблоны показывают thumbnail_url как есть.
+    """
+    thumbnail_hash = db.Column(db.String(64), nullable=True)
+
+
+class Genre(db.Model):
+    """
+    Нормализованный жанр (имя в нижнем регистре). Связи с контентом поддерживаются
+    по строке Movie.genre/Show.genre, см. app/genres.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+
+movie_genre = db.Table(
+    'movie_genre',
+    db.Column('movie_id', db.Integer, db.ForeignKey('movie.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_movie_genre_genre_movie', 'genre_id', 'movie_id'),
+)
+
+show_genre = db.Table(
+    'show_genre',
+    db.Column('show_id', db.Integer, db.ForeignKey('show.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_show_genre_genre_show', 'genre_id', 'show_id'),
+)
+
+
+class Movie(RatedContentMixin, CommentedContentMixin, ThumbnailMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -26,43 +126,27 @@ class Movie(db.Model):
     year = db.Column(db.Integer, nullable=True)
     thumbnail_url = db.Column(db.String(250), nullable=False)
     video_url = db.Column(db.String(250), nullable=False)
-    external_rating = db.Column(db.Float, default=0)
-
-    @property
-    def average_rating(self):
-        user_rating_avg = (
-                db.session.query(db.func.avg(Rating.rating))
-                .filter(Rating.movie_id == self.id)
-                .scalar() or 0
-        )
-        return round((user_rating_avg + self.external_rating) / 2, 1)
+    external_rating = db.Column(db.Float, default=0, index=True)
+    genres = db.relationship('Genre', secondary=movie_genre, lazy=True)
 
 
-class Show(db.Model):
+class Show(RatedContentMixin, CommentedContentMixin, ThumbnailMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
     genre = db.Column(db.String(100), nullable=True)
     year = db.Column(db.Integer, nullable=True)
     thumbnail_url = db.Column(db.String(250), nullable=False)
-    external_rating = db.Column(db.Float, default=0)
-    seasons = db.relationship('Season', backref='show', lazy=True)
-
-    @property
-    def average_rating(self):
-        user_rating_avg = (
-                db.session.query(db.func.avg(Rating.rating))
-                .filter(Rating.show_id == self.id)
-                .scalar() or 0
-        )
-        return round((user_rating_avg + self.external_rating) / 2, 1)
+    external_rating = db.Column(db.Float, default=0, index=True)
+    genres = db.relationship('Genre', secondary=show_genre, lazy=True)
+    seasons = db.relationship('Season', backref='show', lazy=True, order_by='Season.season_number')
 
 
 class Season(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     season_number = db.Column(db.Integer, nullable=False)
-    show_id = db.Column(db.Integer, db.ForeignKey('show.id'), nullable=False)
-    episodes = db.relationship('Episode', backref='season', lazy=True)
+    show_id = db.Column(db.Integer, db.ForeignKey('show.id'), nullable=False, index=True)
+    episodes = db.relationship('Episode', backref='season', lazy=True, order_by='Episode.episode_number')
 
 
 class Episode(db.Model):
@@ -70,14 +154,25 @@ class Episode(db.Model):
     episode_number = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(150), nullable=False)
     video_url = db.Column(db.String(250), nullable=False)
-    season_id = db.Column(db.Integer, db.ForeignKey('season.id'), nullable=False)
+    season_id = db.Column(db.Integer, db.ForeignKey('season.id'), nullable=False, index=True)
 
 
 class Rating(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    rating = db.Column(db.Integer, nullable=False)
+    # active_history: прежнее значение загружается и у истёкшего объекта, иначе
+    # обработчик after_update не узнает его и не сдвинет агрегаты
+    rating = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    show_id = db.Column(db.Integer, db.ForeignKey("movie.id"), nullable=False)
+    movie_id = db.column_property(db.Column(db.Integer, db.ForeignKey("movie.id"), nullable=True), active_history=True)
+    show_id = db.column_property(db.Column(db.Integer, db.ForeignKey("show.id"), nullable=True), active_history=True)
+
+    __table_args__ = (
+        # Одна оценка пользователя на контент; NULL в другой колонке не конфликтует
+        db.Index('ux_rating_user_movie', 'user_id', 'movie_id', unique=True),
+        db.Index('ux_rating_user_show', 'user_id', 'show_id', unique=True),
+        db.Index('ix_rating_movie_id', 'movie_id'),
+        db.Index('ix_rating_show_id', 'show_id'),
+    )
 
 
 class Comment(db.Model):
@@ -91,11 +186,33 @@ class Comment(db.Model):
     show_id = db.Column(
         db.Integer, db.ForeignKey("show.id"), nullable=True
     )  # Для сериалов
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     user = db.relationship("User", backref="comments", lazy=True)
     movie = db.relationship("Movie", backref="comments", lazy=True)
     show = db.relationship("Show", backref="comments", lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_comment_movie_timestamp', 'movie_id', 'timestamp'),
+        db.Index('ix_comment_show_timestamp', 'show_id', 'timestamp'),
+        db.Index('ix_comment_movie_popular', 'movie_id', 'likes_count', 'id'),
+        db.Index('ix_comment_show_popular', 'show_id', 'likes_count', 'id'),
+    )
+
+
+class CommentLike(db.Model):
+    """
+    Отметка "нравится" комментария; счётчик хранится в Comment.likes_count.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ux_comment_like_comment_user', 'comment_id', 'user_id', unique=True),
+    )
+
 
 class WatchHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -104,14 +221,238 @@ class WatchHistory(db.Model):
     show_id = db.Column(db.Integer, db.ForeignKey("show.id"), nullable=True)
     watched_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_watch_history_user_watched', 'user_id', 'watched_at'),
+    )
+
 
 class UserPreference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     genre = db.Column(db.String(100), nullable=True)  # Любимый жанр
     last_watched_movie = db.Column(db.Integer, db.ForeignKey('movie.id'), nullable=True)
     last_watched_show = db.Column(db.Integer, db.ForeignKey('show.id'), nullable=True)
 
     user = db.relationship('User', backref='preferences', lazy=True)
     last_movie = db.relationship('Movie', foreign_keys=[last_watched_movie])
-    last_show = db.relationship('Show', foreign_keys=[last_watched_show])
\ No newline at end of file
+    last_show = db.relationship('Show', foreign_keys=[last_watched_show])
+
+
+
+class Recommendation(db.Model):
+    """
+    Предрасчитанные рекомендации, строятся командой `flask recommendations build`.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content_type = db.Column(db.String(10), nullable=False)  # 'movie' или 'show'
+    content_id = db.Column(db.Integer, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_recommendation_user_type_rank', 'user_id', 'content_type', 'rank'),
+    )
+
+
+class ExternalRatingCache(db.Model):
+    """
+    Кэш ответов внешнего сервиса рейтингов по названию.
+    """
+    title = db.Column(db.String(150), primary_key=True)
+    rating = db.Column(db.Float, nullable=False, default=0)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+
+class UploadSession(db.Model):
+    """
+    Состояние загрузки видео по частям; строка контента создаётся только при завершении.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content_type = db.Column(db.String(10), nullable=False)
+    filename = db.Column(db.String(250), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64), nullable=True)  # контрольная сумма всего файла
+    details = db.Column(db.JSON, nullable=False)  # title, description, genre, year, season_number
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Job(db.Model):
+    """
+    Фоновая задача; выполняется исполнителем из app/jobs.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # имя из app.jobs.TASKS
+    payload = db.Column(db.JSON, nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)  # больше — раньше
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    idempotency_key = db.Column(db.String(255), nullable=True, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # владелец, видит статус
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_priority_next_attempt', 'status', 'priority', 'next_attempt_at'),
+    )
+
+
+class VideoPackage(db.Model):
+    """
+    HLS-версия видео фильма или серии; сегменты готовит задача packaging.package из app/packaging.py.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    content_type = db.Column(db.String(10), nullable=False)  # movie или episode
+    content_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, ready, failed
+    # Каталог готовых сегментов; при повторной упаковке меняется, поэтому сегменты кэшируются навсегда.
+    # Пока новая версия готовится, отдаётся предыдущая
+    version = db.Column(db.String(32), nullable=True)
+    renditions = db.Column(db.JSON, nullable=True)  # [{name, width, height, bandwidth}]
+    claim_token = db.Column(db.String(32), nullable=True)  # метка последней постановки в очередь
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ux_video_package_content', 'content_type', 'content_id', unique=True),
+    )
+
+
+# HLS-версия видео для страницы просмотра: подгружается вместе с фильмом или сериями,
+# см. WATCH_LOADER_OPTIONS в app/queries.py
+for _model, _content_type in ((Movie, 'movie'), (Episode, 'episode')):
+    _model.video_package = db.relationship(
+        VideoPackage,
+        primaryjoin=db.and_(
+            db.foreign(VideoPackage.content_id) == _model.id,
+            VideoPackage.content_type == _content_type,
+        ),
+        uselist=False,
+        viewonly=True,
+    )
+
+CONTENT_MODELS = {'movie': Movie, 'show': Show}
+
+# С id в конце индекс обслуживает и keyset-пагинацию расширенного поиска
+db.Index('ix_movie_average_rating', Movie.average_rating, Movie.id)
+db.Index('ix_show_average_rating', Show.average_rating, Show.id)
+# Диапазоны лет расширенного поиска, см. app/facets.py
+db.Index('ix_movie_year', Movie.year)
+db.Index('ix_show_year', Show.year)
+
+
+def _apply_rating_delta(connection, movie_id, show_id, sum_delta, count_delta):
+    """
+    Сдвигает агрегаты оценок фильма или сериала на заданную дельту.
+    """
+    if movie_id is not None:
+        table, content_id = Movie.__table__, movie_id
+    elif show_id is not None:
+        table, content_id = Show.__table__, show_id
+    else:
+        return
+    connection.execute(
+        db.update(table)
+        .where(table.c.id == content_id)
+        .values(
+            rating_sum=table.c.rating_sum + sum_delta,
+            rating_count=table.c.rating_count + count_delta,
+        )
+    )
+
+
+def _previous_value(target, attr):
+    history = db.inspect(target).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(target, attr)
+
+
+@db.event.listens_for(Rating, 'after_insert')
+def _rating_inserted(mapper, connection, target):
+    _apply_rating_delta(connection, target.movie_id, target.show_id, target.rating, 1)
+
+
+@db.event.listens_for(Rating, 'after_update')
+def _rating_updated(mapper, connection, target):
+    old_rating = _previous_value(target, 'rating')
+    old_movie_id = _previous_value(target, 'movie_id')
+    old_show_id = _previous_value(target, 'show_id')
+    if (old_rating, old_movie_id, old_show_id) == (target.rating, target.movie_id, target.show_id):
+        return
+    _apply_rating_delta(connection, old_movie_id, old_show_id, -old_rating, -1)
+    _apply_rating_delta(connection, target.movie_id, target.show_id, target.rating, 1)
+
+
+@db.event.listens_for(Rating, 'after_delete')
+def _rating_deleted(mapper, connection, target):
+    _apply_rating_delta(
+        connection,
+        _previous_value(target, 'movie_id'),
+        _previous_value(target, 'show_id'),
+        -_previous_value(target, 'rating'),
+        -1,
+    )
+
+
+def _apply_comment_delta(connection, movie_id, show_id, delta):
+    if movie_id is not None:
+        table, content_id = Movie.__table__, movie_id
+    elif show_id is not None:
+        table, content_id = Show.__table__, show_id
+    else:
+        return
+    connection.execute(
+        db.update(table)
+        .where(table.c.id == content_id)
+        .values(comment_count=table.c.comment_count + delta)
+    )
+
+
+@db.event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    _apply_comment_delta(connection, target.movie_id, target.show_id, 1)
+
+
+@db.event.listens_for(Comment, 'after_update')
+def _comment_updated(mapper, connection, target):
+    old_movie_id = _previous_value(target, 'movie_id')
+    old_show_id = _previous_value(target, 'show_id')
+    if (old_movie_id, old_show_id) == (target.movie_id, target.show_id):
+        return
+    _apply_comment_delta(connection, old_movie_id, old_show_id, -1)
+    _apply_comment_delta(connection, target.movie_id, target.show_id, 1)
+
+
+@db.event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    _apply_comment_delta(connection, _previous_value(target, 'movie_id'), _previous_value(target, 'show_id'), -1)
+
+
+def _apply_like_delta(connection, comment_id, delta):
+    table = Comment.__table__
+    connection.execute(
+        db.update(table)
+        .where(table.c.id == comment_id)
+        .values(likes_count=table.c.likes_count + delta)
+    )
+
+
+@db.event.listens_for(CommentLike, 'after_insert')
+def _comment_liked(mapper, connection, target):
+    _apply_like_delta(connection, target.comment_id, 1)
+
+
+@db.event.listens_for(CommentLike, 'after_delete')
+def _comment_unliked(mapper, connection, target):
+    _apply_like_delta(connection, _previous_value(target, 'comment_id'), -1)
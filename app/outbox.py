@@ -0,0 +1,122 @@
+import atexit
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from flask import current_app
+
+from app.jobs import PRIORITY_HIGH, PermanentJobError, enqueue_job, task
+
+
+# С удвоением задержки от JOBS_RETRY_DELAY письмо ждёт недоступный SMTP-сервер несколько часов
+MAIL_MAX_ATTEMPTS = 10
+
+
+def enqueue_mail(subject, recipients, body, sender=None):
+    """
+    Ставит письмо в очередь фоновых задач (app/jobs.py); отправит его исполнитель задач.
+
+    Запрос не ждёт SMTP-сервер: время ответа не зависит от его доступности.
+
+    :param recipients: Список адресов
+    :return: Job
+    """
+    return enqueue_job('mail.send', {
+        'subject': subject,
+        'recipients': list(recipients),
+        'body': body,
+        'sender': sender,
+    })
+
+
+@task('mail.send', priority=PRIORITY_HIGH, max_attempts=MAIL_MAX_ATTEMPTS)
+def send_mail(subject, recipients, body, sender=None):
+    config = current_app.config
+    email = EmailMessage()
+    email['Subject'] = subject
+    email['From'] = sender or config['MAIL_DEFAULT_SENDER']
+    email['To'] = ', '.join(recipients)
+    email['Date'] = formatdate(localtime=True)
+    email['Message-ID'] = make_msgid()
+    email.set_content(body)
+    try:
+        current_app.extensions['mail'].send(email)
+    except smtplib.SMTPRecipientsRefused as e:
+        # Адрес отвергнут окончательно — повторять бессмысленно
+        raise PermanentJobError(f"Recipients refused: {', '.join(e.recipients)}")
+    return {'message_id': email['Message-ID']}
+
+
+class SmtpTransport:
+    """
+    SMTP-соединение процесса, общее для задач отправки писем.
+
+    Соединение переиспользуется между письмами и переоткрывается, если простаивало
+    дольше MAIL_CONNECTION_IDLE; скорость ограничена MAIL_RATE писем в секунду
+    на процесс. Повторы при ошибках сервера делает очередь задач.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.rate = app.config['MAIL_RATE']
+        self.idle_timeout = app.config['MAIL_CONNECTION_IDLE']
+        self._smtp = None
+        self._last_send = 0.0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def send(self, email):
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._last_send > self.idle_timeout:
+                # Сервер мог уже закрыть простаивавшее соединение
+                self._close()
+            self._throttle()
+            try:
+                self._connection().send_message(email)
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except (smtplib.SMTPException, OSError):
+                self._close()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _throttle(self):
+        if self.rate:
+            wait = self._last_send + 1 / self.rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_send = time.monotonic()
+
+    def _connection(self):
+        if self._smtp is None:
+            config = self.app.config
+            smtp_class = smtplib.SMTP_SSL if config['MAIL_USE_SSL'] else smtplib.SMTP
+            smtp = smtp_class(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT'])
+            try:
+                if config['MAIL_USE_TLS']:
+                    smtp.starttls()
+                if config['MAIL_USERNAME'] and config['MAIL_PASSWORD']:
+                    smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            except BaseException:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def init_mail(app):
+    app.extensions['mail'] = SmtpTransport(app)
@@ -0,0 +1,370 @@
+import base64
+import hashlib
+import json
+import logging
+import mimetypes
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from flask import current_app, url_for
+
+from app.extensions import db
+from app.jobs import PRIORITY_LOW, PermanentJobError, enqueue_job, task
+from app.models import Movie, Episode, VideoPackage
+from app.streaming import get_videos_root, video_file_path
+
+
+logger = logging.getLogger(__name__)
+
+PACKAGED_MODELS = {'movie': Movie, 'episode': Episode}
+PLAYLIST_MIMETYPE = 'application/vnd.apple.mpegurl'
+PLAYLIST_NAME = 'index.m3u8'
+
+
+class PackagingError(Exception):
+    """
+    Видео не удалось упаковать; сообщение сохраняется в VideoPackage.last_error.
+    """
+
+
+def packaging_dir():
+    # По умолчанию рядом с исходными файлами: static/videos/hls
+    path = current_app.config['PACKAGING_DIR'] or os.path.join(get_videos_root(), 'hls')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def probe_video(ffprobe, source_path):
+    """
+    :return: (ширина, высота, есть ли звук)
+    :raises PackagingError: Если файл не читается или в нём нет видеопотока
+    """
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_entries', 'stream=codec_type,width,height', '-of', 'json', source_path],
+            capture_output=True, timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise PackagingError(f"ffprobe failed: {e}")
+    if result.returncode != 0:
+        raise PackagingError(f"ffprobe failed: {result.stderr.decode(errors='replace').strip()[-500:]}")
+    streams = json.loads(result.stdout or b'{}').get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video is None or not video.get('height'):
+        raise PackagingError("no video stream")
+    return video['width'], video['height'], any(stream.get('codec_type') == 'audio' for stream in streams)
+
+
+def plan_renditions(width, height, renditions):
+    """
+    Варианты из PACKAGING_RENDITIONS не выше исходного видео (хотя бы один — самый маленький),
+    по возрастанию битрейта: плеер начинает с первого, поэтому старт быстрый и на медленной сети.
+    """
+    ordered = sorted(renditions.items(), key=lambda item: item[1][0])
+    plan = [item for item in ordered if item[1][0] <= height] or ordered[:1]
+    result = []
+    for name, (target_height, video_bitrate, audio_bitrate) in plan:
+        target_height = min(target_height, height) // 2 * 2
+        result.append({
+            'name': name,
+            'width': round(width * target_height / height / 2) * 2,
+            'height': target_height,
+            'video_bitrate': video_bitrate,
+            'audio_bitrate': audio_bitrate,
+            # Запас на превышение среднего битрейта, как советует спецификация HLS
+            'bandwidth': int((video_bitrate + audio_bitrate) * 1000 * 1.1),
+        })
+    return result
+
+
+def encode_rendition(ffmpeg, source_path, output_dir, rendition, segment_duration, has_audio, timeout):
+    """
+    Кодирует один вариант в сегменты HLS фиксированной длины.
+    Выполняется в процессе пула, поэтому принимает только простые аргументы.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    video_bitrate = rendition['video_bitrate']
+    command = [
+        ffmpeg, '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-i', source_path,
+        '-map', '0:v:0', *(['-map', '0:a:0'] if has_audio else []),
+        '-vf', f"scale={rendition['width']}:{rendition['height']}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        '-b:v', f'{video_bitrate}k', '-maxrate', f'{int(video_bitrate * 1.07)}k', '-bufsize', f'{video_bitrate * 2}k',
+        # Ключевой кадр в начале каждого сегмента: сегменты одной длины во всех вариантах,
+        # и плеер может переключать вариант на любой границе
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment_duration})', '-sc_threshold', '0',
+        *(['-c:a', 'aac', '-b:a', f"{rendition['audio_bitrate']}k", '-ac', '2'] if has_audio else []),
+        '-f', 'hls', '-hls_time', str(segment_duration), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, 'segment_%05d.ts'),
+        os.path.join(output_dir, PLAYLIST_NAME),
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise PackagingError(f"ffmpeg failed for {rendition['name']}: {e}")
+    if result.returncode != 0:
+        raise PackagingError(
+            f"ffmpeg failed for {rendition['name']}: {result.stderr.decode(errors='replace').strip()[-500:]}"
+        )
+    return rendition['name']
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, как и у обложек: дочерние процессы не наследуют потоки и соединения сервера
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def package_video(source_path, output_dir):
+    """
+    Упаковывает файл во все подходящие варианты; варианты кодируются параллельно
+    в пуле процессов (PACKAGING_WORKERS).
+
+    :param output_dir: Новый каталог версии
+    :return: Описание вариантов для VideoPackage.renditions
+    :raises PackagingError: Если ffprobe или ffmpeg завершились с ошибкой
+    """
+    config = current_app.config
+    width, height, has_audio = probe_video(config['PACKAGING_FFPROBE'], source_path)
+    renditions = plan_renditions(width, height, config['PACKAGING_RENDITIONS'])
+    jobs = [
+        (config['PACKAGING_FFMPEG'], source_path, os.path.join(output_dir, rendition['name']), rendition,
+         config['PACKAGING_SEGMENT_DURATION'], has_audio, config['PACKAGING_TIMEOUT'])
+        for rendition in renditions
+    ]
+    try:
+        if config['PACKAGING_WORKERS'] and len(jobs) > 1:
+            pool = _get_pool(config['PACKAGING_WORKERS'])
+            for future in [pool.submit(encode_rendition, *job) for job in jobs]:
+                future.result()
+        else:
+            for job in jobs:
+                encode_rendition(*job)
+    except BrokenProcessPool as e:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        _reset_pool()
+        raise PackagingError(f"packaging worker died: {e!r}")
+    except BaseException:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    return [
+        {key: rendition[key] for key in ('name', 'width', 'height', 'bandwidth')}
+        for rendition in renditions
+    ]
+
+
+def enqueue_packaging(content_type, content_id):
+    """
+    Ставит видео фильма или серии в очередь фоновых задач на упаковку
+    (повторно — если оно уже было упаковано).
+
+    Каждая постановка получает новую метку VideoPackage.claim_token: задача более
+    ранней постановки, ещё ждущая или работающая, свой результат уже не запишет.
+
+    :param content_type: 'movie' или 'episode'
+    :return: VideoPackage или None, если упаковка выключена
+    """
+    if not current_app.config['PACKAGING_ENABLED']:
+        return None
+    package = db.session.scalar(
+        db.select(VideoPackage).filter_by(content_type=content_type, content_id=content_id)
+    )
+    if package is None:
+        package = VideoPackage(content_type=content_type, content_id=content_id)
+        db.session.add(package)
+    package.status = 'pending'
+    package.claim_token = uuid.uuid4().hex
+    package.last_error = None
+    db.session.flush()
+    # Задача фиксируется в одной транзакции с меткой
+    enqueue_job('packaging.package', {'package_id': package.id, 'token': package.claim_token})
+    return package
+
+
+def _update_package(package_id, token, **values):
+    """
+    Обновляет упаковку, только если её не поставили в очередь заново.
+
+    :return: Обновление записано
+    """
+    updated = db.session.execute(
+        db.update(VideoPackage)
+        .where(VideoPackage.id == package_id, VideoPackage.claim_token == token)
+        .values(updated_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(updated)
+
+
+@task('packaging.package', priority=PRIORITY_LOW, max_attempts=3)
+def package_content(package_id, token):
+    """
+    Упаковывает видео фильма или серии в новый каталог версии и переключает на него VideoPackage.
+
+    Пока ffmpeg работает, исполнитель задач продлевает claimed_at задачи (JOBS_HEARTBEAT_INTERVAL),
+    поэтому долгое кодирование не забирается повторно. Все записи в VideoPackage условны
+    по token: результат устаревшей постановки отбрасывается вместе с её каталогом.
+
+    :param token: Метка постановки из enqueue_packaging
+    """
+    package = db.session.get(VideoPackage, package_id)
+    if package is None or package.claim_token != token:
+        return {'superseded': True}
+    content = db.session.get(PACKAGED_MODELS[package.content_type], package.content_id)
+    source_path = video_file_path(content.video_url) if content is not None else None
+    content_dir = os.path.join(packaging_dir(), package.content_type, str(package.content_id))
+    # Соединение с базой не держим, пока работает ffmpeg
+    if not _update_package(package_id, token, status='processing'):
+        return {'superseded': True}
+    if source_path is None:
+        _update_package(package_id, token, status='failed', last_error='source video not found')
+        raise PermanentJobError('source video not found')
+
+    version = uuid.uuid4().hex[:12]
+    started = datetime.utcnow()
+    try:
+        renditions = package_video(source_path, os.path.join(content_dir, version))
+    except PackagingError as e:
+        # Повторит очередь задач; до повтора на странице видна ошибка последней попытки
+        _update_package(package_id, token, status='failed', last_error=str(e))
+        raise
+
+    previous = db.session.scalar(db.select(VideoPackage.version).where(VideoPackage.id == package_id))
+    if not _update_package(package_id, token, version=version, renditions=renditions, status='ready', last_error=None):
+        shutil.rmtree(os.path.join(content_dir, version), ignore_errors=True)
+        return {'superseded': True}
+    logger.info("Packaged %s %d into %d renditions in %.0fs", package.content_type, package.content_id,
+                len(renditions), (datetime.utcnow() - started).total_seconds())
+    if previous and previous != version:
+        shutil.rmtree(os.path.join(content_dir, previous), ignore_errors=True)
+    return {'version': version, 'renditions': len(renditions)}
+
+
+def enqueue_missing_packages(force=False):
+    """
+    Ставит в очередь видео, у которых ещё нет упакованной версии.
+
+    :param force: Упаковать заново все видео
+    :return: Количество поставленных в очередь
+    """
+    queued = 0
+    for content_type, model in PACKAGED_MODELS.items():
+        query = db.select(model.id)
+        if not force:
+            packaged = db.select(VideoPackage.content_id).where(
+                VideoPackage.content_type == content_type,
+                db.or_(VideoPackage.version.is_not(None), VideoPackage.status.in_(('pending', 'processing'))),
+            )
+            query = query.where(model.id.not_in(packaged))
+        for content_id in db.session.scalars(query).all():
+            enqueue_packaging(content_type, content_id)
+            queued += 1
+    return queued
+
+
+def ready_package(content_type, content_id):
+    return db.session.scalar(
+        db.select(VideoPackage).filter_by(content_type=content_type, content_id=content_id)
+        .where(VideoPackage.version.is_not(None))
+    )
+
+
+def manifest_url(content):
+    """
+    URL мастер-плейлиста или None, если видео ещё не упаковано.
+
+    :param content: Movie или Episode; video_package загружается вместе с ним (load_watch_content)
+    """
+    package = content.video_package
+    if not current_app.config['PACKAGING_ENABLED'] or package is None or package.version is None:
+        return None
+    return url_for('main.hls_manifest', content_type=package.content_type, content_id=package.content_id)
+
+
+PLAYER_SCRIPT = 'vendor/hls.min.js'
+
+
+def _integrity(data):
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def hls_player_script():
+    """
+    Скрипт hls.js для страницы просмотра: своя копия из static или CDN с проверкой SRI.
+
+    :return: {'src', 'integrity'} или None — тогда браузеры без HLS играют mp4
+    """
+    if os.path.isfile(os.path.join(current_app.static_folder, PLAYER_SCRIPT)):
+        return {'src': url_for('static', filename=PLAYER_SCRIPT), 'integrity': None}
+    if current_app.config['HLS_JS_INTEGRITY']:
+        return {'src': current_app.config['HLS_JS_URL'], 'integrity': current_app.config['HLS_JS_INTEGRITY']}
+    # Сторонний скрипт без закреплённого хэша не подключаем
+    return None
+
+
+def vendor_player_script():
+    """
+    Скачивает HLS_JS_URL в static/vendor; при заданном HLS_JS_INTEGRITY проверяет хэш.
+
+    :return: (путь, SRI-хэш скачанного файла)
+    :raises PackagingError: Хэш не совпал с HLS_JS_INTEGRITY
+    """
+    with urllib.request.urlopen(current_app.config['HLS_JS_URL'], timeout=30) as response:
+        data = response.read()
+    integrity = _integrity(data)
+    expected = current_app.config['HLS_JS_INTEGRITY']
+    if expected and expected != integrity:
+        raise PackagingError(f"hls.js integrity mismatch: expected {expected}, got {integrity}")
+    path = os.path.join(current_app.static_folder, PLAYER_SCRIPT)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path, integrity
+
+
+def render_master_playlist(package):
+    """
+    Мастер-плейлист со ссылками на плейлисты вариантов текущей версии.
+    """
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in package.renditions:
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bandwidth']},"
+            f"RESOLUTION={rendition['width']}x{rendition['height']}"
+        )
+        lines.append(url_for(
+            'main.hls_segment',
+            filename=f"{package.content_type}/{package.content_id}/{package.version}/{rendition['name']}/{PLAYLIST_NAME}",
+        ))
+    return '\n'.join(lines) + '\n'
+
+
+def init_packaging(app):
+    # Расширения есть не во всех системных таблицах mimetypes
+    mimetypes.add_type(PLAYLIST_MIMETYPE, '.m3u8')
+    mimetypes.add_type('video/mp2t', '.ts')
+    app.add_template_global(hls_player_script)
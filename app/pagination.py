@@ -0,0 +1,102 @@
+import base64
+import json
+
+from app.extensions import db
+from app.models import CONTENT_MODELS
+
+
+# Колонки, по которым возможна keyset-пагинация каталога (всегда по убыванию, затем id)
+SORT_COLUMNS = {'rating': 'external_rating', 'year': 'year'}
+
+
+def sort_expression(model, sort):
+    """
+    Ключ сортировки каталога. NULL заменяется нулём, чтобы сравнение кортежей
+    (ключ, id) было корректным; выражение совпадает с индексом ниже.
+    """
+    return db.func.coalesce(getattr(model, SORT_COLUMNS[sort]), db.literal(0, literal_execute=True))
+
+
+for _model in CONTENT_MODELS.values():
+    for _sort in SORT_COLUMNS:
+        db.Index(
+            f'ix_{_model.__tablename__}_{_sort}_keyset', sort_expression(_model, _sort), _model.id
+        )
+
+
+def encode_cursor(sort_value, last_id):
+    raw = json.dumps([sort_value, last_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, value_types=(int, float)):
+    """
+    :param value_types: Допустимые типы значения ключа сортировки
+    :raises ValueError: Если курсор повреждён
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, last_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(sort_value, value_types) or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    return sort_value, last_id
+
+
+def after_cursor(key, id_column, cursor):
+    """
+    Условия строк после курсора при сортировке по убыванию (key, id).
+
+    :raises ValueError: Если курсор повреждён
+    """
+    sort_value, last_id = decode_cursor(cursor)
+    # Избыточное условие key <= value позволяет SQLite искать по индексу, а не сканировать его
+    return key <= sort_value, db.tuple_(key, id_column) < db.tuple_(sort_value, last_id)
+
+
+def keyset_select(model, sort, cursor=None, limit=20, columns=None):
+    """
+    Строит SELECT следующей страницы каталога после курсора.
+
+    В результат всегда добавляется колонка sort_key для построения следующего курсора.
+
+    :param model: Movie или Show
+    :param sort: Ключ из SORT_COLUMNS
+    :param cursor: Курсор предыдущей страницы или None
+    :param limit: Количество строк
+    :param columns: Колонки для выборки; по умолчанию — сущность целиком
+    :raises ValueError: Если курсор повреждён
+    """
+    key = sort_expression(model, sort)
+    stmt = (
+        db.select(*(columns or [model]), key.label('sort_key'))
+        .order_by(key.desc(), model.id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        stmt = stmt.where(*after_cursor(key, model.id, cursor))
+    return stmt
+
+
+def keyset_page(stmt, per_page):
+    """
+    Выполняет SELECT сущностей с колонкой sort_key, ограниченный per_page + 1 строками.
+
+    :return: (список объектов, курсор следующей страницы или None)
+    """
+    rows = db.session.execute(stmt).all()
+    items = [row[0] for row in rows[:per_page]]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(rows[per_page - 1].sort_key, items[-1].id)
+    return items, next_cursor
+
+
+def paginate_keyset(model, sort, cursor=None, per_page=20):
+    """
+    Возвращает страницу объектов каталога и курсор следующей страницы.
+
+    :return: (список Movie/Show, курсор или None)
+    """
+    return keyset_page(keyset_select(model, sort, cursor, per_page + 1), per_page)
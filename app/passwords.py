@@ -0,0 +1,110 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Очередь на хэширование переполнена — запрос нужно отклонить, а не ждать.
+    """
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей в ограниченном пуле потоков.
+
+    scrypt и pbkdf2 из hashlib отпускают GIL, поэтому хэши считаются параллельно,
+    но не больше чем в `workers` потоках: шторм входов не занимает все ядра,
+    а сверх `max_pending` ожидающих операций запросы сразу получают отказ.
+
+    Поток запроса при этом ждёт результата: пул ограничивает нагрузку на CPU, но не
+    освобождает потоки сервера. Во время шторма входов до `max_pending` потоков воркера
+    стоят в ожидании, поэтому PASSWORD_HASH_MAX_PENDING по умолчанию на единицу меньше
+    SERVER_THREADS — иначе остальные страницы ждут вместе со входами.
+    """
+
+    def __init__(self, method, workers=None, max_pending=None, timeout=10):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def _get_executor(self):
+        # Пул создаётся при первом обращении, а не при создании приложения,
+        # чтобы потоки не копировались в процессы сервера после fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._submit(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Хэш посчитан с другими параметрами, чем заданы в PASSWORD_HASH_METHOD.
+        """
+        return password_hash.split('$', 1)[0] != _method_prefix(self.method)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # Werkzeug дописывает параметры по умолчанию ('scrypt' -> 'scrypt:32768:8:1'),
+    # поэтому префикс берём из настоящего хэша
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def _get_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def hash_password(password):
+    """
+    :raises PasswordHasherBusy: Если очередь на хэширование переполнена
+    """
+    return _get_hasher().hash(password)
+
+
+def verify_password(password_hash, password):
+    """
+    :raises PasswordHasherBusy: Если очередь на хэширование переполнена
+    """
+    return _get_hasher().check(password_hash, password)
+
+
+def password_needs_rehash(password_hash):
+    return _get_hasher().needs_rehash(password_hash)
+
+
+def init_passwords(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'] or max(app.config['SERVER_THREADS'] - 1, 1),
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
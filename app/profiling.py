@@ -0,0 +1,307 @@
+import cProfile
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from flask import g, request, current_app, has_app_context, before_render_template, template_rendered
+
+from app.extensions import db
+
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы гистограммы длительности запросов, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WINDOW_QUANTILES = (0.5, 0.95, 0.99)
+
+# Эндпоинты, которые не учитываются (сам сбор метрик и статика)
+EXCLUDED_ENDPOINTS = {'main.metrics', 'static'}
+
+
+class RequestProfile:
+    """
+    Затраты одного запроса: SQL-запросы, время БД и рендеринга шаблонов.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = 500  # если after_request не вызовется — запрос завершился исключением
+        self.statements = Counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._template_starts = []
+        self.profiler = None
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    def duplicates(self, threshold):
+        """
+        Одинаковые (с точностью до параметров) запросы, выполненные не меньше threshold раз —
+        характерный след N+1.
+
+        :return: [(SQL, сколько раз)], по убыванию
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+class MetricsRegistry:
+    """
+    Агрегаты по эндпоинтам в памяти процесса.
+
+    Счётчики и гистограммы накопительные, как принято в Prometheus; перцентили
+    дополнительно считаются по скользящему окну последних запросов.
+    Каждый процесс сервера отдаёт свои значения — суммирует их Prometheus.
+    """
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (эндпоинт, метод, статус) -> количество
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.queries = Counter()
+        self.db_time = Counter()
+        self.template_time = Counter()
+        self.duplicate_queries = Counter()
+        self.profiles_written = 0
+        self.startup_seconds = None  # время create_app, заполняется при создании приложения
+        self._windows = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, endpoint, method, profile, duration, duplicates):
+        with self._lock:
+            self.requests[endpoint, method, profile.status] += 1
+            buckets = self.duration_buckets[endpoint]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            self.duration_sum[endpoint] += duration
+            self.duration_count[endpoint] += 1
+            self.queries[endpoint] += profile.query_count
+            self.db_time[endpoint] += profile.db_time
+            self.template_time[endpoint] += profile.template_time
+            self.duplicate_queries[endpoint] += sum(count - 1 for _, count in duplicates)
+            self._windows[endpoint].append(duration)
+
+    def render(self):
+        """
+        :return: Метрики в текстовом формате Prometheus
+        """
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total Handled HTTP requests.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            lines += [
+                '# HELP http_request_duration_seconds Request handling time.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for endpoint in sorted(self.duration_count):
+                for bound, count in zip(DURATION_BUCKETS, self.duration_buckets[endpoint]):
+                    lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}')
+                total = self.duration_count[endpoint]
+                lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le="+Inf")} {total}')
+                lines.append(f'http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {self.duration_sum[endpoint]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{_labels(endpoint=endpoint)} {total}')
+
+            lines += [
+                '# HELP http_request_window_seconds Request handling time over the most recent requests.',
+                '# TYPE http_request_window_seconds summary',
+            ]
+            for endpoint, window in sorted(self._windows.items()):
+                values = sorted(window)
+                for quantile in WINDOW_QUANTILES:
+                    value = values[min(int(quantile * len(values)), len(values) - 1)]
+                    lines.append(f'http_request_window_seconds{_labels(endpoint=endpoint, quantile=quantile)} {value:.6f}')
+                lines.append(f'http_request_window_seconds_sum{_labels(endpoint=endpoint)} {sum(values):.6f}')
+                lines.append(f'http_request_window_seconds_count{_labels(endpoint=endpoint)} {len(values)}')
+
+            for name, kind, help_text, values, fmt in (
+                ('db_queries_total', 'counter', 'SQL statements executed while handling requests.', self.queries, 'd'),
+                ('db_query_duration_seconds_total', 'counter', 'Time spent executing SQL statements.', self.db_time, '.6f'),
+                ('db_duplicate_queries_total', 'counter', 'Repeated executions of the same SQL within a request.',
+                 self.duplicate_queries, 'd'),
+                ('template_render_seconds_total', 'counter', 'Time spent rendering templates.', self.template_time, '.6f'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for endpoint in sorted(self.duration_count):
+                    lines.append(f'{name}{_labels(endpoint=endpoint)} {values[endpoint]:{fmt}}')
+
+            lines += [
+                '# HELP profiles_written_total cProfile dumps written for slow requests.',
+                '# TYPE profiles_written_total counter',
+                f'profiles_written_total {self.profiles_written}',
+            ]
+            if self.startup_seconds is not None:
+                lines += [
+                    '# HELP app_startup_seconds Time spent creating the application in this process.',
+                    '# TYPE app_startup_seconds gauge',
+                    f'app_startup_seconds {self.startup_seconds:.6f}',
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _current_profile():
+    if not has_app_context():
+        return None
+    return g.get('_request_profile')
+
+
+class RequestProfiler:
+    """
+    Профилирование запросов: SQL, время БД и шаблонов, дубли запросов,
+    выборочный cProfile медленных запросов.
+
+    Настройки: PROFILING_ENABLED, PROFILING_DUPLICATE_THRESHOLD, PROFILING_SLOW_REQUEST,
+    PROFILING_SAMPLE_RATE, PROFILING_DIR, PROFILING_WINDOW.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.metrics = MetricsRegistry(window=app.config['PROFILING_WINDOW'])
+        self.duplicate_threshold = app.config['PROFILING_DUPLICATE_THRESHOLD']
+        self.slow_request = app.config['PROFILING_SLOW_REQUEST']
+        self.sample_rate = app.config['PROFILING_SAMPLE_RATE']
+        self.directory = app.config['PROFILING_DIR'] or os.path.join(app.instance_path, 'profiles')
+        # В Python 3.12+ cProfile глобален для процесса: одновременно профилируем один запрос
+        self._profiler_lock = threading.Lock()
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            for engine in db.engines.values():
+                db.event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                db.event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _before_request(self):
+        if request.endpoint in EXCLUDED_ENDPOINTS:
+            return
+        profile = g._request_profile = RequestProfile()
+        if self.sample_rate and random.random() < self.sample_rate and self._profiler_lock.acquire(blocking=False):
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError:
+                # Профилировщик уже запущен кем-то ещё (отладчик, внешний профайлер)
+                profile.profiler = None
+                self._profiler_lock.release()
+
+    def _after_request(self, response):
+        profile = _current_profile()
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        profile = g.pop('_request_profile', None)
+        if profile is None:
+            return
+        duration = time.perf_counter() - profile.started
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            self._profiler_lock.release()
+
+        endpoint = request.endpoint or 'unmatched'
+        duplicates = profile.duplicates(self.duplicate_threshold)
+        self.metrics.observe(endpoint, request.method, profile, duration, duplicates)
+
+        if duplicates:
+            statement, count = duplicates[0]
+            logger.warning(
+                "%s %s executed the same query %d times (%d queries total): %s",
+                request.method, request.path, count, profile.query_count, statement,
+            )
+        if duration >= self.slow_request:
+            logger.warning(
+                "Slow request %s %s: %.3fs, %d queries, %.3fs in DB, %.3fs in templates",
+                request.method, request.path, duration, profile.query_count, profile.db_time, profile.template_time,
+            )
+            if profile.profiler is not None:
+                self._dump(profile.profiler, endpoint, duration)
+
+    def _dump(self, profiler, endpoint, duration):
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint.replace('.', '_')}-{int(duration * 1000)}ms-{os.getpid()}.prof"
+        path = os.path.join(self.directory, filename)
+        try:
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning("Failed to write profile %s: %r", path, e)
+            return
+        with self.metrics._lock:
+            self.metrics.profiles_written += 1
+        logger.info("Profile of slow request written to %s", path)
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None:
+            profile._template_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = _current_profile()
+        if profile is not None and profile._template_starts:
+            elapsed = time.perf_counter() - profile._template_starts.pop()
+            # Вложенный render_template уже учтён во внешнем
+            if not profile._template_starts:
+                profile.template_time += elapsed
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is None:
+        return
+    profile.statements[statement] += 1
+    started = getattr(context, '_profiling_started', None)
+    if started is not None:
+        profile.db_time += time.perf_counter() - started
+
+
+def metrics_allowed():
+    """
+    Доступ к /metrics: с токеном METRICS_TOKEN (заголовок Authorization: Bearer <токен>)
+    или с адресов METRICS_ALLOWED_IPS, если они явно заданы. Без настроек доступ закрыт.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return True
+    return request.remote_addr in current_app.config['METRICS_ALLOWED_IPS']
+
+
+def render_metrics():
+    """
+    :return: Текст метрик или None, если профилирование выключено
+    """
+    profiler = current_app.extensions.get('profiling')
+    return profiler.metrics.render() if profiler else None
+
+
+def init_profiling(app):
+    if app.config['PROFILING_ENABLED']:
+        app.extensions['profiling'] = RequestProfiler(app)
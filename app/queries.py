@@ -0,0 +1,159 @@
+import threading
+from contextlib import contextmanager
+
+from app.extensions import db
+from app.models import (
+    CONTENT_MODELS, Movie, Show, Season, Episode, Comment, Rating, WatchHistory, UserPreference, Recommendation,
+)
+from app.pagination import SORT_COLUMNS, keyset_select, encode_cursor
+from app.genres import genre_filter
+from app.facets import facet_results_select
+
+
+# Стратегии загрузки связей для каждой страницы просмотра: сезоны и серии
+# подгружаются двумя запросами selectin вместо запроса на каждый сезон,
+# HLS-версии видео — тем же запросом, что фильм или серии
+WATCH_LOADER_OPTIONS = {
+    'movie': (db.joinedload(Movie.video_package),),
+    'show': (db.selectinload(Show.seasons).selectinload(Season.episodes).joinedload(Episode.video_package),),
+}
+
+
+def load_watch_content(content_type, content_id):
+    """
+    Загружает фильм или сериал для страницы просмотра со всеми нужными связями.
+
+    :param content_type: Тип контента ('movie' или 'show')
+    :param content_id: Идентификатор контента
+    :return: Movie/Show или 404
+    """
+    model = Movie if content_type == 'movie' else Show
+    return (
+        model.query
+        .options(*WATCH_LOADER_OPTIONS[content_type])
+        .filter(model.id == content_id)
+        .first_or_404()
+    )
+
+
+def comments_query(content_type, content_id):
+    """
+    Запрос комментариев к контенту с авторами, загруженными тем же запросом.
+    """
+    content_fk = Comment.movie_id if content_type == 'movie' else Comment.show_id
+    return Comment.query.options(db.joinedload(Comment.user)).filter(content_fk == content_id)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Собирает SQL-запросы, выполненные внутри блока в текущем потоке
+    (запись фоновых потоков, например буфера просмотров, не учитывается).
+
+    Пример: ``with count_queries() as statements: client.get(url)``
+
+    :param engine: Движок; по умолчанию все движки текущего приложения (запись и чтение)
+    """
+    engines = [engine] if engine is not None else list(db.engines.values())
+    statements = []
+    thread_id = threading.get_ident()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread_id:
+            statements.append(statement)
+
+    for engine in engines:
+        db.event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            db.event.remove(engine, 'before_cursor_execute', _record)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """
+    Проверяет, что блок выполнил не больше `limit` SQL-запросов.
+
+    :raises AssertionError: Со списком запросов, если лимит превышен
+    """
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(
+            f"Expected at most {limit} queries, got {len(statements)}:\n" + "\n".join(statements)
+        )
+
+
+def route_queries():
+    """
+    Типичные запросы маршрутов с примерными параметрами — для проверки планов выполнения.
+
+    :return: Список (название, SELECT)
+    """
+    queries = []
+    for content_type, model in CONTENT_MODELS.items():
+        queries += [
+            (f'index: top {content_type}s', db.select(model).order_by(model.external_rating.desc()).limit(10)),
+            (f'watch: {content_type}', db.select(model).options(*WATCH_LOADER_OPTIONS[content_type]).where(model.id == 1)),
+            (f'watch: {content_type} comments', comments_query(content_type, 1).order_by(
+                Comment.timestamp.desc(), Comment.id.desc()
+            ).limit(21).statement),
+            (f'comments: {content_type} popular', comments_query(content_type, 1).order_by(
+                Comment.likes_count.desc(), Comment.id.desc()
+            ).limit(21).statement),
+            (f'rate: {content_type} rating lookup', db.select(Rating).where(
+                Rating.user_id == 1, getattr(Rating, f'{content_type}_id') == 1
+            )),
+            (f'rating aggregates: {content_type}', db.select(
+                db.func.sum(Rating.rating), db.func.count()
+            ).where(getattr(Rating, f'{content_type}_id') == 1)),
+            (f'recommendations: {content_type}', db.select(Recommendation.content_id).where(
+                Recommendation.user_id == 1, Recommendation.content_type == content_type
+            ).order_by(Recommendation.rank)),
+            (f'genre: top {content_type}s', db.select(model.id).where(
+                genre_filter(model, 'drama')
+            ).order_by(model.external_rating.desc()).limit(10)),
+            (f'top {content_type}s by average rating', db.select(model.id).order_by(model.average_rating.desc()).limit(10)),
+            (f'advanced search: {content_type}s by rating range', facet_results_select(
+                model, {'min_rating': 7.0, 'max_rating': 9.0}, limit=21
+            )),
+            (f'advanced search: {content_type}s by rating range, next page', facet_results_select(
+                model, {'min_rating': 7.0, 'max_rating': 9.0}, encode_cursor(8.0, 100), limit=21
+            )),
+            (f'advanced search: {content_type}s by years', facet_results_select(
+                model, {'min_year': 1990, 'max_year': 1999}, limit=21
+            )),
+        ]
+        for sort in SORT_COLUMNS:
+            queries += [
+                (f'list: {content_type}s by {sort}', keyset_select(model, sort, limit=25)),
+                (f'list: {content_type}s by {sort}, next page', keyset_select(model, sort, encode_cursor(5, 100), limit=25)),
+            ]
+    queries += [
+        ('watch: show seasons', db.select(Season).where(Season.show_id.in_([1]))),
+        ('watch: season episodes', db.select(Episode).where(Episode.season_id.in_([1, 2]))),
+        ('watch history: user', db.select(WatchHistory).where(WatchHistory.user_id == 1).order_by(WatchHistory.watched_at.desc())),
+        ('preferences: user', db.select(UserPreference).where(UserPreference.user_id == 1)),
+    ]
+    return queries
+
+
+def explain(statement):
+    """
+    План выполнения запроса в текущей СУБД.
+
+    :return: (строки плана, найдено ли полное сканирование таблицы)
+    """
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        lines = [row.detail for row in rows]
+        # "SCAN movie" — полный проход таблицы; "SCAN movie USING INDEX ..." — проход по индексу
+        full_scan = any(line.startswith('SCAN ') and ' USING ' not in line for line in lines)
+    else:
+        lines = [row[0] for row in db.session.execute(db.text(f'EXPLAIN {sql}'))]
+        full_scan = any('Seq Scan' in line for line in lines)
+    return lines, full_scan
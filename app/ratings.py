@@ -0,0 +1,203 @@
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import CONTENT_MODELS, Movie, Show, Rating
+from app.recommendations import invalidate_recommendations
+
+
+class RatingError(Exception):
+    """
+    Пачка оценок отклонена целиком; errors — список {'index', 'error'} по записям пачки.
+    """
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors or []
+
+
+def _aggregate_values(model):
+    # Коррелированные подзапросы rating_sum/rating_count по таблице rating
+    rating_fk = Rating.movie_id if model is Movie else Rating.show_id
+    return {
+        'rating_sum': db.select(db.func.coalesce(db.func.sum(Rating.rating), 0))
+        .where(rating_fk == model.id).scalar_subquery(),
+        'rating_count': db.select(db.func.count(Rating.id)).where(rating_fk == model.id).scalar_subquery(),
+    }
+
+
+def rebuild_rating_aggregates(batch_size=1000):
+    """
+    Пересчитывает rating_sum/rating_count фильмов и сериалов по таблице rating.
+
+    Обновление идёт пачками по диапазонам id, чтобы не держать долгую пишущую
+    транзакцию на большом каталоге.
+
+    :param batch_size: Количество записей контента в одной транзакции
+    :return: Количество обновлённых записей
+    """
+    updated = 0
+    for model in (Movie, Show):
+        max_id = db.session.query(db.func.max(model.id)).scalar() or 0
+        for start in range(0, max_id, batch_size):
+            result = db.session.execute(
+                db.update(model)
+                .where(model.id > start, model.id <= start + batch_size)
+                .values(**_aggregate_values(model))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+    return updated
+
+
+UPSERT_DIALECTS = {'postgresql': postgresql, 'sqlite': sqlite}
+
+
+def upsert_ratings(content_type, rows):
+    """
+    Вставляет оценки одним executemany; существующая оценка пользователя заменяется
+    (INSERT ... ON CONFLICT по уникальному индексу ux_rating_user_movie/ux_rating_user_show).
+
+    Обработчики событий Rating при этом не вызываются: агрегаты контента
+    нужно обновить отдельно, например rebuild_rating_aggregates().
+
+    :param content_type: 'movie' или 'show' — у каждого типа свой уникальный индекс
+    :param rows: Список {'user_id', 'movie_id' или 'show_id', 'rating'}
+    """
+    content_fk = Rating.movie_id if content_type == 'movie' else Rating.show_id
+    # В одном INSERT PostgreSQL не даёт обновить строку дважды — оставляем последнюю оценку
+    unique_rows = list({(row['user_id'], row[content_fk.key]): row for row in rows}.values())
+    if not unique_rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        raise NotImplementedError(f"Rating upsert is not supported for {dialect}")
+    statement = UPSERT_DIALECTS[dialect].insert(Rating)
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[Rating.user_id, content_fk],
+            set_={'rating': statement.excluded.rating},
+        ),
+        unique_rows,
+    )
+
+
+def _parse_entries(entries):
+    # Последняя оценка одного и того же контента в пачке побеждает, как и в upsert_ratings
+    if not isinstance(entries, list) or not entries:
+        raise RatingError('Ratings must be a non-empty list')
+    max_size = current_app.config['RATING_BATCH_MAX_SIZE']
+    if len(entries) > max_size:
+        raise RatingError(f'At most {max_size} ratings per request')
+    parsed, errors = {}, []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or entry.get('content_type') not in CONTENT_MODELS:
+            errors.append({'index': index, 'error': 'Invalid content type'})
+            continue
+        content_type = entry['content_type']
+        try:
+            content_id = int(entry.get('content_id'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Invalid content id'})
+            continue
+        try:
+            value = int(entry.get('rating'))
+        except (TypeError, ValueError):
+            value = 0
+        if not 1 <= value <= 10:
+            errors.append({'index': index, 'error': 'Rating must be between 1 and 10'})
+        else:
+            parsed.pop((content_type, content_id), None)
+            parsed[(content_type, content_id)] = (index, value)
+    if errors:
+        raise RatingError('Invalid ratings', errors=errors)
+    return parsed
+
+
+def _content_select(ids, *columns):
+    """
+    Один запрос по контенту всех типов из ids: строки (content_type, id, *columns).
+
+    :param columns: Имена атрибутов модели
+    """
+    return db.union_all(*(
+        db.select(
+            db.literal(content_type).label('content_type'),
+            CONTENT_MODELS[content_type].id,
+            *(getattr(CONTENT_MODELS[content_type], column) for column in columns),
+        ).where(CONTENT_MODELS[content_type].id.in_(content_ids))
+        for content_type, content_ids in ids.items()
+    ))
+
+
+def rate_content_batch(user_id, entries):
+    """
+    Сохраняет пачку оценок пользователя в одной транзакции.
+
+    Оценки пишутся через upsert_ratings (INSERT ... ON CONFLICT), агрегаты
+    rating_sum/rating_count затронутого контента пересчитываются одним UPDATE на тип
+    по таблице rating, а итоговые агрегаты читаются одним запросом — число запросов
+    не зависит от размера пачки. Кэш каталога сбрасывает вызывающий код после commit.
+
+    :param entries: Список {'content_type', 'content_id', 'rating'}
+    :return: Список {'content_type', 'content_id', 'rating', 'average_rating', 'rating_count'}
+             по одной записи на контент в порядке пачки
+    :raises RatingError: Некорректная запись (400) или несуществующий контент (404)
+    """
+    parsed = _parse_entries(entries)
+    ids = {content_type: [] for content_type in CONTENT_MODELS}
+    for content_type, content_id in parsed:
+        ids[content_type].append(content_id)
+    ids = {content_type: content_ids for content_type, content_ids in ids.items() if content_ids}
+
+    existing = {tuple(row) for row in db.session.execute(_content_select(ids))}
+    missing = [
+        {'index': index, 'error': 'Content not found'}
+        for key, (index, _) in parsed.items() if key not in existing
+    ]
+    if missing:
+        raise RatingError('Content not found', status=404, errors=sorted(missing, key=lambda e: e['index']))
+
+    for content_type, content_ids in ids.items():
+        model = CONTENT_MODELS[content_type]
+        content_fk = f'{content_type}_id'
+        upsert_ratings(content_type, [
+            {'user_id': user_id, content_fk: content_id, 'rating': parsed[(content_type, content_id)][1]}
+            for content_id in content_ids
+        ])
+
+        # Агрегаты пересчитываются по таблице, а не сдвигаются на дельту: дельта по прежней
+        # оценке теряет одновременную оценку из другой транзакции. Блокировка строк контента
+        # (в порядке id — без взаимоблокировок) ждёт такую транзакцию, и в READ COMMITTED
+        # следующий UPDATE уже видит её оценки; SQLite и так сериализует запись
+        db.session.execute(
+            db.select(model.id).where(model.id.in_(content_ids)).order_by(model.id).with_for_update()
+        ).all()
+        db.session.execute(
+            db.update(model)
+            .where(model.id.in_(content_ids))
+            .values(**_aggregate_values(model))
+            .execution_options(synchronize_session=False)
+        )
+        invalidate_recommendations(user_id, content_type, content_ids=content_ids)
+
+    aggregates = {
+        (content_type, content_id): (average_rating, rating_count)
+        for content_type, content_id, average_rating, rating_count in db.session.execute(
+            _content_select(ids, 'average_rating', 'rating_count')
+        )
+    }
+    db.session.commit()
+    return [
+        {
+            'content_type': content_type,
+            'content_id': content_id,
+            'rating': value,
+            'average_rating': aggregates[(content_type, content_id)][0],
+            'rating_count': aggregates[(content_type, content_id)][1],
+        }
+        for (content_type, content_id), (_, value) in sorted(parsed.items(), key=lambda item: item[1][0])
+    ]
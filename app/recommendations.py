@@ -0,0 +1,241 @@
+import heapq
+import math
+import uuid
+from collections import defaultdict
+
+from flask import current_app
+
+from app.cache import catalog_version, get_cache
+from app.extensions import db
+from app.models import CONTENT_MODELS, Rating, WatchHistory, UserPreference, Recommendation
+from app.genres import genre_filter
+
+
+RECOMMENDATIONS_VERSION_KEY = 'recommendations-version'
+RECOMMENDATIONS_VERSION_TTL = 60 * 60 * 24 * 365
+
+
+def _version():
+    # Версия входит в ключи списков: после build_recommendations они все неактуальны,
+    # а очищать общий кэш целиком нельзя — в нём страницы и пользователи
+    cache = get_cache()
+    version = cache.get(RECOMMENDATIONS_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(RECOMMENDATIONS_VERSION_KEY, version, ttl=RECOMMENDATIONS_VERSION_TTL)
+    return version
+
+
+def _cache_key(user_id, content_type):
+    return ('recommendations', _version(), user_id, content_type)
+
+
+def _top_ids(model, limit, genre=None):
+    query = db.session.query(model.id)
+    if genre:
+        query = query.filter(genre_filter(model, genre))
+    return [row.id for row in query.order_by(model.external_rating.desc()).limit(limit)]
+
+
+def get_recommendations(user_id, content_type):
+    """
+    Возвращает рекомендации пользователю из предрасчитанной таблицы.
+
+    Список id хранится в общем кэше приложения (CACHE_BACKEND), поэтому при попадании
+    загрузка стоит один запрос по первичному ключу — как у анонимной главной страницы,
+    а сброс из любого процесса (исполнитель задач, команды flask) виден всем воркерам.
+    Пользователям без рекомендаций отдаётся общий топ; его ключ включает catalog_version(),
+    поэтому новый и переоценённый контент попадает в топ сразу после invalidate_catalog.
+
+    :param user_id: Идентификатор пользователя
+    :param content_type: Тип контента ('movie' или 'show')
+    :return: Список объектов Movie/Show в порядке рекомендаций
+    """
+    model = CONTENT_MODELS[content_type]
+    cache = get_cache()
+    ttl = current_app.config['RECOMMENDATIONS_CACHE_TTL']
+    key = _cache_key(user_id, content_type)
+
+    ids = cache.get(key)
+    if ids is None:
+        ids = [
+            row.content_id for row in
+            db.session.query(Recommendation.content_id)
+            .filter_by(user_id=user_id, content_type=content_type)
+            .order_by(Recommendation.rank)
+        ]
+        cache.set(key, ids, ttl=ttl)
+    if not ids:
+        top_key = ('recommendations-top', catalog_version(), content_type)
+        ids = cache.get(top_key)
+        if ids is None:
+            ids = _top_ids(model, current_app.config['RECOMMENDATIONS_LIMIT'])
+            cache.set(top_key, ids, ttl=ttl)
+
+    items = {item.id: item for item in model.query.filter(model.id.in_(ids))}
+    return [items[content_id] for content_id in ids if content_id in items]
+
+
+def invalidate_recommendations(user_id, content_type=None, content_id=None, content_ids=None):
+    """
+    Сбрасывает кэш рекомендаций пользователя после оценки или просмотра.
+
+    Если передан контент, он убирается из предрасчитанного списка в текущей
+    транзакции (commit остаётся за вызывающим кодом).
+
+    :param content_ids: Несколько id контента одного типа — удаляются одним запросом
+    """
+    cache = get_cache()
+    for cached_type in CONTENT_MODELS:
+        cache.delete(_cache_key(user_id, cached_type))
+
+    if content_type and content_id:
+        Recommendation.query.filter_by(
+            user_id=user_id, content_type=content_type, content_id=content_id
+        ).delete(synchronize_session=False)
+    if content_type and content_ids:
+        Recommendation.query.filter(
+            Recommendation.user_id == user_id,
+            Recommendation.content_type == content_type,
+            Recommendation.content_id.in_(content_ids),
+        ).delete(synchronize_session=False)
+
+
+def _interactions(content_type):
+    """
+    Подзапрос уникальных пар (user_id, content_id) из оценок и истории просмотров.
+    """
+    rating_fk = getattr(Rating, f'{content_type}_id')
+    history_fk = getattr(WatchHistory, f'{content_type}_id')
+    return db.union(
+        db.select(Rating.user_id.label('user_id'), rating_fk.label('content_id'))
+        .where(rating_fk.isnot(None)),
+        db.select(WatchHistory.user_id.label('user_id'), history_fk.label('content_id'))
+        .where(history_fk.isnot(None)),
+    )
+
+
+def _item_neighbours(content_type, neighbours):
+    """
+    Считает item-item сходство по совместной встречаемости одним группирующим запросом.
+
+    Сходство нормализуется косинусом: cooc(a, b) / sqrt(pop(a) * pop(b)).
+    Для каждого элемента сохраняются только `neighbours` ближайших соседей.
+    """
+    interactions = _interactions(content_type)
+    sub = interactions.subquery()
+    popularity = dict(
+        db.session.execute(
+            db.select(sub.c.content_id, db.func.count()).group_by(sub.c.content_id)
+        ).all()
+    )
+
+    a = interactions.subquery('a')
+    b = interactions.subquery('b')
+    pairs = db.session.execute(
+        db.select(a.c.content_id, b.c.content_id, db.func.count())
+        .join(b, db.and_(a.c.user_id == b.c.user_id, a.c.content_id != b.c.content_id))
+        .group_by(a.c.content_id, b.c.content_id)
+        .execution_options(yield_per=10000)
+    )
+
+    similar = defaultdict(list)
+    for item_id, other_id, cooc in pairs:
+        score = cooc / math.sqrt(popularity[item_id] * popularity[other_id])
+        heap = similar[item_id]
+        if len(heap) < neighbours:
+            heapq.heappush(heap, (score, other_id))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, other_id))
+    return similar
+
+
+def _iter_user_items(content_type):
+    """
+    Отдаёт (user_id, set(content_id)) по одному пользователю, не загружая всё в память.
+    """
+    sub = _interactions(content_type).subquery()
+    rows = db.session.execute(
+        db.select(sub.c.user_id, sub.c.content_id)
+        .order_by(sub.c.user_id)
+        .execution_options(yield_per=10000)
+    )
+    current_user_id, items = None, set()
+    for user_id, content_id in rows:
+        if user_id != current_user_id and items:
+            yield current_user_id, items
+            items = set()
+        current_user_id = user_id
+        items.add(content_id)
+    if items:
+        yield current_user_id, items
+
+
+def _rank_for_user(user_id, content_type, seen, similar, fallback, limit):
+    scores = defaultdict(float)
+    for item_id in seen:
+        for score, other_id in similar.get(item_id, ()):
+            if other_id not in seen:
+                scores[other_id] += score
+
+    ranked = heapq.nlargest(limit, scores.items(), key=lambda pair: pair[1])
+    chosen = [content_id for content_id, _ in ranked]
+    for content_id in fallback:
+        if len(chosen) >= limit:
+            break
+        if content_id not in seen and content_id not in chosen:
+            chosen.append(content_id)
+
+    return [
+        {
+            'user_id': user_id,
+            'content_type': content_type,
+            'content_id': content_id,
+            'rank': rank,
+            'score': scores.get(content_id, 0.0),
+        }
+        for rank, content_id in enumerate(chosen)
+    ]
+
+
+def build_recommendations(limit=10, neighbours=50):
+    """
+    Офлайн-построение рекомендаций для всех пользователей.
+
+    Кандидаты берутся из соседей просмотренного/оценённого контента, список
+    дополняется лучшим контентом любимого жанра (UserPreference) и общим топом.
+    Таблица recommendation перезаписывается в одной транзакции.
+
+    :param limit: Количество рекомендаций каждого типа на пользователя
+    :param neighbours: Количество соседей, хранимых для каждого элемента
+    :return: Количество записанных рекомендаций
+    """
+    preferred_genres = dict(
+        db.session.query(UserPreference.user_id, UserPreference.genre)
+        .filter(UserPreference.genre.isnot(None))
+    )
+
+    rows = []
+    for content_type, model in CONTENT_MODELS.items():
+        similar = _item_neighbours(content_type, neighbours)
+        top_ids = _top_ids(model, limit * 2)
+        genre_top = {
+            genre: _top_ids(model, limit * 2, genre=genre)
+            for genre in set(preferred_genres.values())
+        }
+
+        processed = set()
+        for user_id, seen in _iter_user_items(content_type):
+            processed.add(user_id)
+            fallback = genre_top.get(preferred_genres.get(user_id), []) + top_ids
+            rows.extend(_rank_for_user(user_id, content_type, seen, similar, fallback, limit))
+        for user_id in preferred_genres.keys() - processed:
+            fallback = genre_top[preferred_genres[user_id]] + top_ids
+            rows.extend(_rank_for_user(user_id, content_type, set(), similar, fallback, limit))
+
+    db.session.execute(db.delete(Recommendation))
+    if rows:
+        db.session.execute(db.insert(Recommendation), rows)
+    db.session.commit()
+    get_cache().set(RECOMMENDATIONS_VERSION_KEY, uuid.uuid4().hex, ttl=RECOMMENDATIONS_VERSION_TTL)
+    return len(rows)
@@ -1,6 +1,6 @@
 from flask import Blueprint
-from app.models import User
 from app.extensions import login_manager
+from app.identity import load_user as load_cached_user
 
 
 auth = Blueprint("auth", __name__)
@@ -11,4 +11,4 @@ show = Blueprint("show", __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(int(user_id))
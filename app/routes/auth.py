@@ -5,11 +5,17 @@ from app.models import User
 from app.forms import LoginForm, RegisterForm, UpdateProfileForm, ChangePasswordForm
 from app.extensions import db
 from app.routes import auth
-from werkzeug.security import generate_password_hash
-from flask_mail import Message, Mail
+from app.passwords import PasswordHasherBusy
+from app.outbox import enqueue_mail
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired
 
 
+@auth.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    # Хэширование паролей перегружено: отказываем сразу, клиент повторит позже
+    return 'Server is busy, please try again in a few seconds.', 503, {'Retry-After': '5'}
+
+
 @auth.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
     try:
@@ -22,7 +28,7 @@ def reset_password(token):
 
     if request.method == 'POST':
         new_password = request.form.get('new_password')
-        user.password_hash = generate_password_hash(new_password)
+        user.set_password(new_password)
         db.session.commit()
         flash('Password has been reset successfully.', 'success')
         return redirect(url_for('auth.login'))
@@ -38,14 +44,12 @@ def forgot_password():
         if user:
             token = URLSafeTimedSerializer(current_app.config['SECRET_KEY']).dumps(email, salt='password-reset-salt')
             reset_url = url_for('auth.reset_password', token=token, _external=True)
-            msg = Message(
+            # Письмо уходит через очередь, ответ не ждёт SMTP-сервер
+            enqueue_mail(
                 'Password Reset Request',
-                sender='no-reply@example.com',
-                recipients=[email]
+                [email],
+                f'Click the link to reset your password: {reset_url}',
             )
-            msg.body = f'Click the link to reset your password: {reset_url}'
-            mail = Mail(current_app)
-            mail.send(msg)
             flash('Check your email for password reset instructions.', 'info')
         else:
             flash('Email not found.', 'danger')
@@ -58,6 +62,10 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
+            if user.password_needs_rehash():
+                # Параметры хэширования изменились — пересчитываем хэш, пока пароль известен
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             return redirect(url_for('main.index'))
         flash('Invalid email or password', 'danger')
@@ -108,7 +116,7 @@ def view_account():
     if password_form.validate_on_submit():
         if current_user.check_password(password_form.current_password.data):
             # Обновление хэша пароля
-            current_user.password_hash = generate_password_hash(password_form.new_password.data)
+            current_user.set_password(password_form.new_password.data)
             db.session.commit()
             flash('Password updated successfully.', 'success')
         else:
@@ -130,7 +138,7 @@ def change_password():
             return redirect(url_for('auth.change_password'))
 
         # Установка нового пароля
-        current_user.password_hash = generate_password_hash(form.new_password.data)
+        current_user.set_password(form.new_password.data)
         db.session.commit()
         flash('Your password has been updated successfully.', 'success')
         return redirect(url_for('auth.view_account'))
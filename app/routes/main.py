@@ -1,26 +1,58 @@
-from flask import render_template, redirect, request, jsonify, flash, url_for
+import json
+
+from flask import (
+    render_template, redirect, request, jsonify, flash, url_for, abort, current_app, stream_with_context, Response,
+    send_from_directory,
+)
 from flask_login import current_user, login_required
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError
 from app.extensions import db
 from app.routes import main
 from app.forms import CommentForm, MovieForm
-from app.models import Comment, Movie, Show, Episode, Rating
-from app.utils import get_recommended_movies, get_recommended_shows, save_video, get_video_path
+from app.models import Comment, Movie, Show, Episode, UploadSession, Job, CONTENT_MODELS
+from app.utils import get_recommended_movies, get_recommended_shows, save_video
+from app.streaming import send_video
+from app.ratings import RatingError, rate_content_batch
+from app.search import search_content
+from app.pagination import SORT_COLUMNS, keyset_select, paginate_keyset, encode_cursor
+from app.queries import load_watch_content
+from app.uploads import UploadError, create_upload, append_chunk, finalize_upload
+from app.watch_events import record_watch_event
+from app.cache import cached_response, invalidate_catalog
+from app.facets import faceted_search, parse_facet_filters
+from app.comments import COMMENT_SORTS, comments_page, serialize_comment, like_comment, unlike_comment
+from app.profiling import PROMETHEUS_CONTENT_TYPE, metrics_allowed, render_metrics
+from app.thumbnails import ThumbnailError, is_variant_filename, save_thumbnail, thumbnail_dir
+from app.packaging import (
+    PLAYLIST_MIMETYPE, enqueue_packaging, manifest_url, packaging_dir, ready_package, render_master_playlist,
+)
+from app.jobs import FINISHED_STATUSES, serialize_job
+from app.external_ratings import enqueue_rating_fetch
+
+
+API_LIST_FIELDS = ('id', 'title', 'year', 'genre', 'external_rating', 'average_rating', 'thumbnail_url', 'description')
+API_LIST_DEFAULT_FIELDS = 'id,title,year,average_rating,thumbnail_url'
+
+# Токен для fetch-запросов из шаблонов — тот же, что кладёт в формы form.hidden_tag()
+main.add_app_template_global(generate_csrf, 'csrf_token')
 
 
 @main.route('/')
+@cached_response()
 def index():
-    top_movies = Movie.query.order_by(Movie.external_rating.desc()).limit(10).all()
-    top_shows = Show.query.order_by(Show.external_rating.desc()).limit(10).all()
-
     if current_user.is_authenticated:
         user_movies = get_recommended_movies(current_user.id)
         user_shows = get_recommended_shows(current_user.id)
+        fragment_scope = None
     else:
-        user_movies = top_movies
-        user_shows = top_shows
+        # Запросы не выполняются заранее: при попадании в кэш фрагментов они не нужны
+        user_movies = Movie.query.order_by(Movie.external_rating.desc()).limit(10)
+        user_shows = Show.query.order_by(Show.external_rating.desc()).limit(10)
+        fragment_scope = 'anonymous'
 
     return render_template(
-        'index.html', top_movies=user_movies, top_shows=user_shows
+        'index.html', top_movies=user_movies, top_shows=user_shows, fragment_scope=fragment_scope
     )
 
 
@@ -28,15 +60,61 @@ def index():
 def content_list():
     content_type = request.args.get('type', 'movie')  # movie или show
     query = request.args.get('query', '').strip()
+    sort = request.args.get('sort', 'rating')  # rating или year
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', 1, type=int)
+    model = CONTENT_MODELS.get(content_type)
 
-    if content_type == 'movie':
-        content = Movie.query.filter(Movie.title.ilike(f"%{query}%")).all() if query else Movie.query.all()
-    elif content_type == 'show':
-        content = Show.query.filter(Show.title.ilike(f"%{query}%")).all() if query else Show.query.all()
-    else:
+    content, next_cursor, has_next = [], None, False
+    if model is None or sort not in SORT_COLUMNS:
         content = []
+    elif query:
+        content, has_next = search_content(query, content_type, page=page, per_page=current_app.config['SEARCH_PER_PAGE'])
+    else:
+        try:
+            content, next_cursor = paginate_keyset(model, sort, cursor, current_app.config['LIST_PER_PAGE'])
+        except ValueError:
+            abort(400)
+
+    return render_template(
+        'list.html', content=content, content_type=content_type, query=query, sort=sort,
+        next_cursor=next_cursor, page=page, has_next=has_next
+    )
+
+
+@main.route('/api/list', methods=['GET'])
+def api_content_list():
+    content_type = request.args.get('type', 'movie')
+    sort = request.args.get('sort', 'rating')
+    model = CONTENT_MODELS.get(content_type)
+    if model is None or sort not in SORT_COLUMNS:
+        return jsonify({'error': 'Unknown content type or sort'}), 400
+
+    fields = [field for field in request.args.get('fields', API_LIST_DEFAULT_FIELDS).split(',') if field]
+    if not fields or any(field not in API_LIST_FIELDS for field in fields):
+        return jsonify({'error': f"Fields must be a subset of: {', '.join(API_LIST_FIELDS)}"}), 400
+
+    limit = request.args.get('limit', current_app.config['LIST_PER_PAGE'], type=int)
+    limit = min(max(limit, 1), current_app.config['LIST_MAX_PER_PAGE'])
+    columns = [getattr(model, field).label(field) for field in fields] + [model.id.label('cursor_id')]
+    try:
+        stmt = keyset_select(model, sort, request.args.get('cursor'), limit + 1, columns=columns)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def generate():
+        # Строки отдаются по мере чтения курсора БД, лишняя строка означает наличие следующей страницы
+        yield '{"items":['
+        next_cursor, last = None, None
+        for index, row in enumerate(db.session.execute(stmt.execution_options(yield_per=100))):
+            if index == limit:
+                next_cursor = encode_cursor(last.sort_key, last.cursor_id)
+                break
+            yield (',' if index else '') + json.dumps({field: row._mapping[field] for field in fields})
+            last = row
+        yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
 
-    return render_template('list.html', content=content, content_type=content_type)
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
 
 
 @main.route("/watch/<content_type>/<int:content_id>", methods=["GET", "POST"])
@@ -47,19 +125,22 @@ def watch(content_type, content_id):
     seasons = None
     selected_episode = None
 
-    if content_type == "movie":
-        content = Movie.query.get_or_404(content_id)
-        comments = Comment.query.filter_by(movie_id=content_id).all()
-    elif content_type == "show":
-        content = Show.query.get_or_404(content_id)
-        comments = Comment.query.filter_by(show_id=content_id).all()
+    if content_type not in ("movie", "show"):
+        abort(404)
+
+    content = load_watch_content(content_type, content_id)
+    if content_type == "show":
         seasons = content.seasons
 
-        # Выбор серии
+        # Выбор серии среди уже загруженных сезонов, без отдельного запроса
         season_id = request.args.get("season", type=int)
         episode_id = request.args.get("episode", type=int)
         if season_id and episode_id:
-            selected_episode = Episode.query.filter_by(season_id=season_id, id=episode_id).first()
+            selected_episode = next(
+                (episode for season in seasons if season.id == season_id
+                 for episode in season.episodes if episode.id == episode_id),
+                None
+            )
         elif seasons:
             selected_episode = seasons[0].episodes[0] if seasons[0].episodes else None
 
@@ -75,31 +156,70 @@ def watch(content_type, content_id):
         db.session.commit()
         return redirect(request.url)
 
-    video_path = get_video_path(content_type, content.title, content.season_number if content_type == 'show' else None)
+    # Встраивается только первая страница, остальные догружаются через get_comments
+    comments_sort = request.args.get("comments_sort", "new")
+    if comments_sort not in COMMENT_SORTS:
+        comments_sort = "new"
+    comments, comments_next_cursor = comments_page(
+        content_type, content.id, comments_sort, per_page=current_app.config['COMMENTS_PER_PAGE']
+    )
+
+    if current_user.is_authenticated:
+        record_watch_event(current_user.id, content_type, content.id)
+
+    video_url = hls_url = None
+    if content_type == "movie":
+        video_url = url_for('main.stream_video', content_type='movie', content_id=content.id)
+        hls_url = manifest_url(content)
+    elif selected_episode:
+        video_url = url_for('main.stream_video', content_type='episode', content_id=selected_episode.id)
+        hls_url = manifest_url(selected_episode)
+
+    # Задачи, поставленные при добавлении контента; /jobs/<id> отдаёт статус только владельцу
+    job_urls = [
+        url_for('main.job_status', job_id=job_id) for job_id in request.args.getlist('job', type=int)
+    ] if current_user.is_authenticated else []
+
     return render_template(
         "watch.html",
         content=content,
+        content_type=content_type,
         form=form,
         comments=comments,
+        comments_sort=comments_sort,
+        comments_next_cursor=comments_next_cursor,
         seasons=seasons,
         selected_episode=selected_episode,
-        video_path=video_path
+        video_url=video_url,
+        hls_url=hls_url,
+        job_urls=job_urls
     )
 
 
+@main.route('/stream/<content_type>/<int:content_id>', methods=['GET'])
+def stream_video(content_type, content_id):
+    if content_type == 'movie':
+        content = Movie.query.get_or_404(content_id)
+    elif content_type == 'episode':
+        content = Episode.query.get_or_404(content_id)
+    else:
+        abort(404)
+
+    return send_video(content.video_url)
+
+
 @main.route('/search', methods=['GET'])
 def search():
     query = request.args.get('query', '').strip()
     search_type = request.args.get('type', 'movie').strip()
+    page = request.args.get('page', 1, type=int)
 
-    if search_type == 'movie':
-        results = Movie.query.filter(Movie.title.ilike(f"%{query}%")).all()
-    elif search_type == 'show':
-        results = Show.query.filter(Show.title.ilike(f"%{query}%")).all()
-    else:
-        results = []
+    results, has_next = search_content(query, search_type, page=page, per_page=current_app.config['SEARCH_PER_PAGE'])
 
-    return render_template('search_results.html', results=results, search_type=search_type)
+    return render_template(
+        'search_results.html', results=results, search_type=search_type,
+        query=query, page=page, has_next=has_next
+    )
 
 
 @main.route('/recommendations', methods=['GET'])
@@ -119,31 +239,33 @@ def recommendations():
 @main.route('/rate/<content_type>/<int:content_id>', methods=['POST'])
 @login_required
 def rate_content(content_type, content_id):
+    if content_type not in CONTENT_MODELS:
+        return jsonify({'error': 'Content not found'}), 404
+    entry = {'content_type': content_type, 'content_id': content_id, 'rating': request.json.get('rating')}
     try:
-        rating_value = int(request.json.get('rating', 0))
-        if not (1 <= rating_value <= 10):
-            raise ValueError("Invalid rating")
-    except ValueError:
-        return jsonify({'error': 'Rating must be between 1 and 10'}), 400
+        result, = rate_content_batch(current_user.id, [entry])
+    except RatingError as e:
+        message = e.errors[0]['error'] if e.errors else e.message
+        return jsonify({'error': message}), e.status
+    invalidate_catalog()
 
-    content = None
-    if content_type == 'movie':
-        content = Movie.query.get_or_404(content_id)
-    elif content_type == 'show':
-        content = Show.query.get_or_404(content_id)
+    return jsonify({'message': 'Rating submitted', 'average_rating': result['average_rating']}), 200
 
-    if not content:
-        return jsonify({'error': 'Content not found'}), 404
 
-    rating = Rating.query.filter_by(user_id=current_user.id, **{f"{content_type}_id": content_id}).first()
-    if rating:
-        rating.rating = rating_value
-    else:
-        rating = Rating(user_id=current_user.id, **{f"{content_type}_id": content_id}, rating=rating_value)
-        db.session.add(rating)
-    db.session.commit()
+@main.route('/rate/batch', methods=['POST'])
+@login_required
+def rate_batch():
+    """
+    Пачка оценок {"ratings": [{"content_type", "content_id", "rating"}, ...]} одной транзакцией.
+    """
+    payload = request.get_json(silent=True)
+    try:
+        results = rate_content_batch(current_user.id, payload.get('ratings') if isinstance(payload, dict) else None)
+    except RatingError as e:
+        return jsonify({'error': e.message, 'errors': e.errors}), e.status
+    invalidate_catalog()
 
-    return jsonify({'message': 'Rating submitted', 'average_rating': content.average_rating}), 200
+    return jsonify({'message': f'{len(results)} ratings submitted', 'ratings': results}), 200
 
 
 @main.route('/add/<content_type>', methods=['GET', 'POST'])
@@ -152,78 +274,294 @@ def add_content(content_type):
     form = MovieForm()
     if form.validate_on_submit():
         video_file = form.video.data
-        thumbnail_file = form.thumbnail.data
+
+        if content_type not in ('movie', 'show'):
+            flash('Invalid content type.', 'danger')
+            return redirect(url_for('main.index'))
+        try:
+            # Уменьшенные варианты обложки по хэшу содержимого, см. app/thumbnails.py
+            thumbnail_fields = save_thumbnail(form.thumbnail.data)
+        except ThumbnailError:
+            flash('Thumbnail is not a valid image.', 'danger')
+            return render_template('add_content.html', form=form, content_type=content_type)
 
         if content_type == 'movie':
             video_path = save_video(video_file, content_type)
-            thumbnail_path = save_video(thumbnail_file, 'movie')  # Сохраняем изображение
             content = Movie(
                 title=form.title.data,
                 description=form.description.data,
                 video_url=video_path,
-                thumbnail_url=thumbnail_path,
                 genre=form.genre.data,
-                year=form.year.data
+                year=form.year.data,
+                **thumbnail_fields
             )
-        elif content_type == 'show':
+        else:
             season_number = request.form.get('season_number', type=int)
             video_path = save_video(video_file, content_type, season=season_number)
-            thumbnail_path = save_video(thumbnail_file, 'show')  # Сохраняем изображение
             content = Show(
                 title=form.title.data,
                 description=form.description.data,
                 genre=form.genre.data,
                 year=form.year.data,
-                thumbnail_url=thumbnail_path
+                **thumbnail_fields
             )
-        else:
-            flash('Invalid content type.', 'danger')
-            return redirect(url_for('main.index'))
 
         db.session.add(content)
         db.session.commit()
+        invalidate_catalog()
+        if content_type == 'movie':
+            enqueue_packaging('movie', content.id)
+        job = enqueue_rating_fetch(content_type, content.id, user_id=current_user.id)
         flash(f'{content_type.capitalize()} added successfully.', 'success')
-        return redirect(url_for('main.index'))
+        # Страница просмотра показывает статус фоновых задач, см. components/job_status.html
+        return redirect(url_for('main.watch', content_type=content_type, content_id=content.id, job=job.id))
     return render_template('add_content.html', form=form, content_type=content_type)
 
 
-@main.route('/search', methods=['GET'])
+def _upload_error(error):
+    return jsonify({'error': error.message, **error.extra}), error.status
+
+
+def _upload_state(upload):
+    return {
+        'upload_id': upload.id,
+        'offset': upload.received,
+        'size': upload.total_size,
+        'status': upload.status,
+        'chunk_size': current_app.config['UPLOAD_MAX_CHUNK_SIZE'],
+    }
+
+
+@main.route('/upload/init/<content_type>', methods=['POST'])
+@login_required
+def upload_init(content_type):
+    try:
+        upload = create_upload(current_user.id, content_type, request.get_json(silent=True) or {})
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(_upload_state(upload)), 201
+
+
+@main.route('/upload/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    # Используется клиентом для продолжения загрузки после обрыва соединения
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    return jsonify(_upload_state(upload))
+
+
+@main.route('/upload/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required', 'offset': upload.received}), 400
+
+    try:
+        received = append_chunk(
+            upload, offset, request.stream, request.content_length,
+            checksum=request.headers.get('X-Chunk-SHA256')
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({'offset': received, 'size': upload.total_size})
+
+
+@main.route('/upload/<upload_id>/finalize', methods=['POST'])
+@login_required
+def upload_finalize(upload_id):
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    try:
+        job = finalize_upload(upload, thumbnail=request.files.get('thumbnail'))
+    except UploadError as e:
+        return _upload_error(e)
+    job_url = url_for('main.job_status', job_id=job.id)
+    if job.status != 'succeeded':
+        # Файл ещё проверяется: клиент опрашивает задачу или повторяет finalize
+        response = jsonify({
+            **_upload_state(upload), 'job': job_url,
+            'error': job.last_error if job.status == 'failed' else None,
+        })
+        response.status_code = 422 if job.status == 'failed' else 202
+        response.headers['Location'] = job_url
+        if job.status != 'failed':
+            response.headers['Retry-After'] = str(current_app.config['JOBS_POLL_INTERVAL'])
+        return response
+
+    result = job.result
+    return jsonify({
+        'message': f'{upload.content_type.capitalize()} added successfully.',
+        'content_id': result['content_id'],
+        'url': url_for('main.watch', content_type=upload.content_type, content_id=result['content_id']),
+        # Клиент опрашивает статус задач, пока они не завершатся
+        'jobs': [url_for('main.job_status', job_id=job_id) for job_id in result['jobs']],
+    }), 201
+
+
+@main.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    response = jsonify(serialize_job(job))
+    if job.status not in FINISHED_STATUSES:
+        response.headers['Retry-After'] = str(current_app.config['JOBS_POLL_INTERVAL'])
+    return response
+
+
+@main.route('/search/advanced', methods=['GET'])
 def advanced_search():
     content_type = request.args.get('type', 'movie')
-    genre = request.args.get('genre')
-    min_rating = request.args.get('min_rating', type=float)
-    max_rating = request.args.get('max_rating', type=float)
-    year = request.args.get('year', type=int)
+    if content_type not in CONTENT_MODELS:
+        abort(404)
+    filters = parse_facet_filters(request.args)
+    try:
+        results, next_cursor, total, facets = faceted_search(
+            content_type, filters, request.args.get('cursor'), current_app.config['SEARCH_PER_PAGE']
+        )
+    except ValueError:
+        abort(400)
 
-    query = Movie.query if content_type == 'movie' else Show.query
+    def search_url(**changes):
+        # Ссылка на ту же выдачу с изменёнными фильтрами; None убирает фильтр
+        args = {**filters, 'type': content_type, **changes}
+        return url_for('main.advanced_search', **{name: value for name, value in args.items() if value is not None})
 
-    if genre:
-        query = query.filter(Movie.genre.ilike(f"%{genre}%"))
-    if min_rating:
-        query = query.filter(Movie.average_rating >= min_rating)
-    if max_rating:
-        query = query.filter(Movie.average_rating <= max_rating)
-    if year:
-        query = query.filter(Movie.year == year)
+    return render_template(
+        'advanced_search.html', results=results, total=total, facets=facets, filters=filters,
+        content_type=content_type, next_cursor=next_cursor, search_url=search_url
+    )
 
-    results = query.all()
-    return render_template('search_results.html', results=results, content_type=content_type)
+
+@main.route('/api/search/advanced', methods=['GET'])
+def api_advanced_search():
+    content_type = request.args.get('type', 'movie')
+    if content_type not in CONTENT_MODELS:
+        return jsonify({'error': 'Unknown content type'}), 400
+    filters = parse_facet_filters(request.args)
+    per_page = request.args.get('per_page', current_app.config['SEARCH_PER_PAGE'], type=int)
+    per_page = min(max(per_page, 1), current_app.config['LIST_MAX_PER_PAGE'])
+
+    try:
+        results, next_cursor, total, facets = faceted_search(
+            content_type, filters, request.args.get('cursor'), per_page
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({
+        'items': [
+            {field: getattr(item, field) for field in API_LIST_FIELDS}
+            for item in results
+        ],
+        'total': total,
+        'next_cursor': next_cursor,
+        'per_page': per_page,
+        'filters': filters,
+        'facets': facets,
+    })
 
 
 @main.route('/comments/<content_type>/<int:content_id>', methods=['GET'])
 def get_comments(content_type, content_id):
-    sort_by = request.args.get('sort_by', 'new')
-    comments = None
+    model = CONTENT_MODELS.get(content_type)
+    if model is None:
+        return jsonify({'error': 'Content not found'}), 404
+    sort = request.args.get('sort', request.args.get('sort_by', 'new'))
+    if sort not in COMMENT_SORTS:
+        return jsonify({'error': f"Sort must be one of: {', '.join(COMMENT_SORTS)}"}), 400
+
+    comment_count = db.session.execute(
+        db.select(model.comment_count).where(model.id == content_id)
+    ).scalar()
+    if comment_count is None:
+        return jsonify({'error': 'Content not found'}), 404
 
-    if content_type == 'movie':
-        comments = Comment.query.filter_by(movie_id=content_id)
-    elif content_type == 'show':
-        comments = Comment.query.filter_by(show_id=content_id)
+    per_page = request.args.get('per_page', current_app.config['COMMENTS_PER_PAGE'], type=int)
+    per_page = min(max(per_page, 1), current_app.config['COMMENTS_MAX_PER_PAGE'])
+    try:
+        comments, next_cursor = comments_page(content_type, content_id, sort, request.args.get('cursor'), per_page)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    return jsonify({
+        'comments': [serialize_comment(comment) for comment in comments],
+        'next_cursor': next_cursor,
+        'count': comment_count,
+    })
 
-    if sort_by == 'popular':
-        comments = comments.order_by(Comment.likes.desc())
-    else:
-        comments = comments.order_by(Comment.timestamp.desc())
 
-    comments = comments.all()
-    return render_template('comments.html', comments=comments, content_type=content_type)
+def _csrf_error():
+    """
+    Проверяет CSRF-токен запроса без формы (заголовок X-CSRFToken или поле csrf_token)
+    так же, как FlaskForm, включая отключение через WTF_CSRF_ENABLED.
+
+    :return: Ответ с ошибкой или None, если токен верный
+    """
+    if not current_app.config.get('WTF_CSRF_ENABLED', True):
+        return None
+    token = request.headers.get('X-CSRFToken') or request.form.get('csrf_token')
+    try:
+        validate_csrf(token)
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    return None
+
+
+@main.route('/comments/<int:comment_id>/like', methods=['POST', 'DELETE'])
+@login_required
+def comment_like(comment_id):
+    error = _csrf_error()
+    if error is not None:
+        return error
+    comment = db.get_or_404(Comment, comment_id)
+    if request.method == 'POST':
+        likes = like_comment(comment, current_user.id)
+    else:
+        likes = unlike_comment(comment, current_user.id)
+    return jsonify({'id': comment.id, 'likes': likes})
+
+
+@main.route('/thumbnails/<path:filename>', methods=['GET'])
+def thumbnail(filename):
+    # Только варианты: исходники и временные файлы каталога не отдаются
+    if not is_variant_filename(filename):
+        abort(404)
+    # Имя файла содержит хэш содержимого — ответ можно кэшировать навсегда
+    response = send_from_directory(thumbnail_dir(), filename, max_age=current_app.config['THUMBNAIL_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@main.route('/hls/<content_type>/<int:content_id>/master.m3u8', methods=['GET'])
+def hls_manifest(content_type, content_id):
+    if content_type not in ('movie', 'episode'):
+        abort(404)
+    package = ready_package(content_type, content_id)
+    if package is None:
+        abort(404)
+    response = Response(render_master_playlist(package), mimetype=PLAYLIST_MIMETYPE)
+    response.set_etag(package.version)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PACKAGING_MANIFEST_MAX_AGE']
+    return response.make_conditional(request)
+
+
+@main.route('/hls/segments/<path:filename>', methods=['GET'])
+def hls_segment(filename):
+    # Путь содержит версию упаковки, поэтому плейлисты вариантов и сегменты не меняются
+    response = send_from_directory(packaging_dir(), filename, max_age=current_app.config['PACKAGING_SEGMENT_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    # Внутренний эндпоинт: для посторонних делаем вид, что его нет
+    if not metrics_allowed():
+        abort(404)
+    body = render_metrics()
+    if body is None:
+        abort(404)
+    return Response(body, mimetype=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,277 @@
+import difflib
+import re
+
+from app.extensions import db
+from app.models import CONTENT_MODELS
+
+
+# rowid в FTS-таблице кодирует тип и id контента: content_id * 2 + KIND
+CONTENT_KINDS = {'movie': 0, 'show': 1}
+
+# Веса колонок для bm25: title, description, genre
+FTS_WEIGHTS = (10.0, 1.0, 3.0)
+MAX_TERMS = 8
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+_fts_ready = set()
+
+
+def _fts_available(connection):
+    """
+    Проверяет, что FTS-таблица создана; положительный ответ запоминается для движка.
+    """
+    url = str(connection.engine.url)
+    if url in _fts_ready:
+        return True
+    exists = connection.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_search'")
+    ).first() is not None
+    if exists:
+        _fts_ready.add(url)
+    return exists
+
+
+def init_search_index():
+    """
+    Создаёт полнотекстовый индекс, если его ещё нет.
+
+    Для SQLite это FTS5-таблица content_search и словарь content_search_vocab
+    (для исправления опечаток). Для Postgres используется GIN-индекс по
+    tsvector-выражению, он создаётся вместе со схемой.
+    """
+    if _dialect() != 'sqlite':
+        return
+
+    with db.engine.begin() as connection:
+        if _fts_available(connection):
+            return
+        connection.execute(db.text(
+            "CREATE VIRTUAL TABLE content_search USING fts5("
+            "title, description, genre, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        connection.execute(db.text(
+            "CREATE VIRTUAL TABLE content_search_vocab USING fts5vocab(content_search, 'row')"
+        ))
+    rebuild_search_index()
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Полностью перестраивает FTS-индекс по таблицам movie и show.
+
+    :return: Количество проиндексированных записей
+    """
+    if _dialect() != 'sqlite':
+        return 0
+
+    indexed = 0
+    with db.engine.begin() as connection:
+        connection.execute(db.text("DELETE FROM content_search"))
+        for content_type, model in CONTENT_MODELS.items():
+            rows = connection.execute(
+                db.select(model.id, model.title, model.description, model.genre)
+                .execution_options(yield_per=batch_size)
+            )
+            for batch in rows.partitions(batch_size):
+                connection.execute(
+                    db.text(
+                        "INSERT INTO content_search (rowid, title, description, genre) "
+                        "VALUES (:rowid, :title, :description, :genre)"
+                    ),
+                    [
+                        {
+                            'rowid': row.id * 2 + CONTENT_KINDS[content_type],
+                            'title': row.title,
+                            'description': row.description,
+                            'genre': row.genre,
+                        }
+                        for row in batch
+                    ],
+                )
+                indexed += len(batch)
+    return indexed
+
+
+def _remove_document(connection, content_type, content_id):
+    connection.execute(
+        db.text("DELETE FROM content_search WHERE rowid = :rowid"),
+        {'rowid': content_id * 2 + CONTENT_KINDS[content_type]},
+    )
+
+
+def _index_document(connection, content_type, target):
+    if connection.dialect.name != 'sqlite' or not _fts_available(connection):
+        return
+    _remove_document(connection, content_type, target.id)
+    connection.execute(
+        db.text(
+            "INSERT INTO content_search (rowid, title, description, genre) "
+            "VALUES (:rowid, :title, :description, :genre)"
+        ),
+        {
+            'rowid': target.id * 2 + CONTENT_KINDS[content_type],
+            'title': target.title,
+            'description': target.description,
+            'genre': target.genre,
+        },
+    )
+
+
+def _register_sync_hooks(content_type, model):
+    @db.event.listens_for(model, 'after_insert')
+    @db.event.listens_for(model, 'after_update')
+    def _content_saved(mapper, connection, target):
+        _index_document(connection, content_type, target)
+
+    @db.event.listens_for(model, 'after_delete')
+    def _content_deleted(mapper, connection, target):
+        if connection.dialect.name == 'sqlite' and _fts_available(connection):
+            _remove_document(connection, content_type, target.id)
+
+
+for _content_type, _model in CONTENT_MODELS.items():
+    _register_sync_hooks(_content_type, _model)
+
+
+def _pg_document(model):
+    return db.func.to_tsvector(
+        'simple',
+        db.func.coalesce(model.title, '') + ' '
+        + db.func.coalesce(model.genre, '') + ' '
+        + db.func.coalesce(model.description, ''),
+    )
+
+
+for _model in CONTENT_MODELS.values():
+    db.Index(
+        f'ix_{_model.__tablename__}_search', _pg_document(_model), postgresql_using='gin'
+    ).ddl_if(dialect='postgresql')
+
+
+def _tokenize(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _term_exists(connection, term):
+    return connection.execute(
+        db.text(
+            "SELECT 1 FROM content_search_vocab "
+            "WHERE term >= :term AND term < :upper LIMIT 1"
+        ),
+        {'term': term, 'upper': term + '\U0010ffff'},
+    ).first() is not None
+
+
+def _close_terms(connection, term, limit=3):
+    """
+    Подбирает похожие слова из словаря индекса для слова с опечаткой.
+
+    Кандидаты ограничены словами на ту же букву и близкой длины, чтобы не
+    перебирать весь словарь.
+    """
+    candidates = connection.execute(
+        db.text(
+            "SELECT term FROM content_search_vocab "
+            "WHERE term >= :lower AND term < :upper "
+            "AND length(term) BETWEEN :min_len AND :max_len LIMIT 5000"
+        ),
+        {
+            'lower': term[0],
+            'upper': chr(ord(term[0]) + 1),
+            'min_len': len(term) - 2,
+            'max_len': len(term) + 2,
+        },
+    ).scalars().all()
+    return difflib.get_close_matches(term, candidates, n=limit, cutoff=0.75)
+
+
+def _fts_match_expression(connection, terms):
+    """
+    Собирает выражение MATCH: каждое слово ищется по префиксу, слова без
+    совпадений в словаре заменяются на OR-группу похожих слов.
+    """
+    groups = []
+    for term in terms:
+        variants = [f'"{term}"*']
+        if not _term_exists(connection, term):
+            variants += [f'"{close}"' for close in _close_terms(connection, term)]
+        groups.append(variants[0] if len(variants) == 1 else f"({' OR '.join(variants)})")
+    return ' AND '.join(groups)
+
+
+def _search_ids_sqlite(content_type, terms, limit, offset):
+    # Поиск не должен ждать единственного соединения записи SQLite
+    connection = db.session().read_connection()
+    if not _fts_available(connection):
+        return None
+    return connection.execute(
+        db.text(
+            "SELECT rowid / 2 FROM content_search "
+            "WHERE content_search MATCH :match AND rowid % 2 = :kind "
+            "ORDER BY bm25(content_search, :w_title, :w_description, :w_genre) "
+            "LIMIT :limit OFFSET :offset"
+        ),
+        {
+            'match': _fts_match_expression(connection, terms),
+            'kind': CONTENT_KINDS[content_type],
+            'w_title': FTS_WEIGHTS[0],
+            'w_description': FTS_WEIGHTS[1],
+            'w_genre': FTS_WEIGHTS[2],
+            'limit': limit,
+            'offset': offset,
+        },
+    ).scalars().all()
+
+
+def _search_ids_postgres(model, terms, limit, offset):
+    document = _pg_document(model)
+    tsquery = db.func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+    return db.session.execute(
+        db.select(model.id)
+        .where(document.op('@@')(tsquery))
+        .order_by(db.func.ts_rank(document, tsquery).desc(), model.id)
+        .limit(limit)
+        .offset(offset)
+    ).scalars().all()
+
+
+def _search_ids_like(model, terms, limit, offset):
+    query = db.select(model.id)
+    for term in terms:
+        query = query.where(model.title.ilike(f"%{term}%"))
+    return db.session.execute(query.order_by(model.id).limit(limit).offset(offset)).scalars().all()
+
+
+def search_content(query, content_type, page=1, per_page=20):
+    """
+    Полнотекстовый поиск по названию, описанию и жанру с ранжированием по релевантности.
+
+    :param query: Строка поиска
+    :param content_type: Тип контента ('movie' или 'show')
+    :param page: Номер страницы (с 1)
+    :param per_page: Размер страницы
+    :return: (список Movie/Show, есть ли следующая страница)
+    """
+    model = CONTENT_MODELS.get(content_type)
+    terms = _tokenize(query)
+    if model is None or not terms:
+        return [], False
+
+    # Берём на одну запись больше, чтобы узнать о следующей странице без COUNT
+    limit, offset = per_page + 1, (max(page, 1) - 1) * per_page
+    ids = None
+    if _dialect() == 'sqlite':
+        ids = _search_ids_sqlite(content_type, terms, limit, offset)
+    elif _dialect() == 'postgresql':
+        ids = _search_ids_postgres(model, terms, limit, offset)
+    if ids is None:
+        ids = _search_ids_like(model, terms, limit, offset)
+
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    items = {item.id: item for item in model.query.filter(model.id.in_(ids))}
+    return [items[content_id] for content_id in ids if content_id in items], has_next
@@ -0,0 +1,184 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.jobs import task, enqueue_job
+
+
+class StorageBackend(ABC):
+    """
+    Хранилище файлов контента. upload принимает файловый объект и ключ вида
+    'папка/имя', возвращает URL (или путь) сохранённого файла.
+    """
+
+    @abstractmethod
+    def upload(self, fileobj, key):
+        pass
+
+    def upload_file(self, path, key):
+        with open(path, 'rb') as f:
+            return self.upload(f, key)
+
+    @abstractmethod
+    def url_for(self, key):
+        pass
+
+
+class S3Storage(StorageBackend):
+    """
+    S3 с одним клиентом на приложение (пул HTTP-соединений переиспользуется)
+    и параллельной multipart-загрузкой через s3transfer.
+    """
+
+    def __init__(self, bucket, region, access_key=None, secret_key=None, base_url=None,
+                 endpoint_url=None, part_size=8 * 1024 * 1024, concurrency=8):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config as BotoConfig
+
+        self.bucket = bucket
+        self.base_url = base_url or f"https://{bucket}.s3.amazonaws.com/"
+        self.client = boto3.client(
+            's3',
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=BotoConfig(max_pool_connections=max(concurrency * 2, 10)),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=concurrency,
+            use_threads=concurrency > 1,
+        )
+
+    def upload(self, fileobj, key):
+        self.client.upload_fileobj(
+            fileobj, self.bucket, key,
+            ExtraArgs={'ACL': 'public-read'},
+            Config=self.transfer_config,
+        )
+        return self.url_for(key)
+
+    def url_for(self, key):
+        return f"{self.base_url}{key}"
+
+
+class LocalStorage(StorageBackend):
+    """
+    Локальная замена S3 для разработки, тестов и бенчмарков.
+
+    Повторяет схему multipart-загрузки: файл читается частями part_size, а части
+    параллельно записываются по своим смещениям (os.pwrite там, где он есть).
+    """
+
+    def __init__(self, root, part_size=8 * 1024 * 1024, concurrency=8):
+        self.root = root
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+    def _write_part(self, fd, lock, data, offset):
+        if hasattr(os, 'pwrite'):
+            os.pwrite(fd, data, offset)
+        else:
+            with lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, data)
+
+    def upload(self, fileobj, key):
+        path = self.url_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+        lock = threading.Lock()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                futures, offset = [], 0
+                for data in iter(lambda: fileobj.read(self.part_size), b''):
+                    futures.append(pool.submit(self._write_part, fd, lock, data, offset))
+                    offset += len(data)
+                    # Не держим в памяти больше частей, чем потоков записи
+                    if len(futures) >= self.concurrency:
+                        futures.pop(0).result()
+                for future in futures:
+                    future.result()
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+        return path
+
+    def url_for(self, key):
+        """
+        Путь файла по ключу. Ключ не должен выводить за пределы корня хранилища.
+
+        :raises ValueError: Ключ с '..', абсолютный или указывающий наружу через ссылку
+        """
+        parts = key.split('/')
+        if not key or '..' in parts or os.path.isabs(key):
+            raise ValueError(f'Invalid storage key: {key!r}')
+        path = os.path.join(self.root, *parts)
+        root = os.path.realpath(self.root)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ValueError(f'Invalid storage key: {key!r}')
+        return path
+
+
+def create_storage(config, instance_path):
+    if config['STORAGE_BACKEND'] == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            config['S3_REGION'],
+            access_key=config['S3_ACCESS_KEY'],
+            secret_key=config['S3_SECRET_KEY'],
+            base_url=config['S3_BASE_URL'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            part_size=config['STORAGE_PART_SIZE'],
+            concurrency=config['STORAGE_CONCURRENCY'],
+        )
+    return LocalStorage(
+        config['STORAGE_LOCAL_ROOT'] or os.path.join(instance_path, 'storage'),
+        part_size=config['STORAGE_PART_SIZE'],
+        concurrency=config['STORAGE_CONCURRENCY'],
+    )
+
+
+def get_storage():
+    """
+    Хранилище текущего приложения; создаётся один раз и переиспользуется между запросами.
+    """
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = create_storage(current_app.config, current_app.instance_path)
+        current_app.extensions['storage'] = storage
+    return storage
+
+
+@task('storage.upload_file')
+def upload_file_task(path, key, remove_after=False):
+    url = get_storage().upload_file(path, key)
+    if remove_after:
+        os.remove(path)
+    return {'url': url}
+
+
+def offload_file(path, key, remove_after=False, user_id=None):
+    """
+    Загружает файл с диска в хранилище фоновой задачей, не задерживая HTTP-ответ.
+
+    Задача хранится в базе, поэтому загрузка переживает перезапуск сервера
+    и повторяется при ошибках хранилища.
+
+    :param path: Путь к файлу на диске (файлы запроса к этому моменту уже закрыты)
+    :param key: Ключ в хранилище
+    :param remove_after: Удалить локальный файл после успешной загрузки
+    :param user_id: Владелец задачи
+    :return: (URL, который будет у файла, Job загрузки)
+    """
+    job = enqueue_job(
+        'storage.upload_file', {'path': path, 'key': key, 'remove_after': remove_after}, user_id=user_id
+    )
+    return get_storage().url_for(key), job
@@ -0,0 +1,224 @@
+import mimetypes
+import mmap
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from flask import Response, abort, current_app, request, send_file
+from werkzeug.http import is_resource_modified, parse_range_header
+from werkzeug.wsgi import wrap_file
+
+
+def get_videos_root():
+    """
+    Корневая директория, из которой разрешено отдавать видеофайлы.
+    """
+    return os.path.realpath(os.path.join(current_app.root_path, 'static/videos'))
+
+
+def video_file_path(video_url):
+    """
+    Преобразует сохранённый в модели путь к видео в абсолютный путь на диске.
+
+    :param video_url: Значение Movie.video_url / Episode.video_url
+    :return: Абсолютный путь или None, если файла нет или он лежит вне static/videos
+    """
+    root = get_videos_root()
+    path = os.path.realpath(os.path.join(root, video_url))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def resolve_video_file(video_url):
+    """
+    То же, что video_file_path, но вместо None возвращает 404.
+    """
+    path = video_file_path(video_url)
+    if path is None:
+        abort(404)
+    return path
+
+
+def _make_etag(stat):
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _resolve_ranges(range_header, size):
+    """
+    Разбирает заголовок Range в список отрезков (start, end), end не включительно.
+
+    Открытые диапазоны (bytes=N-) обрезаются до STREAM_MAX_RANGE_SIZE, соседние отрезки
+    и пересечения после обрезки склеиваются. Заголовок с пересекающимися диапазонами
+    отвергает уже parse_range_header — тогда отдаётся весь файл.
+
+    :return: Список отрезков или None, если заголовок нужно проигнорировать
+    """
+    parsed = parse_range_header(range_header)
+    if parsed is None or parsed.units != 'bytes':
+        return None
+
+    max_range = current_app.config['STREAM_MAX_RANGE_SIZE']
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:  # суффикс: последние N байт
+            start = max(size + start, 0)
+            stop = size
+        elif stop is None:
+            stop = min(size, start + max_range)
+        stop = min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+
+    if len(merged) > current_app.config['STREAM_MAX_RANGES']:
+        return None
+    return merged
+
+
+class _FileRange:
+    """
+    Отрезок открытого файла для wsgi.file_wrapper: сервер с sendfile отправляет
+    length байт с текущей позиции файла, остальные читают не дальше конца отрезка.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._file = f
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _iter_parts(path, parts, chunk_size):
+    """
+    Отдаёт куски файла через mmap, не читая за один раз больше chunk_size байт.
+
+    :param parts: Последовательность bytes (заголовки multipart) или отрезков (start, end)
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, stop = part
+            for offset in range(start, stop, chunk_size):
+                yield mm[offset:min(offset + chunk_size, stop)]
+
+
+def send_video(video_url):
+    """
+    Отдаёт видеофайл с поддержкой Range-запросов (206, multipart/byteranges),
+    If-Range и ETag.
+
+    Полный файл и одиночный диапазон отдаются через wsgi.file_wrapper (sendfile,
+    если сервер его умеет), а при USE_X_SENDFILE вся отдача делегируется фронтовому серверу.
+
+    :param video_url: Значение Movie.video_url / Episode.video_url
+    :return: Response
+    """
+    path = resolve_video_file(video_url)
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = _make_etag(stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if current_app.config.get('USE_X_SENDFILE'):
+        return send_file(path, mimetype=mimetype, conditional=True, etag=etag)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and _if_range_matches(etag, last_modified):
+        ranges = _resolve_ranges(range_header, size)
+        if ranges == []:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+    if not ranges:
+        response = Response(
+            wrap_file(request.environ, open(path, 'rb'), chunk_size),
+            mimetype=mimetype,
+            direct_passthrough=True,
+        )
+        response.content_length = size
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        if 'wsgi.file_wrapper' in request.environ:
+            # Сервер отдаст отрезок через sendfile, минуя буферы Python (gunicorn, uWSGI);
+            # memoryview вместо bytes WSGI-серверы не принимают (PEP 3333)
+            body = wrap_file(request.environ, _FileRange(open(path, 'rb'), start, stop - start), chunk_size)
+        else:
+            body = _iter_parts(path, ranges, chunk_size)
+        response = Response(
+            body,
+            status=206,
+            mimetype=mimetype,
+            direct_passthrough=True,
+        )
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.content_length = stop - start
+    else:
+        boundary = uuid4().hex
+        parts = []
+        for start, stop in ranges:
+            parts.append((
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {mimetype}\r\n'
+                f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+            ).encode('ascii'))
+            parts.append((start, stop))
+        parts.append(f'\r\n--{boundary}--\r\n'.encode('ascii'))
+        response = Response(
+            _iter_parts(path, parts, chunk_size),
+            status=206,
+            mimetype=f'multipart/byteranges; boundary={boundary}',
+            direct_passthrough=True,
+        )
+        response.content_length = sum(
+            len(part) if isinstance(part, bytes) else part[1] - part[0] for part in parts
+        )
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['STREAM_MAX_AGE']
+    return response
+
+
+def _if_range_matches(etag, last_modified):
+    """
+    Проверяет If-Range: при несовпадении Range игнорируется и отдаётся весь файл.
+    """
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
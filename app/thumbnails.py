@@ -0,0 +1,300 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, url_for
+
+
+class ThumbnailError(Exception):
+    """
+    Файл не удалось прочитать как изображение.
+    """
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: дочерние процессы не наследуют потоки и соединения с базой сервера
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def thumbnail_dir():
+    path = current_app.config['THUMBNAIL_DIR'] or os.path.join(current_app.instance_path, 'thumbnails')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def source_dir():
+    path = current_app.config['THUMBNAIL_SOURCE_DIR'] or os.path.join(current_app.instance_path, 'thumbnail-sources')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Имя, которое строит variant_filename; маршрут отдаёт из thumbnail_dir только такие файлы
+VARIANT_FILENAME = re.compile(r'(?P<prefix>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})-\w+-\d+x\d+-q\d+\.[a-z0-9]+')
+
+
+def is_variant_filename(filename):
+    match = VARIANT_FILENAME.fullmatch(filename)
+    return match is not None and match['digest'].startswith(match['prefix'])
+
+
+def _extension(image_format):
+    return 'jpg' if image_format.upper() == 'JPEG' else image_format.lower()
+
+
+def variant_filename(digest, variant):
+    """
+    Имя файла варианта: каталог по первым символам хэша, чтобы не складывать все файлы в один.
+
+    Размер и качество входят в имя: после изменения THUMBNAIL_VARIANTS или THUMBNAIL_QUALITY
+    варианты строятся заново под новыми адресами, а не отдаются из кэша браузеров старыми.
+    """
+    config = current_app.config
+    width, height = config['THUMBNAIL_VARIANTS'][variant]
+    return (
+        f"{digest[:2]}/{digest}-{variant}-{width}x{height}-q{config['THUMBNAIL_QUALITY']}"
+        f".{_extension(config['THUMBNAIL_FORMAT'])}"
+    )
+
+
+def _source_filename(digest, directory=None):
+    # Исходный файл хранится, чтобы перестроить варианты при смене настроек
+    return os.path.join(directory or source_dir(), digest[:2], f"{digest}.source")
+
+
+def render_variant(source_path, target_path, size, image_format, quality):
+    """
+    Уменьшает изображение до размеров size с сохранением пропорций.
+    Выполняется в процессе пула, поэтому принимает только простые аргументы.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # Для JPEG декодер сразу читает уменьшенную копию — в разы быстрее полного декодирования
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image_format.upper() == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # При THUMBNAIL_WORKERS=0 один вариант могут строить несколько потоков процесса
+        tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format=image_format, quality=quality, optimize=True, progressive=True, method=4)
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+def create_thumbnails(fileobj):
+    """
+    Сохраняет варианты обложки из THUMBNAIL_VARIANTS под хэшем содержимого файла.
+
+    Одинаковые файлы дают один набор вариантов, уже готовые варианты не пересчитываются.
+    Исходный файл сохраняется для `flask thumbnails rebuild`.
+    Варианты считаются параллельно в пуле процессов (THUMBNAIL_WORKERS; 0 — в текущем потоке).
+
+    :param fileobj: Загруженный файл или открытый двоичный файл
+    :return: Хэш для поля thumbnail_hash
+    :raises ThumbnailError: Если файл не является изображением
+    """
+    digest = hashlib.sha256()
+    fd, source_path = tempfile.mkstemp(dir=source_dir(), suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        digest = digest.hexdigest()
+        _render_missing_variants(source_path, digest)
+        target = _source_filename(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source_path, target)
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+    return digest
+
+
+def save_thumbnail(fileobj):
+    """
+    Поля обложки для Movie/Show: хэш вариантов и thumbnail_url самого крупного варианта
+    (его получают API и старые клиенты).
+
+    :param fileobj: Загруженный файл или None
+    :raises ThumbnailError: Если файл не является изображением
+    """
+    if not fileobj:
+        return {'thumbnail_hash': None, 'thumbnail_url': ''}
+    return _thumbnail_fields(create_thumbnails(fileobj))
+
+
+def _thumbnail_fields(digest):
+    largest = max(current_app.config['THUMBNAIL_VARIANTS'].items(), key=lambda item: item[1][0])[0]
+    return {
+        'thumbnail_hash': digest,
+        'thumbnail_url': url_for('main.thumbnail', filename=variant_filename(digest, largest)),
+    }
+
+
+def _render_missing_variants(source_path, digest):
+    """
+    :return: Число построенных вариантов
+    """
+    from PIL import Image
+
+    config = current_app.config
+    directory = thumbnail_dir()
+    jobs = [
+        (source_path, os.path.join(directory, *variant_filename(digest, variant).split('/')), tuple(size),
+         config['THUMBNAIL_FORMAT'], config['THUMBNAIL_QUALITY'])
+        for variant, size in config['THUMBNAIL_VARIANTS'].items()
+    ]
+    jobs = [job for job in jobs if not os.path.exists(job[1])]
+    if not jobs:
+        return 0
+    try:
+        if config['THUMBNAIL_WORKERS'] and len(jobs) > 1:
+            pool = _get_pool(config['THUMBNAIL_WORKERS'])
+            futures = [pool.submit(render_variant, *job) for job in jobs]
+            for future in futures:
+                future.result(timeout=config['THUMBNAIL_TIMEOUT'])
+        else:
+            for job in jobs:
+                render_variant(*job)
+    except (BrokenProcessPool, TimeoutError) as e:
+        # Процесс упал или завис на изображении — следующая загрузка получит новый пул
+        _reset_pool()
+        raise ThumbnailError(f"Thumbnail rendering failed: {e!r}")
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # PIL.UnidentifiedImageError — подкласс OSError
+        raise ThumbnailError(f"Invalid image: {e}")
+    return len(jobs)
+
+
+def thumbnail_url(content, variant='card'):
+    """
+    URL обложки нужного размера; для контента без вариантов — исходный thumbnail_url.
+    """
+    if not content.thumbnail_hash:
+        return content.thumbnail_url
+    return url_for('main.thumbnail', filename=variant_filename(content.thumbnail_hash, variant))
+
+
+def thumbnail_srcset(content):
+    """
+    Значение srcset со всеми вариантами, чтобы браузер сам выбрал размер под экран.
+    """
+    if not content.thumbnail_hash:
+        return ''
+    variants = sorted(current_app.config['THUMBNAIL_VARIANTS'].items(), key=lambda item: item[1][0])
+    return ', '.join(f"{thumbnail_url(content, variant)} {size[0]}w" for variant, size in variants)
+
+
+def init_thumbnails(app):
+    app.add_template_filter(thumbnail_url, 'thumbnail')
+    app.add_template_filter(thumbnail_srcset, 'thumbnail_srcset')
+
+
+def _local_thumbnail_path(value):
+    # Старые обложки сохранялись save_video как путь к файлу на диске
+    for path in (value, os.path.join(current_app.root_path, value.lstrip('/'))):
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def _stored_source(digest):
+    """
+    Исходник для перестроения вариантов; для обложек, загруженных до хранения исходников, —
+    самый крупный из имеющихся вариантов.
+    """
+    source = _source_filename(digest)
+    legacy = _source_filename(digest, thumbnail_dir())
+    if os.path.isfile(legacy):
+        # Раньше исходники лежали среди раздаваемых вариантов
+        os.makedirs(os.path.dirname(source), exist_ok=True)
+        os.replace(legacy, source)
+    if os.path.isfile(source):
+        return source
+    directory = os.path.dirname(legacy)
+    variants = [
+        os.path.join(directory, name)
+        for name in (os.listdir(directory) if os.path.isdir(directory) else ())
+        if name.startswith(f"{digest}-") and not name.endswith('.tmp')
+    ]
+    return max(variants, key=os.path.getsize, default=None)
+
+
+def backfill_thumbnails():
+    """
+    Строит варианты для контента, у которого обложка есть только исходным файлом,
+    и недостающие варианты (например, после изменения размеров или качества).
+
+    :return: (обработано, пропущено — файла нет или это не изображение)
+    """
+    from app.extensions import db
+    from app.models import CONTENT_MODELS
+
+    processed = skipped = 0
+    # url_for вне запроса: адрес вариантов относительный, хост не нужен
+    with current_app.test_request_context():
+        for model in CONTENT_MODELS.values():
+            items = db.session.scalars(
+                db.select(model).where(model.thumbnail_hash.is_(None), model.thumbnail_url != '')
+            ).all()
+            for item in items:
+                path = _local_thumbnail_path(item.thumbnail_url)
+                if path is None:
+                    skipped += 1
+                    continue
+                try:
+                    with open(path, 'rb') as f:
+                        fields = save_thumbnail(f)
+                except ThumbnailError:
+                    skipped += 1
+                    continue
+                item.thumbnail_hash = fields['thumbnail_hash']
+                item.thumbnail_url = fields['thumbnail_url']
+                db.session.commit()
+                processed += 1
+
+            items = db.session.scalars(db.select(model).where(model.thumbnail_hash.isnot(None))).all()
+            fields = {}
+            for digest in {item.thumbnail_hash for item in items}:
+                source = _stored_source(digest)
+                if source is None:
+                    skipped += 1
+                    continue
+                try:
+                    processed += bool(_render_missing_variants(source, digest))
+                except ThumbnailError:
+                    skipped += 1
+                    continue
+                fields[digest] = _thumbnail_fields(digest)
+            for item in items:
+                if item.thumbnail_hash in fields:
+                    item.thumbnail_url = fields[item.thumbnail_hash]['thumbnail_url']
+            db.session.commit()
+    return processed, skipped
@@ -0,0 +1,298 @@
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+from werkzeug.utils import secure_filename
+
+from sqlalchemy import update
+
+from app.extensions import db
+from app.forms import MovieForm
+from app.models import Movie, Show, Season, Episode, UploadSession, Job
+from app.utils import get_video_dir
+from app.storage import offload_file
+from app.thumbnails import ThumbnailError, save_thumbnail
+from app.packaging import enqueue_packaging
+from app.external_ratings import enqueue_rating_fetch
+from app.jobs import PermanentJobError, enqueue_job, task
+from app.cache import invalidate_catalog
+
+
+class UploadError(Exception):
+    """
+    Ошибка протокола загрузки; status — HTTP-код ответа, extra — дополнительные поля ответа.
+    """
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def _tmp_dir():
+    path = current_app.config['UPLOAD_TMP_DIR'] or os.path.join(current_app.instance_path, 'uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(upload):
+    return os.path.join(_tmp_dir(), f'{upload.id}.part')
+
+
+def _validate_details(content_type, payload):
+    """
+    Проверяет метаданные теми же правилами, что и MovieForm в add_content.
+    """
+    form = MovieForm(
+        formdata=MultiDict({
+            key: str(payload[key]) for key in ('title', 'description', 'genre', 'year')
+            if payload.get(key) is not None
+        }),
+        meta={'csrf': False},
+    )
+    if not form.validate():
+        raise UploadError('Invalid metadata', errors=form.errors)
+
+    details = {
+        'title': form.title.data,
+        'description': form.description.data,
+        'genre': form.genre.data,
+        'year': form.year.data,
+    }
+    if content_type == 'show':
+        try:
+            details['season_number'] = int(payload.get('season_number'))
+        except (TypeError, ValueError):
+            raise UploadError('season_number is required for shows')
+    return details
+
+
+def create_upload(user_id, content_type, payload):
+    """
+    Начинает загрузку: проверяет метаданные и создаёт пустой временный файл.
+
+    :param payload: filename, size, sha256 (необязательно) и поля MovieForm
+    :return: UploadSession
+    """
+    if content_type not in ('movie', 'show'):
+        raise UploadError('Invalid content type', status=404)
+
+    filename = secure_filename(str(payload.get('filename') or ''))
+    if not filename.lower().endswith('.mp4'):
+        raise UploadError('Videos only!')
+    try:
+        total_size = int(payload.get('size'))
+    except (TypeError, ValueError):
+        raise UploadError('size is required')
+    if not 0 < total_size <= current_app.config['UPLOAD_MAX_SIZE']:
+        raise UploadError('Invalid file size', status=413)
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        content_type=content_type,
+        filename=filename,
+        total_size=total_size,
+        received=0,
+        sha256=(payload.get('sha256') or '').lower() or None,
+        details=_validate_details(content_type, payload),
+    )
+    open(part_path(upload), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Дописывает часть файла с позиции offset, читая тело запроса небольшими блоками.
+
+    При несовпадении контрольной суммы части файл обрезается обратно до offset,
+    поэтому клиент может просто повторить ту же часть.
+
+    :param offset: Позиция, с которой клиент отправляет часть (должна совпадать с received)
+    :param stream: Поток тела запроса
+    :param length: Размер части (Content-Length)
+    :param checksum: SHA-256 части в hex
+    :return: Новое значение received
+    """
+    if upload.status != 'pending':
+        raise UploadError('Upload is already finalized', status=409)
+    if offset != upload.received:
+        raise UploadError('Offset mismatch', status=409, offset=upload.received)
+    if length is None or length <= 0 or length > current_app.config['UPLOAD_MAX_CHUNK_SIZE']:
+        raise UploadError('Invalid chunk size', status=413)
+    if offset + length > upload.total_size:
+        raise UploadError('Chunk exceeds declared file size', status=413)
+
+    read_size = current_app.config['UPLOAD_READ_SIZE']
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(upload), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(read_size, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if written != length or (checksum and digest.hexdigest() != checksum.lower()):
+            f.truncate(offset)
+            raise UploadError(
+                'Chunk checksum mismatch' if written == length else 'Incomplete chunk',
+                offset=upload.received,
+            )
+        f.flush()
+        os.fsync(f.fileno())
+
+    upload.received = offset + written
+    db.session.commit()
+    return upload.received
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    read_size = current_app.config['UPLOAD_READ_SIZE']
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(read_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _finalize_key(upload):
+    return f'upload-finalize:{upload.id}'
+
+
+def finalize_upload(upload, thumbnail=None):
+    """
+    Завершает приём файла и ставит задачу uploads.finalize: сверка контрольной
+    суммы многогигабайтного файла не укладывается в таймаут запроса.
+
+    Повторный вызов (клиент не дождался ответа) не начинает завершение заново,
+    а возвращает ту же задачу.
+
+    :param thumbnail: Необязательный файл обложки
+    :return: Job завершения загрузки
+    """
+    if upload.status == 'pending':
+        if upload.received != upload.total_size:
+            raise UploadError('Upload is incomplete', status=409, offset=upload.received)
+        try:
+            thumbnail_fields = save_thumbnail(thumbnail)
+        except ThumbnailError:
+            raise UploadError('Thumbnail is not a valid image', status=422)
+
+        # Условный UPDATE: из двух одновременных запросов загрузку займёт только один,
+        # а enqueue_job зафиксирует его вместе с задачей
+        claimed = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id, UploadSession.status == 'pending')
+            .values(status='finalizing', details={**upload.details, 'thumbnail': thumbnail_fields})
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed:
+            job = enqueue_job(
+                'uploads.finalize', {'upload_id': upload.id},
+                idempotency_key=_finalize_key(upload), user_id=upload.user_id,
+            )
+            db.session.refresh(upload)
+            return job
+        db.session.rollback()
+        db.session.refresh(upload)
+
+    job = db.session.scalar(db.select(Job).filter_by(idempotency_key=_finalize_key(upload)))
+    if job is None:
+        raise UploadError('Upload is already finalized', status=409)
+    return job
+
+
+@task('uploads.finalize')
+def finalize_upload_task(upload_id):
+    """
+    Сверяет контрольную сумму, переносит файл в каталог видео и создаёт
+    Movie или Show (с сезоном и первой серией).
+
+    :return: Тип и id созданного контента и id фоновых задач для опроса статуса
+    """
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None:
+        raise PermanentJobError('Upload not found')
+    if upload.status == 'complete':
+        # Повтор задачи, упавшей после фиксации контента
+        return upload.details['result']
+    if upload.status != 'finalizing':
+        raise PermanentJobError(f'Upload is {upload.status}')
+
+    details = upload.details
+    season_number = details.get('season_number')
+    # Исходное имя файла не уникально: id загрузки не даёт второму movie.mp4 затереть первый
+    stored_name = f'{upload.id}-{upload.filename}'
+    video_path = os.path.join(get_video_dir(upload.content_type, season_number), stored_name)
+    path = part_path(upload)
+    if os.path.exists(path):
+        if upload.sha256 and _file_sha256(path) != upload.sha256:
+            upload.status = 'failed'
+            db.session.commit()
+            os.remove(path)
+            raise PermanentJobError('File checksum mismatch')
+        shutil.move(path, video_path)
+    elif not os.path.exists(video_path):
+        raise PermanentJobError('Uploaded file is missing')
+
+    common = {
+        'title': details['title'],
+        'description': details['description'],
+        'genre': details['genre'],
+        'year': details['year'],
+        **details['thumbnail'],
+    }
+    if upload.content_type == 'movie':
+        content = packaged = Movie(video_url=video_path, **common)
+        db.session.add(content)
+    else:
+        content = Show(**common)
+        season = Season(season_number=season_number, show=content)
+        packaged = Episode(episode_number=1, title=details['title'], video_url=video_path, season=season)
+        db.session.add_all([content, season, packaged])
+
+    db.session.flush()
+    result = {'content_type': upload.content_type, 'content_id': content.id, 'jobs': []}
+    upload.status = 'complete'
+    upload.details = {**details, 'result': result}
+    db.session.commit()
+    invalidate_catalog()
+    enqueue_packaging('movie' if upload.content_type == 'movie' else 'episode', packaged.id)
+
+    jobs = [enqueue_rating_fetch(upload.content_type, content.id, user_id=upload.user_id)]
+    if current_app.config['STORAGE_REPLICATE_VIDEOS']:
+        _, job = offload_file(video_path, f"videos/{upload.content_type}/{stored_name}", user_id=upload.user_id)
+        jobs.append(job)
+    result = {**result, 'jobs': [job.id for job in jobs]}
+    upload.details = {**details, 'result': result}
+    db.session.commit()
+    return result
+
+
+def cleanup_uploads():
+    """
+    Удаляет незавершённые загрузки старше UPLOAD_SESSION_TTL вместе с временными файлами.
+
+    :return: Количество удалённых загрузок
+    """
+    expired_before = datetime.utcnow() - timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+    expired = UploadSession.query.filter(
+        UploadSession.status == 'pending', UploadSession.updated_at < expired_before
+    ).all()
+    for upload in expired:
+        if os.path.exists(part_path(upload)):
+            os.remove(part_path(upload))
+        db.session.delete(upload)
+    db.session.commit()
+    return len(expired)
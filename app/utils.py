@@ -1,19 +1,18 @@
-from app.models import Movie, Show, UserPreference
-import boto3
+from app.recommendations import get_recommendations
+from app.external_ratings import get_external_rating
+from app.storage import get_storage
 from flask import current_app
 import os
 from werkzeug.utils import secure_filename
-import requests
 
 
-def save_video(file, content_type, season=None):
+def get_video_dir(content_type, season=None):
     """
-    Сохраняет видео на локальный сервер в соответствующую директорию.
+    Возвращает (и создаёт) директорию для видео указанного типа.
 
-    :param file: Загружаемый файл
     :param content_type: Тип контента ('movie' или 'show')
     :param season: Номер сезона (только для сериалов)
-    :return: Путь к сохранённому файлу
+    :return: Путь к директории
     """
     base_path = os.path.join(current_app.root_path, 'static/videos')
 
@@ -25,6 +24,19 @@ def save_video(file, content_type, season=None):
         raise ValueError("Invalid content type or missing season for shows")
 
     os.makedirs(save_path, exist_ok=True)
+    return save_path
+
+
+def save_video(file, content_type, season=None):
+    """
+    Сохраняет видео на локальный сервер в соответствующую директорию.
+
+    :param file: Загружаемый файл
+    :param content_type: Тип контента ('movie' или 'show')
+    :param season: Номер сезона (только для сериалов)
+    :return: Путь к сохранённому файлу
+    """
+    save_path = get_video_dir(content_type, season)
     filename = secure_filename(file.filename)
     file_path = os.path.join(save_path, filename)
     file.save(file_path)
@@ -52,42 +64,19 @@ def get_video_path(content_type, title, season=None):
 
 
 def get_recommended_movies(user_id):
-    user_pref = UserPreference.query.filter_by(user_id=user_id).first()
-    if not user_pref:
-        return Movie.query.order_by(Movie.external_rating.desc()).limit(10).all()
-
-    genre_movies = Movie.query.filter(Movie.genre.ilike(f"%{user_pref.genre}%")).order_by(Movie.external_rating.desc()).limit(5).all()
-    top_movies = Movie.query.order_by(Movie.external_rating.desc()).limit(5).all()
-    return {movie.id: movie for movie in (genre_movies + top_movies)}.values()
+    return get_recommendations(user_id, 'movie')
 
 
 def get_recommended_shows(user_id):
-    user_pref = UserPreference.query.filter_by(user_id=user_id).first()
-    if not user_pref:
-        return Show.query.order_by(Show.external_rating.desc()).limit(10).all()
-
-    genre_shows = Show.query.filter(Show.genre.ilike(f"%{user_pref.genre}%")).order_by(Show.external_rating.desc()).limit(5).all()
-    top_shows = Show.query.order_by(Show.external_rating.desc()).limit(5).all()
-    return {show.id: show for show in (genre_shows + top_shows)}.values()
+    return get_recommendations(user_id, 'show')
 
 
 def fetch_external_rating(title):
-    # Пример с IMDb (замените на актуальный API)
-    response = requests.get(f"https://api.example.com/rating?title={title}")
-    if response.status_code == 200:
-        data = response.json()
-        return data.get("rating", 0)
-    return 0
+    # Адрес сервиса задаётся EXTERNAL_RATING_URL, ответы кэшируются в external_rating_cache
+    return get_external_rating(title)
 
 
 def upload_to_s3(file, folder_name):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=current_app.config["S3_ACCESS_KEY"],
-        aws_secret_access_key=current_app.config["S3_SECRET_KEY"],
-        region_name=current_app.config["S3_REGION"],
-    )
-    bucket = current_app.config["S3_BUCKET"]
-    file_key = f"{folder_name}/{file.filename}"
-    s3.upload_fileobj(file, bucket, file_key, ExtraArgs={"ACL": "public-read"})
-    return f"{current_app.config['S3_BASE_URL']}{file_key}"
+    # Клиент и настройки multipart-загрузки переиспользуются, см. app/storage.py
+    file_key = f"{folder_name}/{secure_filename(file.filename)}"
+    return get_storage().upload(file, file_key)
@@ -0,0 +1,181 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import WatchHistory, UserPreference
+from app.recommendations import invalidate_recommendations
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WatchEventBuffer:
+    """
+    Буфер событий просмотра с отложенной записью.
+
+    Обработчик запроса только кладёт событие в очередь в памяти; фоновый поток
+    собирает события в пачки (по размеру или по времени) и пишет их одним
+    INSERT ... VALUES вместе с обновлением UserPreference.last_watched_*.
+    """
+
+    def __init__(self, app, batch_size=500, flush_interval=0.5, max_queue=100000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        atexit.register(self.stop)
+
+    def record(self, user_id, content_type, content_id):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(_make_event(user_id, content_type, content_id))
+        except queue.Full:
+            # При перегрузке теряем событие, но не блокируем запрос
+            self.dropped += 1
+            logger.warning("Watch event queue is full, event dropped")
+
+    def _ensure_started(self):
+        # Поток запускается при первом событии, а не при создании приложения,
+        # чтобы не плодить потоки до fork в многопроцессных серверах
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='watch-events', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            if stopping:
+                # Дописываем всё, что успело накопиться
+                while True:
+                    try:
+                        event = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is not _STOP:
+                        batch.append(event)
+            if batch:
+                for start in range(0, len(batch), self.batch_size):
+                    self._flush_safely(batch[start:start + self.batch_size])
+
+    def _flush_safely(self, batch):
+        try:
+            with self.app.app_context():
+                flush_watch_events(batch)
+        except Exception:
+            logger.exception("Failed to flush %d watch events", len(batch))
+
+    def stop(self, timeout=10):
+        """
+        Останавливает фоновый поток, предварительно записав накопленные события.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+def _make_event(user_id, content_type, content_id):
+    return (
+        user_id,
+        content_id if content_type == 'movie' else None,
+        content_id if content_type == 'show' else None,
+        datetime.utcnow(),
+    )
+
+
+def flush_watch_events(events):
+    """
+    Записывает пачку событий одной транзакцией.
+
+    :param events: Список (user_id, movie_id, show_id, watched_at)
+    """
+    db.session.execute(
+        db.insert(WatchHistory),
+        [
+            {'user_id': user_id, 'movie_id': movie_id, 'show_id': show_id, 'watched_at': watched_at}
+            for user_id, movie_id, show_id, watched_at in events
+        ],
+    )
+
+    # Последний просмотренный фильм и сериал каждого пользователя в пачке
+    last_movie, last_show = {}, {}
+    for user_id, movie_id, show_id, _ in sorted(events, key=lambda event: event[3]):
+        if movie_id is not None:
+            last_movie[user_id] = movie_id
+        if show_id is not None:
+            last_show[user_id] = show_id
+
+    user_ids = last_movie.keys() | last_show.keys()
+    preference_ids = dict(
+        db.session.query(UserPreference.user_id, UserPreference.id)
+        .filter(UserPreference.user_id.in_(user_ids))
+    )
+    movie_updates = [
+        {'id': preference_ids[user_id], 'last_watched_movie': movie_id}
+        for user_id, movie_id in last_movie.items() if user_id in preference_ids
+    ]
+    show_updates = [
+        {'id': preference_ids[user_id], 'last_watched_show': show_id}
+        for user_id, show_id in last_show.items() if user_id in preference_ids
+    ]
+    new_preferences = [
+        {'user_id': user_id, 'last_watched_movie': last_movie.get(user_id), 'last_watched_show': last_show.get(user_id)}
+        for user_id in user_ids if user_id not in preference_ids
+    ]
+    for updates in (movie_updates, show_updates):
+        if updates:
+            db.session.execute(db.update(UserPreference), updates)
+    if new_preferences:
+        db.session.execute(db.insert(UserPreference), new_preferences)
+    db.session.commit()
+
+    for user_id in user_ids:
+        invalidate_recommendations(user_id)
+
+
+def init_watch_events(app):
+    app.extensions['watch_events'] = WatchEventBuffer(
+        app,
+        batch_size=app.config['WATCH_EVENTS_BATCH_SIZE'],
+        flush_interval=app.config['WATCH_EVENTS_FLUSH_INTERVAL'],
+        max_queue=app.config['WATCH_EVENTS_QUEUE_SIZE'],
+    )
+
+
+def record_watch_event(user_id, content_type, content_id):
+    """
+    Регистрирует просмотр. При WATCH_EVENTS_ASYNC = False событие пишется сразу.
+    """
+    if not current_app.config['WATCH_EVENTS_ASYNC']:
+        flush_watch_events([_make_event(user_id, content_type, content_id)])
+        return
+    current_app.extensions['watch_events'].record(user_id, content_type, content_id)
@@ -0,0 +1,314 @@
+"""
+Нагрузочный бенчмарк маршрутов приложения.
+
+Заполняет отдельную базу синтетическим каталогом (benchmarks/seed.py) и гоняет
+смешанную нагрузку из benchmarks/scenarios.py в нескольких процессах через
+тестовый клиент Flask (или по HTTP к запущенному серверу, --url). Для каждого
+маршрута печатаются p50/p95/p99, пропускная способность и число SQL-запросов.
+
+    python -m benchmarks.run --size small --workers 4 --requests 4000
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+
+DEFAULT_TOLERANCE = 0.5  # допустимый рост p95 относительно базового значения
+MIN_SAMPLES = 50  # при меньшем числе запросов p95 маршрута слишком шумный для сравнения
+
+
+def _overrides(database_url):
+    return {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SECRET_KEY': 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+        'CACHE_BACKEND': 'memory',
+    }
+
+
+def prepare_database(options):
+    """
+    Создаёт схему и заполняет базу, если она пустая.
+
+    :return: Размеры каталога
+    """
+    from app import create_app
+    from app.extensions import db
+    from app.migrations import init_schema
+    from app.models import Movie, Show, User
+    from benchmarks.seed import seed_catalog
+
+    app = create_app(_overrides(options.database_url))
+    with app.app_context():
+        init_schema()
+        if db.session.query(Movie.id).first() is None:
+            started = time.perf_counter()
+            sizes = seed_catalog(
+                options.size, seed=options.seed,
+                recommendations=not options.skip_recommendations,
+                movies=options.movies, shows=options.shows, users=options.users,
+            )
+            print(f"Seeded {options.size} catalog in {time.perf_counter() - started:.1f}s: {sizes}")
+        else:
+            print("Reusing existing benchmark database")
+        sizes = {
+            'movies': db.session.query(db.func.max(Movie.id)).scalar(),
+            'shows': db.session.query(db.func.max(Show.id)).scalar(),
+            'users': db.session.query(db.func.count(User.id)).filter(User.username.like('bench%')).scalar(),
+        }
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return sizes
+
+
+class _TestClientDriver:
+    def __init__(self, options, user_id):
+        from app import create_app
+        from app.queries import count_queries
+        from benchmarks.seed import BENCH_PASSWORD
+
+        self.app = create_app(_overrides(options.database_url))
+        self.context = self.app.app_context()
+        self.context.push()
+        self._count_queries = count_queries
+        self.anonymous = self.app.test_client()
+        self.authenticated = self.app.test_client()
+        self._credentials = {'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD}
+        self.login()
+
+    def login(self):
+        self.authenticated.post('/auth/login', data=self._credentials)
+
+    def request(self, authenticated, method, url, kwargs):
+        client = self.authenticated if authenticated else self.anonymous
+        with self._count_queries() as statements:
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+        return response.status_code, len(statements)
+
+    def close(self):
+        self.app.extensions['watch_events'].stop()
+        self.context.pop()
+
+
+class _HttpDriver:
+    def __init__(self, options, user_id):
+        import requests
+        from benchmarks.seed import BENCH_PASSWORD
+
+        self.base_url = options.url.rstrip('/')
+        self.anonymous = requests.Session()
+        self.authenticated = requests.Session()
+        self._credentials = {'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD}
+        self.login()
+
+    def login(self):
+        self.authenticated.post(f'{self.base_url}/auth/login', data=self._credentials, allow_redirects=False)
+
+    def request(self, authenticated, method, url, kwargs):
+        session = self.authenticated if authenticated else self.anonymous
+        response = session.request(method, self.base_url + url, allow_redirects=False, **kwargs)
+        return response.status_code, None
+
+    def close(self):
+        self.anonymous.close()
+        self.authenticated.close()
+
+
+def _worker(payload):
+    options, sizes, index, requests_count = payload
+    from benchmarks.scenarios import SCENARIOS, SCENARIOS_BY_NAME
+
+    scenarios = [SCENARIOS_BY_NAME[name] for name in options.scenario] if options.scenario else SCENARIOS
+    rng = random.Random(options.seed * 1000 + index)
+    driver_class = _HttpDriver if options.url else _TestClientDriver
+    driver = driver_class(options, user_id=index % max(sizes['users'], 1) + 1)
+
+    def run(scenario):
+        method, url, kwargs = scenario.build(rng, sizes)
+        started = time.perf_counter()
+        status, queries = driver.request(scenario.authenticated, method, url, kwargs)
+        elapsed = time.perf_counter() - started
+        if scenario.ends_session:
+            driver.login()
+        return scenario.name, elapsed, queries, status < 400
+
+    try:
+        for scenario in scenarios:
+            for _ in range(options.warmup):
+                run(scenario)
+
+        plan = rng.choices(scenarios, weights=[scenario.weight for scenario in scenarios], k=requests_count)
+        started_at = time.time()
+        samples = [run(scenario) for scenario in plan]
+        finished_at = time.time()
+    finally:
+        driver.close()
+    return started_at, finished_at, samples
+
+
+def percentile(sorted_values, p):
+    """
+    Перцентиль методом ближайшего ранга.
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(results):
+    """
+    :param results: Результаты воркеров (начало, конец, [(маршрут, секунды, запросы, успех)])
+    :return: (общая пропускная способность, {маршрут: метрики})
+    """
+    wall_time = max(result[1] for result in results) - min(result[0] for result in results)
+    by_route = defaultdict(list)
+    for _, _, samples in results:
+        for name, elapsed, queries, ok in samples:
+            by_route[name].append((elapsed, queries, ok))
+
+    routes = {}
+    for name, samples in sorted(by_route.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+        queries = [count for _, count, _ in samples if count is not None]
+        routes[name] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, _, ok in samples if not ok),
+            'rps': round(len(samples) / wall_time, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return round(total / wall_time, 1), routes
+
+
+def print_report(throughput, routes):
+    header = f"{'route':28} {'reqs':>6} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, route in routes.items():
+        queries = '-' if route['queries_mean'] is None else f"{route['queries_mean']:g}"
+        print(
+            f"{name:28} {route['requests']:>6} {route['errors']:>4} {route['rps']:>8} "
+            f"{route['p50_ms']:>8} {route['p95_ms']:>8} {route['p99_ms']:>8} {queries:>8}"
+        )
+    print(f"Total throughput: {throughput} req/s")
+
+
+def compare_with_baseline(routes, baseline, tolerance):
+    """
+    :return: Список описаний регрессий
+    """
+    regressions = []
+    for name, base in baseline['routes'].items():
+        route = routes.get(name)
+        if route is None:
+            continue
+        limit = base['p95_ms'] * (1 + tolerance)
+        # Разница меньше миллисекунды — шум таймера, а не регрессия
+        if route['requests'] >= MIN_SAMPLES and route['p95_ms'] > limit and route['p95_ms'] - base['p95_ms'] > 1:
+            regressions.append(f"{name}: p95 {route['p95_ms']} ms > {base['p95_ms']} ms baseline")
+        if None not in (route['queries_max'], base.get('queries_max')) and route['queries_max'] > base['queries_max']:
+            regressions.append(f"{name}: up to {route['queries_max']} queries > {base['queries_max']} baseline")
+        if route['errors'] and not base.get('errors'):
+            regressions.append(f"{name}: {route['errors']} failed requests")
+    return regressions
+
+
+def parse_args(argv=None):
+    from benchmarks.seed import SIZES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--movies', type=int, help='Переопределить количество фильмов')
+    parser.add_argument('--shows', type=int, help='Переопределить количество сериалов')
+    parser.add_argument('--users', type=int, help='Переопределить количество пользователей')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='База для бенчмарка (по умолчанию временный файл SQLite)')
+    parser.add_argument('--skip-recommendations', action='store_true', help='Не строить рекомендации при заполнении')
+    parser.add_argument('--url', help='Адрес запущенного сервера вместо тестового клиента')
+    parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4), help='Процессов нагрузки')
+    parser.add_argument('--requests', type=int, default=2000, help='Всего измеряемых запросов')
+    parser.add_argument('--warmup', type=int, default=5, help='Прогревочных запросов каждого сценария на процесс')
+    parser.add_argument('--scenario', action='append', help='Только указанные сценарии (можно повторять)')
+    parser.add_argument('--baseline', help='Файл базовых значений для сравнения')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Допустимый рост p95 (доля)')
+    parser.add_argument('--save-baseline', help='Записать результаты как базовые значения')
+    parser.add_argument('--json', help='Записать полный отчёт в JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.scenario:
+        from benchmarks.scenarios import SCENARIOS_BY_NAME
+
+        unknown = set(options.scenario) - SCENARIOS_BY_NAME.keys()
+        if unknown:
+            sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if not options.database_url:
+        options.database_url = 'sqlite:///' + os.path.join(
+            tempfile.gettempdir(), f'watching_show_bench_{options.size}_{options.seed}.db'
+        )
+    print(f"Database: {options.database_url}")
+    sizes = prepare_database(options)
+
+    per_worker = [options.requests // options.workers] * options.workers
+    for index in range(options.requests % options.workers):
+        per_worker[index] += 1
+    payloads = [(options, sizes, index, count) for index, count in enumerate(per_worker)]
+
+    # spawn: каждый процесс создаёт своё приложение и свои пулы соединений
+    with multiprocessing.get_context('spawn').Pool(options.workers) as pool:
+        results = pool.map(_worker, payloads)
+
+    throughput, routes = summarize(results)
+    print_report(throughput, routes)
+    report = {
+        'meta': {
+            'size': options.size,
+            'workers': options.workers,
+            'requests': options.requests,
+            'mode': 'http' if options.url else 'test-client',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'throughput_rps': throughput,
+        'routes': routes,
+    }
+    for path in (options.json, options.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            print(f"Report written to {path}")
+
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(routes, baseline, options.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import uuid
+
+from benchmarks.seed import BENCH_PASSWORD, WORDS
+
+
+class Scenario:
+    """
+    Один маршрут нагрузки: как построить запрос и нужен ли вход в систему.
+
+    :param name: Имя в отчёте и в файле базовых значений
+    :param build: Функция (rng, sizes) -> (метод, URL, аргументы клиента)
+    :param authenticated: Выполнять от имени вошедшего пользователя
+    :param weight: Доля сценария в смешанной нагрузке
+    :param ends_session: Сценарий завершает сессию, после него нужно войти заново
+    """
+
+    def __init__(self, name, build, authenticated=False, weight=1, ends_session=False):
+        self.name = name
+        self.build = build
+        self.authenticated = authenticated
+        self.weight = weight
+        self.ends_session = ends_session
+
+
+def _movie_id(rng, sizes):
+    # Половина запросов приходится на популярные 5% каталога
+    if rng.random() < 0.5:
+        return rng.randint(1, max(1, sizes['movies'] // 20))
+    return rng.randint(1, sizes['movies'])
+
+
+def _show_id(rng, sizes):
+    return rng.randint(1, sizes['shows'])
+
+
+def _login(rng, sizes):
+    user_id = rng.randint(1, sizes['users'])
+    return 'POST', '/auth/login', {'data': {'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD}}
+
+
+def _register(rng, sizes):
+    # Не из rng: повторный прогон на той же базе не должен попадать в занятые имена
+    suffix = uuid.uuid4().hex[:12]
+    return 'POST', '/auth/register', {'data': {
+        'username': f'r{suffix}',
+        'email': f'r{suffix}@example.com',
+        'password': BENCH_PASSWORD,
+        'confirm_password': BENCH_PASSWORD,
+    }}
+
+
+SCENARIOS = [
+    Scenario('index', lambda rng, sizes: ('GET', '/', {}), weight=10),
+    Scenario('index_authenticated', lambda rng, sizes: ('GET', '/', {}), authenticated=True, weight=5),
+    Scenario('content_list', lambda rng, sizes: (
+        'GET', f"/list?type={rng.choice(['movie', 'show'])}&sort={rng.choice(['rating', 'year'])}", {}
+    ), weight=5),
+    Scenario('api_content_list', lambda rng, sizes: ('GET', '/api/list?type=movie&limit=50', {}), weight=2),
+    Scenario('search', lambda rng, sizes: ('GET', f"/search?query={rng.choice(WORDS)}", {}), weight=5),
+    Scenario('search_prefix', lambda rng, sizes: ('GET', f"/search?query={rng.choice(WORDS)[:3]}", {}), weight=2),
+    Scenario('watch_movie', lambda rng, sizes: ('GET', f"/watch/movie/{_movie_id(rng, sizes)}", {}), weight=8),
+    Scenario('watch_show', lambda rng, sizes: ('GET', f"/watch/show/{_show_id(rng, sizes)}", {}), weight=4),
+    Scenario('watch_movie_authenticated', lambda rng, sizes: (
+        'GET', f"/watch/movie/{_movie_id(rng, sizes)}", {}
+    ), authenticated=True, weight=4),
+    Scenario('comments', lambda rng, sizes: (
+        'GET', f"/comments/movie/{_movie_id(rng, sizes)}?sort={rng.choice(['new', 'popular'])}", {}
+    ), weight=3),
+    Scenario('rate_content', lambda rng, sizes: (
+        'POST', f"/rate/movie/{_movie_id(rng, sizes)}", {'json': {'rating': rng.randint(1, 10)}}
+    ), authenticated=True, weight=3),
+    Scenario('login', _login, weight=1),
+    Scenario('register', _register, weight=1),
+    Scenario('logout', lambda rng, sizes: ('GET', '/auth/logout', {}), authenticated=True, weight=1, ends_session=True),
+]
+
+SCENARIOS_BY_NAME = {scenario.name: scenario for scenario in SCENARIOS}
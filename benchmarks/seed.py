@@ -0,0 +1,178 @@
+import random
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.passwords import hash_password
+from app.models import (
+    User, Movie, Show, Season, Episode, Rating, Comment, CommentLike, WatchHistory, UserPreference,
+)
+from app.ratings import rebuild_rating_aggregates
+from app.comments import rebuild_comment_counters
+from app.genres import rebuild_genre_links
+from app.search import rebuild_search_index
+from app.recommendations import build_recommendations
+
+
+# Размеры синтетического каталога
+SIZES = {
+    'small': {
+        'movies': 500, 'shows': 100, 'users': 200,
+        'ratings': 5000, 'comments': 5000, 'likes': 2000, 'watch_events': 10000,
+    },
+    'medium': {
+        'movies': 5000, 'shows': 1000, 'users': 2000,
+        'ratings': 50000, 'comments': 50000, 'likes': 20000, 'watch_events': 100000,
+    },
+    'large': {
+        'movies': 50000, 'shows': 10000, 'users': 20000,
+        'ratings': 500000, 'comments': 500000, 'likes': 200000, 'watch_events': 1000000,
+    },
+}
+
+BENCH_PASSWORD = 'benchmark'
+
+GENRES = [
+    'drama', 'comedy', 'thriller', 'horror', 'documentary', 'animation',
+    'science fiction', 'fantasy', 'romance', 'crime', 'adventure', 'family',
+]
+
+WORDS = [
+    'shadow', 'river', 'empire', 'midnight', 'garden', 'signal', 'winter', 'harbor',
+    'silent', 'machine', 'crown', 'forest', 'echo', 'storm', 'mirror', 'station',
+    'golden', 'last', 'broken', 'hidden', 'north', 'city', 'dream', 'fire',
+    'ocean', 'paper', 'glass', 'wolf', 'summer', 'secret', 'letter', 'island',
+]
+
+BATCH_SIZE = 5000
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+
+def _content_rows(rng, count):
+    return [
+        {
+            'id': content_id,
+            'title': f"{_sentence(rng, 2)} {content_id}",
+            'description': _sentence(rng, 20),
+            'genre': ', '.join(rng.sample(GENRES, rng.randint(1, 2))),
+            'year': rng.randint(1950, 2024),
+            'thumbnail_url': '',
+            'external_rating': round(rng.uniform(1, 10), 1),
+        }
+        for content_id in range(1, count + 1)
+    ]
+
+
+def _unique_pairs(rng, count, users, movies, shows):
+    """
+    Уникальные (user_id, movie_id, show_id): одна оценка пользователя на контент.
+    """
+    pairs = set()
+    limit = users * (movies + shows)
+    while len(pairs) < min(count, limit):
+        if rng.random() < movies / (movies + shows):
+            pairs.add((rng.randint(1, users), rng.randint(1, movies), None))
+        else:
+            pairs.add((rng.randint(1, users), None, rng.randint(1, shows)))
+    return sorted(pairs, key=lambda pair: (pair[0], pair[1] or 0, pair[2] or 0))
+
+
+def seed_catalog(size='small', seed=42, recommendations=True, **counts):
+    """
+    Заполняет пустую базу синтетическим каталогом.
+
+    Строки вставляются пакетами в обход ORM, затем агрегаты, жанры, счётчики
+    комментариев, FTS-индекс и рекомендации пересчитываются штатными функциями.
+
+    :param size: Ключ из SIZES
+    :param seed: Зерно генератора, чтобы каталог был воспроизводимым
+    :param recommendations: Построить таблицу рекомендаций
+    :param counts: Переопределение отдельных размеров (movies=..., users=...)
+    :return: Итоговые размеры
+    """
+    sizes = {**SIZES[size], **{key: value for key, value in counts.items() if value is not None}}
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    _insert(Movie, [
+        {**row, 'video_url': f"static/videos/movies/bench_{row['id']}.mp4"}
+        for row in _content_rows(rng, sizes['movies'])
+    ])
+    _insert(Show, _content_rows(rng, sizes['shows']))
+
+    seasons, episodes = [], []
+    for show_id in range(1, sizes['shows'] + 1):
+        for season_number in range(1, rng.randint(1, 5) + 1):
+            season_id = len(seasons) + 1
+            seasons.append({'id': season_id, 'show_id': show_id, 'season_number': season_number})
+            for episode_number in range(1, rng.randint(3, 10) + 1):
+                episodes.append({
+                    'season_id': season_id,
+                    'episode_number': episode_number,
+                    'title': _sentence(rng, 3),
+                    'video_url': f'static/videos/shows/season_{season_number}/bench_{season_id}_{episode_number}.mp4',
+                })
+    _insert(Season, seasons)
+    _insert(Episode, episodes)
+
+    # Хэш пароля считается один раз: он намеренно медленный
+    password_hash = hash_password(BENCH_PASSWORD)
+    _insert(User, [
+        {'id': user_id, 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com', 'password_hash': password_hash}
+        for user_id in range(1, sizes['users'] + 1)
+    ])
+    _insert(UserPreference, [
+        {'user_id': user_id, 'genre': rng.choice(GENRES)}
+        for user_id in range(1, sizes['users'] + 1)
+    ])
+
+    _insert(Rating, [
+        {'user_id': user_id, 'movie_id': movie_id, 'show_id': show_id, 'rating': rng.randint(1, 10)}
+        for user_id, movie_id, show_id in _unique_pairs(rng, sizes['ratings'], sizes['users'], sizes['movies'], sizes['shows'])
+    ])
+
+    comments = []
+    for _ in range(sizes['comments']):
+        on_movie = rng.random() < 0.8
+        comments.append({
+            'content': _sentence(rng, rng.randint(3, 30)),
+            'timestamp': now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+            'user_id': rng.randint(1, sizes['users']),
+            # Комментарии сосредоточены на первых 5% каталога, как у популярных тайтлов
+            'movie_id': rng.randint(1, max(1, sizes['movies'] // 20)) if on_movie else None,
+            'show_id': None if on_movie else rng.randint(1, max(1, sizes['shows'] // 20)),
+        })
+    _insert(Comment, comments)
+
+    likes = {
+        (rng.randint(1, len(comments)), rng.randint(1, sizes['users']))
+        for _ in range(sizes['likes'])
+    } if comments else set()
+    _insert(CommentLike, [{'comment_id': comment_id, 'user_id': user_id} for comment_id, user_id in sorted(likes)])
+
+    watch_events = []
+    for _ in range(sizes['watch_events']):
+        on_movie = rng.random() < 0.7
+        watch_events.append({
+            'user_id': rng.randint(1, sizes['users']),
+            'movie_id': rng.randint(1, sizes['movies']) if on_movie else None,
+            'show_id': None if on_movie else rng.randint(1, sizes['shows']),
+            'watched_at': now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600)),
+        })
+    _insert(WatchHistory, watch_events)
+
+    rebuild_rating_aggregates()
+    rebuild_comment_counters()
+    rebuild_genre_links()
+    rebuild_search_index()
+    if recommendations:
+        build_recommendations()
+    return sizes
@@ -3,15 +3,54 @@ import os
 
 class Config:
     SECRET_KEY = "something"
-    SQLALCHEMY_DATABASE_URI = "sqlite:///watching_show.db"
+    SQLALCHEMY_DATABASE_URI = (
+        os.environ.get("DATABASE_URL") or "sqlite:///watching_show.db"
+    ).replace("postgres://", "postgresql://", 1)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Пулы соединений и разделение чтения/записи, см. app/database.py
+    SQLALCHEMY_READ_URL = os.environ.get("DATABASE_READ_URL")  # реплика; для SQLite — тот же файл
+    SQLALCHEMY_READ_SPLIT = os.environ.get("DATABASE_READ_SPLIT", "1") == "1"
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", 10))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))  # секунд ожидания соединения
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    SQLITE_BUSY_TIMEOUT = 5000  # мс
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': SQLITE_BUSY_TIMEOUT,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -20000,  # ~20 МБ
+        'temp_store': 'MEMORY',
+    }
+
     # AWS S3 Configuration
     S3_BUCKET = os.environ.get("S3_BUCKET")
     S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY")
     S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY")
     S3_REGION = os.environ.get("S3_REGION") or "us-east-1"
     S3_BASE_URL = f"https://{S3_BUCKET}.s3.amazonaws.com/"
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # moto/minio для локальной отладки
+
+    # Хранилище файлов: 's3' или 'local' (локальная замена S3)
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND") or ("s3" if S3_BUCKET else "local")
+    STORAGE_LOCAL_ROOT = os.environ.get("STORAGE_LOCAL_ROOT")  # по умолчанию instance/storage
+    STORAGE_PART_SIZE = int(os.environ.get("STORAGE_PART_SIZE") or 8 * 1024 * 1024)
+    STORAGE_CONCURRENCY = int(os.environ.get("STORAGE_CONCURRENCY") or 8)
+    STORAGE_REPLICATE_VIDEOS = os.environ.get("STORAGE_REPLICATE_VIDEOS") == "1"
+
+    # Пароли: метод Werkzeug; при смене параметров хэш пересчитывается при следующем входе
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "scrypt:32768:8:1"
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or os.cpu_count() or 1)
+    # Ожидающие хэша запросы занимают потоки сервера; по умолчанию SERVER_THREADS - 1,
+    # чтобы во время шторма входов у воркера оставался поток для остальных страниц
+    PASSWORD_HASH_MAX_PENDING = None
+    PASSWORD_HASH_TIMEOUT = 5  # секунд ожидания места в очереди, потом 503
+
+    # Кэш пользователя сессии для load_user (в общем кэше CACHE_BACKEND); 0 — выключить
+    IDENTITY_CACHE_TTL = 30  # секунд
 
     # Flask-Login Remember Me
     REMEMBER_COOKIE_DURATION = 60 * 60 * 24 * 30  # 30 дней
@@ -26,4 +65,143 @@ class Config:
     MAIL_USERNAME = None
     MAIL_PASSWORD = None
     MAIL_DEFAULT_SENDER = 'no-reply@example.com'
+    MAIL_TIMEOUT = 10  # секунд на операцию SMTP
+
+    # Письма отправляются задачами mail.send (app/outbox.py) из очереди JOBS_*
+    MAIL_RATE = 10  # писем в секунду на процесс; 0 — без ограничения
+    MAIL_CONNECTION_IDLE = 30  # секунд простоя, после которых SMTP-соединение открывается заново
+
+    # Стриминг видео (Range-запросы)
+    STREAM_CHUNK_SIZE = 256 * 1024  # максимум байт за одно чтение
+    STREAM_MAX_RANGE_SIZE = 8 * 1024 * 1024  # ограничение для открытых диапазонов bytes=N-
+    STREAM_MAX_RANGES = 16  # больше диапазонов в одном запросе — отдаём файл целиком
+    STREAM_MAX_AGE = 60 * 60 * 24
+
+    # Миграции при каждом create_app — только для разработки; в рабочем режиме `flask db upgrade`
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE") == "1"
+
+    # Рабочий сервер (serve.py): gunicorn с предзагрузкой приложения и fork воркеров
+    SERVER_BIND = os.environ.get("SERVER_BIND", "0.0.0.0:8000")
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS") or (os.cpu_count() or 1) * 2 + 1)
+    SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 4))  # потоков на воркер; DB_POOL_SIZE не меньше
+    SERVER_TIMEOUT = int(os.environ.get("SERVER_TIMEOUT", 30))  # секунд на запрос до перезапуска воркера
+    SERVER_GRACEFUL_TIMEOUT = 30
+    SERVER_KEEPALIVE = 5
+    SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", 10000))  # перезапуск воркера; 0 — никогда
+    SERVER_MAX_REQUESTS_JITTER = 1000  # чтобы воркеры не перезапускались одновременно
+
+    # Очередь фоновых задач (app/jobs.py): поток в процессе сервера или отдельный worker.py
+    JOBS_BACKGROUND = os.environ.get("JOBS_BACKGROUND", "1") == "1"
+    JOBS_POOL = os.environ.get("JOBS_POOL", "thread")  # thread или process
+    JOBS_CONCURRENCY = int(os.environ.get("JOBS_CONCURRENCY", 4))
+    JOBS_POLL_INTERVAL = 2  # секунд между проверками очереди
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_RETRY_DELAY = 10  # секунд до первого повтора, дальше удваивается
+    JOBS_MAX_RETRY_DELAY = 60 * 60
+    JOBS_CLAIM_TIMEOUT = 30 * 60  # через столько задача упавшего исполнителя забирается снова
+    JOBS_HEARTBEAT_INTERVAL = 60  # секунд; исполнитель продлевает claimed_at своих задач, должно быть меньше таймаута
+    JOBS_RETENTION = 60 * 60 * 24 * 7  # сколько хранить завершённые задачи
+
+    # HLS-упаковка видео (app/packaging.py): задачи packaging.package из очереди JOBS_*
+    PACKAGING_ENABLED = os.environ.get("PACKAGING_ENABLED", "1") == "1"
+    PACKAGING_DIR = os.environ.get("PACKAGING_DIR")  # по умолчанию static/videos/hls, рядом с исходными файлами
+    PACKAGING_FFMPEG = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+    PACKAGING_FFPROBE = os.environ.get("FFPROBE_BINARY", "ffprobe")
+    PACKAGING_SEGMENT_DURATION = 6  # секунд
+    PACKAGING_RENDITIONS = {  # имя -> (высота, видео кбит/с, аудио кбит/с)
+        '360p': (360, 800, 96),
+        '480p': (480, 1400, 128),
+        '720p': (720, 2800, 128),
+        '1080p': (1080, 5000, 192),
+    }
+    PACKAGING_WORKERS = int(os.environ.get("PACKAGING_WORKERS", 2))  # процессов ffmpeg; 0 — по очереди
+    # Секунд на вариант; пока ffmpeg работает, исполнитель продлевает задачу, так что
+    # JOBS_CLAIM_TIMEOUT может быть намного меньше
+    PACKAGING_TIMEOUT = 4 * 60 * 60
+    PACKAGING_MANIFEST_MAX_AGE = 60  # мастер-плейлист меняется при повторной упаковке
+    PACKAGING_SEGMENT_MAX_AGE = 60 * 60 * 24 * 365  # сегменты лежат в каталоге версии и не меняются
+    # Плеер HLS для браузеров без встроенной поддержки. Берётся из static/vendor/hls.min.js
+    # (`flask packaging vendor-player`), а с CDN — только с хэшем SRI; иначе играет mp4
+    HLS_JS_URL = os.environ.get("HLS_JS_URL") or "https://cdn.jsdelivr.net/npm/hls.js@1.5.17/dist/hls.min.js"
+    HLS_JS_INTEGRITY = os.environ.get("HLS_JS_INTEGRITY")  # sha384-...
+    USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE") == "1"
+
+    # Рекомендации
+    RECOMMENDATIONS_LIMIT = 10
+    RECOMMENDATIONS_CACHE_TTL = 300  # секунд, в общем кэше CACHE_BACKEND
+
+    # Полнотекстовый поиск
+    SEARCH_PER_PAGE = 20
+    # Счётчики фасетов расширенного поиска; сбрасываются и при изменении каталога
+    FACETS_CACHE_TTL = 60 * 10
+
+    # Комментарии (keyset-пагинация)
+    COMMENTS_PER_PAGE = 20
+    COMMENTS_MAX_PER_PAGE = 100
+
+    # Пакетные оценки POST /rate/batch
+    RATING_BATCH_MAX_SIZE = 500
+
+    # Каталог (keyset-пагинация)
+    LIST_PER_PAGE = 24
+    LIST_MAX_PER_PAGE = 100
+
+    # Обложки: уменьшенные варианты по хэшу содержимого (app/thumbnails.py)
+    THUMBNAIL_DIR = os.environ.get("THUMBNAIL_DIR")  # по умолчанию instance/thumbnails
+    # Исходные файлы (с EXIF, в том числе GPS) — вне раздаваемого каталога; по умолчанию instance/thumbnail-sources
+    THUMBNAIL_SOURCE_DIR = os.environ.get("THUMBNAIL_SOURCE_DIR")
+    THUMBNAIL_VARIANTS = {  # имя -> максимальные (ширина, высота)
+        'small': (160, 240),
+        'card': (360, 540),
+        'large': (720, 1080),
+    }
+    THUMBNAIL_FORMAT = 'WEBP'
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", 2))  # процессов; 0 — в потоке запроса
+    THUMBNAIL_TIMEOUT = 60  # секунд на вариант
+    THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365
+
+    # Внешний сервис рейтингов
+    EXTERNAL_RATING_URL = os.environ.get("EXTERNAL_RATING_URL") or "https://api.example.com/rating"
+    EXTERNAL_RATING_TIMEOUT = 5  # секунд на запрос
+    EXTERNAL_RATING_CONCURRENCY = 10
+    EXTERNAL_RATING_RETRIES = 3
+    EXTERNAL_RATING_BACKOFF = 0.5  # секунд до первого повтора, дальше удваивается
+    EXTERNAL_RATING_CACHE_TTL = 60 * 60 * 24
+
+    # Загрузка видео по частям
+    UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR")  # по умолчанию instance/uploads
+    UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+    UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024
+    UPLOAD_READ_SIZE = 64 * 1024  # буфер чтения тела запроса
+    UPLOAD_SESSION_TTL = 60 * 60 * 24 * 7
+
+    # Запись истории просмотров пачками в фоновом потоке
+    WATCH_EVENTS_ASYNC = True
+    WATCH_EVENTS_BATCH_SIZE = 500
+    WATCH_EVENTS_FLUSH_INTERVAL = 0.5  # секунд
+    WATCH_EVENTS_QUEUE_SIZE = 100000
+
+    # Общий кэш (страницы, фрагменты, пользователи, рекомендации): filesystem или redis.
+    # memory — только для одного процесса (тесты, бенчмарки): сброс из worker.py, команд flask
+    # и других воркеров сервера до него не доходит, поэтому с отдельным исполнителем задач
+    # (JOBS_BACKGROUND = 0 или JOBS_POOL = process) приложение с ним не запускается
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND") or "filesystem"
+    CACHE_DIR = os.environ.get("CACHE_DIR")  # по умолчанию instance/cache
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL") or "redis://localhost:6379/0"
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_DEFAULT_TIMEOUT = 300  # секунд
+    CACHE_FRAGMENT_TIMEOUT = 600
+
+    # Профилирование запросов и метрики Prometheus (/metrics), см. app/profiling.py
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+    PROFILING_DUPLICATE_THRESHOLD = 3  # столько одинаковых SQL за запрос считаем N+1
+    PROFILING_SLOW_REQUEST = float(os.environ.get("PROFILING_SLOW_REQUEST", 1.0))  # секунд
+    PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))  # доля запросов под cProfile
+    PROFILING_DIR = os.environ.get("PROFILING_DIR")  # по умолчанию instance/profiles
+    PROFILING_WINDOW = 1000  # запросов в скользящем окне перцентилей
+    # /metrics открыт только с токеном; доступ по адресу — явное включение для сетей без
+    # обратного прокси (за прокси remote_addr у всех запросов — адрес прокси)
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    METRICS_ALLOWED_IPS = tuple(filter(None, os.environ.get("METRICS_ALLOWED_IPS", "").split(",")))
 
@@ -0,0 +1,93 @@
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import random
+
+from gunicorn.app.base import BaseApplication
+
+from app import create_app
+from app.extensions import db
+from app.migrations import pending_migrations
+
+IMPORTED = time.perf_counter() - STARTED
+
+
+class ProductionServer(BaseApplication):
+    """
+    Gunicorn с настройками из SERVER_*.
+
+    Приложение создаётся один раз в главном процессе (preload_app), воркеры
+    получают его через fork уже импортированным, поэтому стартуют за миллисекунды
+    и делят с главным процессом страницы памяти с кодом.
+    """
+
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def post_fork(server, worker):
+    # Соединения пула, открытые главным процессом, нельзя делить между процессами
+    with application.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    # Иначе у всех воркеров одна последовательность random (джиттер TTL кэша)
+    random.seed()
+    worker.booted_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s ready in %.3fs after fork", worker.pid, time.perf_counter() - worker.booted_at)
+
+
+def when_ready(server):
+    server.log.info("Server ready in %.3fs (imports %.3fs, create_app %.3fs): %d workers x %d threads on %s",
+                    time.perf_counter() - STARTED, IMPORTED, application.extensions['startup_seconds'],
+                    server.cfg.workers, server.cfg.threads, ",".join(server.cfg.bind))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Рабочий сервер: gunicorn с fork воркеров.")
+    parser.add_argument("--bind", help="По умолчанию SERVER_BIND.")
+    parser.add_argument("--workers", type=int, help="По умолчанию SERVER_WORKERS.")
+    parser.add_argument("--threads", type=int, help="По умолчанию SERVER_THREADS.")
+    args = parser.parse_args()
+
+    application = create_app()
+    config = application.config
+    with application.app_context():
+        pending = pending_migrations()
+    if pending:
+        raise SystemExit(f"Database schema is behind by {len(pending)} migrations: run `flask db upgrade` first.")
+
+    workers = args.workers or config["SERVER_WORKERS"]
+    if workers > 1 and config["CACHE_BACKEND"] == "memory":
+        # У каждого воркера была бы своя копия кэша: invalidate_catalog в одном воркере
+        # не сбрасывал бы страницы, закэшированные другими
+        raise SystemExit(f"CACHE_BACKEND=memory is per process and cannot be shared by {workers} workers: "
+                         "use CACHE_BACKEND=filesystem or redis.")
+
+    ProductionServer(application, {
+        "bind": args.bind or config["SERVER_BIND"],
+        "workers": workers,
+        "threads": args.threads or config["SERVER_THREADS"],
+        "timeout": config["SERVER_TIMEOUT"],
+        "graceful_timeout": config["SERVER_GRACEFUL_TIMEOUT"],
+        "keepalive": config["SERVER_KEEPALIVE"],
+        "max_requests": config["SERVER_MAX_REQUESTS"],
+        "max_requests_jitter": config["SERVER_MAX_REQUESTS_JITTER"],
+        "preload_app": True,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "when_ready": when_ready,
+    }).run()
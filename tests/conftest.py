@@ -0,0 +1,60 @@
+import pytest
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Файловая база, чтобы работало разделение пулов записи и чтения, как в рабочем режиме
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'AUTO_MIGRATE': True,
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'JOBS_BACKGROUND': False,
+        'WATCH_EVENTS_ASYNC': False,
+        # Ожидание занятого соединения роняет тест, а не подвешивает его
+        'DB_POOL_TIMEOUT': 2,
+        'CACHE_DIR': str(tmp_path / 'cache'),
+        'UPLOAD_TMP_DIR': str(tmp_path / 'uploads'),
+        'PROFILING_DIR': str(tmp_path / 'profiles'),
+        'PACKAGING_DIR': str(tmp_path / 'hls'),
+        'THUMBNAIL_DIR': str(tmp_path / 'thumbnails'),
+        'THUMBNAIL_SOURCE_DIR': str(tmp_path / 'thumbnail-sources'),
+    })
+    yield app
+    app.extensions['external_ratings'].stop()
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        user = User(username='viewer', email='viewer@example.com')
+        user.set_password('secret-password')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def login(client):
+    """
+    Вход без формы: идентификатор пользователя кладётся прямо в сессию Flask-Login.
+    """
+    def login(user_id, test_client=client):
+        with test_client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return test_client
+    return login
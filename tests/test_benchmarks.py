@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from app.extensions import db
+from benchmarks.run import MIN_SAMPLES, compare_with_baseline, percentile, summarize
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed import BENCH_PASSWORD, seed_catalog
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_summarize_groups_samples_by_route():
+    results = [
+        (100.0, 101.0, [('index', 0.010, 3, True), ('index', 0.030, 3, True)]),
+        (100.5, 102.0, [('index', 0.020, 5, True), ('search', 0.005, None, False)]),
+    ]
+    throughput, routes = summarize(results)
+    assert throughput == 2.0
+    assert routes['index'] == {
+        'requests': 3, 'errors': 0, 'rps': 1.5,
+        'p50_ms': 20.0, 'p95_ms': 30.0, 'p99_ms': 30.0,
+        'queries_mean': 3.67, 'queries_max': 5,
+    }
+    # В режиме --url запросы к базе не считаются
+    assert (routes['search']['errors'], routes['search']['queries_mean']) == (1, None)
+
+
+def _route(p95_ms, requests=MIN_SAMPLES, queries_max=3, errors=0):
+    return {'requests': requests, 'errors': errors, 'p95_ms': p95_ms, 'queries_max': queries_max}
+
+
+@pytest.mark.parametrize('route, regressions', [
+    (_route(14.0), 0),
+    (_route(16.0), 1),
+    # Мало запросов или рост меньше миллисекунды — шум, а не регрессия
+    (_route(16.0, requests=MIN_SAMPLES - 1), 0),
+    (_route(1.6), 0),
+    (_route(10.0, queries_max=4), 1),
+    (_route(10.0, errors=2), 1),
+])
+def test_compare_with_baseline(route, regressions):
+    base_p95 = 1.0 if route['p95_ms'] < 2 else 10.0
+    baseline = {'routes': {'index': _route(base_p95), 'removed': _route(1.0)}}
+    assert len(compare_with_baseline({'index': route}, baseline, tolerance=0.5)) == regressions
+
+
+def test_scenarios_succeed_on_seeded_catalog(app, client):
+    with app.app_context():
+        sizes = seed_catalog(
+            'small', seed=1, recommendations=True,
+            movies=20, shows=5, users=3, ratings=50, comments=50, likes=20, watch_events=50,
+        )
+        db.session.remove()
+
+    authenticated = app.test_client()
+    response = authenticated.post('/auth/login', data={'email': 'bench1@example.com', 'password': BENCH_PASSWORD})
+    assert response.status_code == 302
+
+    rng = random.Random(1)
+    for scenario in SCENARIOS:
+        method, url, kwargs = scenario.build(rng, sizes)
+        response = (authenticated if scenario.authenticated else client).open(url, method=method, **kwargs)
+        assert response.status_code < 400, (scenario.name, url, response.status_code)
@@ -0,0 +1,39 @@
+import pytest
+from flask import session
+
+from app.cache import FileSystemCache, cached_response, create_cache
+
+
+def test_response_that_modifies_session_is_not_cached(app, client):
+    calls = []
+
+    @app.route('/test/session-page')
+    @cached_response()
+    def session_page():
+        calls.append(1)
+        session['visited'] = True
+        return 'page'
+
+    @app.route('/test/plain-page')
+    @cached_response()
+    def plain_page():
+        calls.append(2)
+        return 'page'
+
+    for _ in range(2):
+        assert app.test_client().get('/test/session-page').status_code == 200
+        assert app.test_client().get('/test/plain-page').status_code == 200
+    # Страница с записью в сессию рендерится каждый раз, обычная — один раз
+    assert calls.count(1) == 2
+    assert calls.count(2) == 1
+
+
+def test_default_backend_is_shared(app):
+    assert isinstance(app.extensions['cache'], FileSystemCache)
+
+
+@pytest.mark.parametrize('jobs', [{'JOBS_BACKGROUND': False}, {'JOBS_POOL': 'process'}])
+def test_memory_backend_refused_with_separate_job_processes(app, jobs):
+    config = {**app.config, 'CACHE_BACKEND': 'memory', **jobs}
+    with pytest.raises(RuntimeError, match='CACHE_BACKEND=memory'):
+        create_cache(config, app.instance_path)
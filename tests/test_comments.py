@@ -0,0 +1,89 @@
+import re
+
+import pytest
+
+from app.comments import comments_page, rebuild_comment_counters
+from app.extensions import db
+from app.models import Comment, Movie, User
+
+
+def _movie_with_comments(user_id, count=3):
+    movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='m.mp4')
+    db.session.add(movie)
+    db.session.flush()
+    comments = [Comment(content=f'comment {number}', user_id=user_id, movie_id=movie.id) for number in range(count)]
+    db.session.add_all(comments)
+    db.session.commit()
+    return movie.id, [comment.id for comment in comments]
+
+
+def _other_user():
+    other = User(username='other', email='other@example.com')
+    other.set_password('secret-password')
+    db.session.add(other)
+    db.session.commit()
+    return other.id
+
+
+def test_comment_counter_follows_inserts_and_deletes(app, user):
+    with app.app_context():
+        movie_id, comment_ids = _movie_with_comments(user)
+        assert db.session.get(Movie, movie_id).comment_count == 3
+
+        db.session.delete(db.session.get(Comment, comment_ids[0]))
+        db.session.commit()
+        assert db.session.get(Movie, movie_id).comment_count == 2
+
+        # Счётчик, разошедшийся с данными, пересчитывается командой comments rebuild-counters
+        db.session.execute(db.update(Movie).values(comment_count=10))
+        db.session.commit()
+        rebuild_comment_counters(batch_size=1)
+        db.session.expire_all()
+        assert db.session.get(Movie, movie_id).comment_count == 2
+
+
+def test_like_counters_and_popular_order(app, client, user, login):
+    with app.app_context():
+        movie_id, (first, second, third) = _movie_with_comments(user)
+        other = _other_user()
+
+    login(user)
+    assert client.post(f'/comments/{second}/like').json == {'id': second, 'likes': 1}
+    # Повторная отметка того же пользователя не увеличивает счётчик
+    assert client.post(f'/comments/{second}/like').json['likes'] == 1
+    assert client.post(f'/comments/{third}/like').json['likes'] == 1
+    other_client = login(other, test_client=app.test_client())
+    assert other_client.post(f'/comments/{second}/like').json['likes'] == 2
+    assert client.delete(f'/comments/{third}/like').json['likes'] == 0
+    assert client.delete(f'/comments/{third}/like').json['likes'] == 0
+    assert client.post('/comments/999/like').status_code == 404
+
+    with app.app_context():
+        assert [db.session.get(Comment, comment_id).likes_count for comment_id in (first, second, third)] == [0, 2, 0]
+        page, cursor = comments_page('movie', movie_id, sort='popular', per_page=2)
+        assert [comment.id for comment in page] == [second, third]
+        page, cursor = comments_page('movie', movie_id, sort='popular', cursor=cursor, per_page=2)
+        assert ([comment.id for comment in page], cursor) == ([first], None)
+
+
+@pytest.mark.parametrize('method', ['post', 'delete'])
+def test_like_requires_csrf_token(app, client, user, login, method):
+    app.config['WTF_CSRF_ENABLED'] = True
+    with app.app_context():
+        movie_id, (comment_id, *_) = _movie_with_comments(user)
+
+    login(user)
+    url = f'/comments/{comment_id}/like'
+    response = getattr(client, method)(url)
+    assert response.status_code == 400
+    assert 'CSRF' in response.json['error']
+    assert getattr(client, method)(url, headers={'X-CSRFToken': 'forged'}).status_code == 400
+
+    # Токен страницы просмотра привязан к сессии пользователя
+    page = client.get(f'/watch/movie/{movie_id}').get_data(as_text=True)
+    token = re.search(r"const csrfToken = '([^']+)'", page).group(1)
+    assert getattr(client, method)(url, headers={'X-CSRFToken': token}).status_code == 200
+    assert getattr(client, method)(url, data={'csrf_token': token}).status_code == 200
+
+    other_client = login(user, test_client=app.test_client())
+    assert getattr(other_client, method)(url, headers={'X-CSRFToken': token}).status_code == 400
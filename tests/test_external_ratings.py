@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.extensions import db
+from app.external_ratings import ExternalRatingClient, _fetch_rating, refresh_external_ratings
+from app.models import ExternalRatingCache, Movie, Show
+
+
+class StubRatingService:
+    """
+    Локальная заглушка сервиса рейтингов на aiohttp в отдельном потоке.
+
+    Для каждого названия задаётся последовательность ответов (статус, рейтинг, задержка);
+    последний ответ повторяется. Неизвестные названия получают 404.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.peers = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        app = web.Application()
+        app.router.add_get('/rating', self._handle)
+        self._server = TestServer(app, host='127.0.0.1')
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._server.start_server(), self._loop).result(5)
+        self.url = str(self._server.make_url('/rating'))
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._server.close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop.close()
+
+    def respond(self, title, *responses):
+        self.responses[title] = list(responses)
+
+    def count(self, title):
+        return self.requests.count(title)
+
+    async def _handle(self, request):
+        title = request.query['title']
+        self.requests.append(title)
+        self.peers.append(request.transport.get_extra_info('peername'))
+        queue = self.responses.get(title) or [(404, None, 0)]
+        status, rating, delay = queue.pop(0) if len(queue) > 1 else queue[0]
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response({'rating': rating} if rating is not None else {}, status=status)
+
+
+@pytest.fixture
+def rating_service():
+    service = StubRatingService()
+    service.start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def rating_app(app, rating_service):
+    app.config.update(
+        EXTERNAL_RATING_URL=rating_service.url,
+        EXTERNAL_RATING_RETRIES=2,
+        EXTERNAL_RATING_BACKOFF=0.05,
+        EXTERNAL_RATING_TIMEOUT=0.3,
+    )
+    return app
+
+
+def _fetch(service, title, **options):
+    async def fetch():
+        async with ExternalRatingClient(service.url, **options) as client:
+            return await client.fetch(title)
+    return asyncio.run(fetch())
+
+
+def test_retries_with_exponential_backoff(rating_service):
+    rating_service.respond('Heat', (503, None, 0), (502, None, 0), (200, 8.3, 0))
+
+    started = time.perf_counter()
+    rating = _fetch(rating_service, 'Heat', retries=3, backoff=0.05)
+
+    assert rating == 8.3
+    assert rating_service.count('Heat') == 3
+    # Паузы 0.05 и 0.1 перед вторым и третьим запросом
+    assert time.perf_counter() - started >= 0.15
+
+
+def test_gives_up_after_retries(rating_service):
+    rating_service.respond('Heat', (503, None, 0))
+
+    assert _fetch(rating_service, 'Heat', retries=2, backoff=0.01) is None
+    assert rating_service.count('Heat') == 3
+
+
+def test_timeout_is_retried(rating_service):
+    rating_service.respond('Heat', (200, 9.0, 1), (200, 7.0, 0))
+
+    assert _fetch(rating_service, 'Heat', retries=1, backoff=0.01, timeout=0.2) == 7.0
+    assert rating_service.count('Heat') == 2
+
+
+def test_unknown_title_is_zero_and_rejected_request_is_none(rating_service):
+    rating_service.respond('Forbidden', (401, None, 0))
+
+    assert _fetch(rating_service, 'Nobody knows', retries=2, backoff=0.01) == 0.0
+    assert _fetch(rating_service, 'Forbidden', retries=2, backoff=0.01) is None
+    # Ни 404, ни 401 не повторяются
+    assert rating_service.count('Nobody knows') == 1
+    assert rating_service.count('Forbidden') == 1
+
+
+def test_cache_ttl(rating_app, rating_service):
+    rating_service.respond('Heat', (200, 8.3, 0))
+    with rating_app.app_context():
+        assert _fetch_rating('Heat') == 8.3
+        assert _fetch_rating('Heat') == 8.3
+        assert rating_service.count('Heat') == 1
+
+        stale = datetime.utcnow() - timedelta(seconds=rating_app.config['EXTERNAL_RATING_CACHE_TTL'] + 1)
+        db.session.execute(db.update(ExternalRatingCache).values(fetched_at=stale))
+        db.session.commit()
+        assert _fetch_rating('Heat') == 8.3
+        assert rating_service.count('Heat') == 2
+
+
+def test_single_fetches_reuse_connection(rating_app, rating_service):
+    rating_service.respond('Heat', (200, 8.3, 0))
+    rating_service.respond('Ronin', (200, 7.2, 0))
+    with rating_app.app_context():
+        assert _fetch_rating('Heat') == 8.3
+        assert _fetch_rating('Ronin') == 7.2
+        rating_app.extensions['external_ratings'].stop()
+    # Второй запрос пришёл по тому же соединению (keep-alive)
+    assert len(rating_service.peers) == 2
+    assert len(set(rating_service.peers)) == 1
+
+
+def test_only_answers_are_cached(rating_app, rating_service):
+    rating_service.respond('Forbidden', (401, None, 0))
+    rating_service.respond('Down', (503, None, 0))
+    with rating_app.app_context():
+        assert _fetch_rating('Nobody knows') == 0.0
+        assert _fetch_rating('Forbidden') is None
+        assert _fetch_rating('Down') is None
+
+        cached = dict(db.session.execute(db.select(ExternalRatingCache.title, ExternalRatingCache.rating)).all())
+        assert cached == {'Nobody knows': 0.0}
+
+
+def test_bulk_refresh(rating_app, rating_service):
+    rating_service.respond('Heat', (200, 8.3, 0))
+    rating_service.respond('Ronin', (200, 7.2, 0))
+    rating_service.respond('Lost', (200, 8.0, 0))
+    rating_service.respond('Down', (503, None, 0))
+    with rating_app.app_context():
+        db.session.add_all([
+            Movie(title=title, description='d', genre='Drama', year=1995, thumbnail_url='t', video_url='v',
+                  external_rating=5.0)
+            for title in ('Heat', 'Ronin', 'Down')
+        ] + [Show(title='Lost', description='d', genre='Drama', year=2004, thumbnail_url='t', external_rating=5.0)])
+        db.session.commit()
+
+        assert refresh_external_ratings(batch_size=2) == 3
+        ratings = dict(db.session.execute(db.select(Movie.title, Movie.external_rating)).all())
+        # Недоступный рейтинг не затирает известный
+        assert ratings == {'Heat': 8.3, 'Ronin': 7.2, 'Down': 5.0}
+        assert db.session.scalar(db.select(Show.external_rating)) == 8.0
+
+        # Повторное обновление берёт рейтинги из кэша, запрашивается только отсутствующий
+        requests = len(rating_service.requests)
+        refresh_external_ratings(batch_size=2)
+        assert rating_service.requests[requests:] == ['Down'] * 3
+
+        requests = len(rating_service.requests)
+        refresh_external_ratings(batch_size=2, force=True)
+        assert sorted(set(rating_service.requests[requests:])) == ['Down', 'Heat', 'Lost', 'Ronin']
@@ -0,0 +1,91 @@
+from app.extensions import db
+from app.facets import facet_counts, faceted_search
+from app.models import Movie
+
+
+def _catalog():
+    # Без оценок пользователей average_rating равен половине внешнего рейтинга
+    movies = [
+        Movie(title=title, description='d', genre=genre, year=year, external_rating=rating,
+              thumbnail_url='t.jpg', video_url='m.mp4')
+        for title, genre, year, rating in (
+            ('Heat', 'Crime, Drama', 1995, 9.0),
+            ('Ronin', 'Crime', 1998, 9.0),
+            ('Thief', 'Crime', 1981, 7.0),
+            ('Collateral', 'Crime, Thriller', 2004, 10.0),
+            ('Sicario', 'Drama', 2015, 5.0),
+            ('Alien', 'Horror', 1979, 3.0),
+        )
+    ]
+    db.session.add_all(movies)
+    db.session.commit()
+
+
+def _titles(items):
+    return [item.title for item in items]
+
+
+def test_facet_counts_ignore_own_filter(app):
+    with app.app_context():
+        _catalog()
+        total, facets = facet_counts('movie', {'genre': 'crime'})
+        assert total == 4
+        # Счётчики жанров — по всему каталогу, чтобы были видны соседние жанры
+        assert [(item['value'], item['count']) for item in facets['genre']] == [
+            ('crime', 4), ('drama', 2), ('horror', 1), ('thriller', 1),
+        ]
+        assert [(item['value'], item['count']) for item in facets['decade']] == [(2000, 1), (1990, 2), (1980, 1)]
+        assert [(item['value'], item['count']) for item in facets['rating']] == [('4-6', 3), ('2-4', 1)]
+
+        total, facets = facet_counts('movie', {'genre': 'crime', 'min_year': 1990})
+        assert total == 3
+        assert [(item['value'], item['count']) for item in facets['genre']] == [
+            ('crime', 3), ('drama', 2), ('thriller', 1),
+        ]
+        # Фильтр по годам не сужает собственный фасет
+        assert [item['value'] for item in facets['decade']] == [2000, 1990, 1980]
+
+
+def test_results_are_paged_by_rating_cursor(app):
+    with app.app_context():
+        _catalog()
+        items, cursor, total, _ = faceted_search('movie', {}, per_page=2)
+        # При равном рейтинге порядок задаёт id
+        assert _titles(items) == ['Collateral', 'Ronin']
+        assert total == 6
+
+        # Новый контент в начале выдачи не сдвигает следующие страницы
+        db.session.add(Movie(title='Sicario 2', description='d', genre='Crime', year=2018, external_rating=10.0,
+                             thumbnail_url='t.jpg', video_url='m.mp4'))
+        db.session.commit()
+        pages = []
+        while cursor:
+            items, cursor, _, _ = faceted_search('movie', {}, cursor, per_page=2)
+            pages.append(_titles(items))
+        assert pages == [['Heat', 'Thief'], ['Sicario', 'Alien']]
+
+
+def test_api_advanced_search_pages_with_cursor(app, client):
+    with app.app_context():
+        _catalog()
+    data = client.get('/api/search/advanced?genre=crime&per_page=3').get_json()
+    assert [item['title'] for item in data['items']] == ['Collateral', 'Ronin', 'Heat']
+    assert data['total'] == 4
+    assert data['facets']['rating'][0]['count'] == 3
+
+    data = client.get(f"/api/search/advanced?genre=crime&per_page=3&cursor={data['next_cursor']}").get_json()
+    assert [item['title'] for item in data['items']] == ['Thief']
+    assert data['next_cursor'] is None
+
+    assert client.get('/api/search/advanced?cursor=broken').status_code == 400
+    assert client.get('/search/advanced?cursor=broken').status_code == 400
+
+
+def test_advanced_search_page_links_next_cursor(app, client):
+    app.config['SEARCH_PER_PAGE'] = 2
+    with app.app_context():
+        _catalog()
+    page = client.get('/search/advanced?genre=crime').get_data(as_text=True)
+    assert '4 results' in page
+    assert 'cursor=' in page
+    assert page.index('Collateral') < page.index('Ronin')
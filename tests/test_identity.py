@@ -0,0 +1,56 @@
+from app import create_app
+from app.extensions import db
+from app.identity import load_user
+from app.models import User
+from app.queries import count_queries
+
+
+def test_cached_user_is_loaded_without_queries(app, user):
+    with app.app_context():
+        assert load_user(user).username == 'viewer'
+        db.session.remove()
+        with count_queries() as statements:
+            cached = load_user(user)
+            assert cached.username == 'viewer'
+        assert not any('FROM user' in statement for statement in statements)
+
+        # Объект из кэша — обычный объект сессии: изменения сохраняются
+        cached.username = 'renamed'
+        db.session.commit()
+        db.session.remove()
+        assert load_user(user).username == 'renamed'
+
+
+def test_update_in_another_process_invalidates_cached_user(app, user):
+    # Второй процесс сервера: та же база и тот же каталог кэша, но своё приложение
+    other = create_app({
+        key: app.config[key] for key in (
+            'SQLALCHEMY_DATABASE_URI', 'TESTING', 'CACHE_BACKEND', 'CACHE_DIR',
+            'JOBS_BACKGROUND', 'WATCH_EVENTS_ASYNC',
+        )
+    })
+    try:
+        with app.app_context():
+            assert load_user(user).username == 'viewer'
+        with other.app_context():
+            renamed = db.session.get(User, user)
+            renamed.username = 'renamed'
+            db.session.commit()
+        with app.app_context():
+            assert load_user(user).username == 'renamed'
+
+        # Откат не сбрасывает кэш: в базе осталась прежняя строка
+        with other.app_context():
+            db.session.get(User, user).username = 'rolled-back'
+            db.session.flush()
+            db.session.rollback()
+        with app.app_context():
+            with count_queries() as statements:
+                assert load_user(user).username == 'renamed'
+            assert not statements
+    finally:
+        other.extensions['external_ratings'].stop()
+        with other.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
@@ -0,0 +1,34 @@
+import pytest
+
+from app.extensions import db
+from app.importer import RowError, _Importer, import_file
+from app.models import Movie
+from app.search import search_content
+
+
+def test_importer_requires_prepare_and_write():
+    class Incomplete(_Importer):
+        def prepare(self, row):
+            return row
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_aborted_import_rebuilds_derived_data(app, tmp_path):
+    path = tmp_path / 'movies.jsonl'
+    path.write_text('\n'.join([
+        '{"title": "Heat", "description": "Heist drama", "genre": "Crime", "year": 1995, "video_url": "h.mp4"}',
+        '{"title": "Ronin", "description": "Spy thriller", "genre": "Action", "year": 1998, "video_url": "r.mp4"}',
+        '{"title": "", "video_url": "x.mp4"}',
+        'not json',
+    ]), encoding='utf-8')
+
+    with app.app_context():
+        with pytest.raises(RowError, match='too many invalid rows'):
+            import_file('movies', str(path), batch_size=1, max_errors=2)
+
+        # Импортированные до прерывания фильмы получили жанры и попали в поисковый индекс
+        movies = db.session.scalars(db.select(Movie).order_by(Movie.id)).all()
+        assert [[genre.name for genre in movie.genres] for movie in movies] == [['crime'], ['action']]
+        assert [movie.title for movie in search_content('heat', 'movie')[0]] == ['Heat']
@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from app.extensions import db
+from app.jobs import JobWorker, enqueue_job, task
+from app.models import Job, Movie
+
+release = threading.Event()
+
+
+@task('tests.wait_for_release')
+def wait_for_release():
+    release.wait(10)
+    return {'released': True}
+
+
+def _finish(worker, job_id, token, result=None, error=None):
+    future = Future()
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+    worker._running[future] = (job_id, token)
+    return worker._finish(future)
+
+
+def test_running_job_is_not_reclaimed_while_heartbeating(app):
+    app.config.update(JOBS_CLAIM_TIMEOUT=1, JOBS_HEARTBEAT_INTERVAL=0.2, JOBS_POLL_INTERVAL=0.1)
+    release.clear()
+    with app.app_context():
+        job_id = enqueue_job('tests.wait_for_release').id
+
+    def drain():
+        with app.app_context():
+            JobWorker(app).drain()
+
+    thread = threading.Thread(target=drain)
+    thread.start()
+    try:
+        # Дольше таймаута захвата: без продления задачу забрал бы второй исполнитель
+        time.sleep(1.5)
+        with app.app_context():
+            assert JobWorker(app)._claim(1) == []
+    finally:
+        release.set()
+        thread.join(10)
+
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts, job.result) == ('succeeded', 1, {'released': True})
+
+
+def test_watch_page_polls_owned_jobs(app, client, user, login):
+    with app.app_context():
+        movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='m.mp4')
+        db.session.add(movie)
+        db.session.commit()
+        movie_id = movie.id
+        job_id = enqueue_job('tests.wait_for_release', user_id=user).id
+
+    url = f'/watch/movie/{movie_id}?job={job_id}'
+    assert f'data-url="/jobs/{job_id}"'.encode() not in client.get(url).data
+
+    login(user)
+    assert f'data-url="/jobs/{job_id}"'.encode() in client.get(url).data
+    response = client.get(f'/jobs/{job_id}')
+    assert response.json['status'] == 'queued'
+    assert response.headers['Retry-After']
+
+
+def test_stale_worker_does_not_overwrite_reclaimed_job(app):
+    app.config['JOBS_CLAIM_TIMEOUT'] = 0
+    with app.app_context():
+        job_id = enqueue_job('tests.wait_for_release').id
+        stale, fresh = JobWorker(app), JobWorker(app)
+        [job] = stale._claim(1)
+        stale_token = job.claim_token
+        time.sleep(0.01)
+        # Первый исполнитель считается упавшим, задачу забирает второй
+        [job] = fresh._claim(1)
+        fresh_token = job.claim_token
+        assert fresh_token != stale_token
+
+        assert _finish(fresh, job_id, fresh_token, result={'released': True})
+        assert not _finish(stale, job_id, stale_token, error=RuntimeError('late failure'))
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts, job.result, job.last_error) == ('succeeded', 1, {'released': True}, None)
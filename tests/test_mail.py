@@ -0,0 +1,102 @@
+import smtplib
+from datetime import datetime
+
+import pytest
+
+from app.extensions import db
+from app.jobs import JobWorker
+from app.models import Job
+from app.outbox import enqueue_mail
+
+
+class FakeSMTP:
+    """
+    SMTP-сервер в памяти: failures — ошибки, которые вернут следующие попытки соединения.
+    """
+    connections = []
+    failures = []
+
+    def __init__(self, host, port, timeout=None):
+        if FakeSMTP.failures:
+            raise FakeSMTP.failures.pop(0)
+        self.sent = []
+        FakeSMTP.connections.append(self)
+
+    def send_message(self, message):
+        if message['To'] == 'refused@example.com':
+            raise smtplib.SMTPRecipientsRefused({'refused@example.com': (550, b'No such user')})
+        self.sent.append(message)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    FakeSMTP.connections, FakeSMTP.failures = [], []
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    app.config['MAIL_RATE'] = 0
+    return FakeSMTP
+
+
+def _drain(app):
+    with app.app_context():
+        return JobWorker(app).drain()
+
+
+def _job(app, job_id):
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        db.session.expunge(job)
+        return job
+
+
+def test_forgot_password_mail_is_sent_by_job(app, client, user, smtp):
+    response = client.post('/auth/forgot-password', data={'email': 'viewer@example.com'})
+    assert response.status_code == 200
+    # Запрос только ставит задачу
+    assert not smtp.connections
+
+    assert _drain(app) == (1, 0)
+    [message] = smtp.connections[0].sent
+    assert message['To'] == 'viewer@example.com'
+    assert message['Subject'] == 'Password Reset Request'
+    assert '/auth/reset-password/' in message.get_content()
+
+
+def test_unreachable_server_is_retried_with_backoff(app, smtp):
+    smtp.failures = [ConnectionRefusedError('down'), ConnectionRefusedError('down')]
+    with app.app_context():
+        job_id = enqueue_mail('Hello', ['a@example.com'], 'body').id
+
+    for attempt in (1, 2):
+        assert _drain(app) == (0, 1)
+        job = _job(app, job_id)
+        assert (job.status, job.attempts) == ('queued', attempt)
+        assert 'down' in job.last_error
+        assert job.next_attempt_at > datetime.utcnow()
+        with app.app_context():
+            db.session.execute(db.update(Job).values(next_attempt_at=datetime.utcnow()))
+            db.session.commit()
+
+    assert _drain(app) == (1, 0)
+    assert _job(app, job_id).status == 'succeeded'
+    assert len(smtp.connections[0].sent) == 1
+
+
+def test_connection_is_reused_and_refused_recipient_is_not_retried(app, smtp):
+    with app.app_context():
+        ids = [
+            enqueue_mail('Hello', [address], 'body').id
+            for address in ('a@example.com', 'refused@example.com', 'b@example.com')
+        ]
+
+    assert _drain(app) == (2, 1)
+    assert len(smtp.connections) == 1
+    assert [message['To'] for message in smtp.connections[0].sent] == ['a@example.com', 'b@example.com']
+    refused = _job(app, ids[1])
+    assert (refused.status, refused.attempts) == ('failed', 1)
+    assert 'refused@example.com' in refused.last_error
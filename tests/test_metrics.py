@@ -0,0 +1,14 @@
+def test_metrics_closed_without_configuration(app, client):
+    # Локальный адрес тестового клиента больше не даёт доступа сам по себе
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_token(app, client):
+    app.config['METRICS_TOKEN'] = 'secret-token'
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong-token'}).status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret-token'}).status_code == 200
+
+
+def test_metrics_allowed_ips_opt_in(app, client):
+    app.config['METRICS_ALLOWED_IPS'] = ('127.0.0.1',)
+    assert client.get('/metrics').status_code == 200
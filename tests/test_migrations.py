@@ -0,0 +1,109 @@
+import sqlite3
+
+from app import create_app
+from app.extensions import db
+from app.migrations import current_version, upgrade_schema
+from app.models import Job, Rating, Show, VideoPackage
+
+
+# Схема до появления миграций: у rating нет movie_id, а show_id ссылается на movie
+LEGACY_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+    password_hash VARCHAR(128) NOT NULL
+);
+CREATE TABLE movie (
+    id INTEGER PRIMARY KEY, title VARCHAR(150) NOT NULL, description TEXT NOT NULL, genre VARCHAR(100),
+    year INTEGER, thumbnail_url VARCHAR(250) NOT NULL, video_url VARCHAR(250) NOT NULL, external_rating FLOAT
+);
+CREATE TABLE show (
+    id INTEGER PRIMARY KEY, title VARCHAR(150) NOT NULL, description TEXT NOT NULL, genre VARCHAR(100),
+    year INTEGER, thumbnail_url VARCHAR(250) NOT NULL, external_rating FLOAT
+);
+CREATE TABLE comment (
+    id INTEGER PRIMARY KEY, content TEXT NOT NULL, timestamp DATETIME, user_id INTEGER NOT NULL,
+    movie_id INTEGER REFERENCES movie (id), show_id INTEGER REFERENCES show (id)
+);
+CREATE TABLE rating (
+    id INTEGER PRIMARY KEY, rating INTEGER NOT NULL, user_id INTEGER NOT NULL REFERENCES user (id),
+    show_id INTEGER NOT NULL REFERENCES movie (id)
+);
+INSERT INTO user VALUES (1, 'viewer', 'viewer@example.com', 'hash');
+INSERT INTO show VALUES (1, 'Lost', 'd', 'Drama', 2004, 't.jpg', 0);
+INSERT INTO rating VALUES (1, 3, 1, 1), (2, 5, 1, 1);
+"""
+
+
+def test_upgrade_legacy_database_with_duplicate_ratings(tmp_path):
+    path = tmp_path / 'legacy.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA)
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'AUTO_MIGRATE': True,
+        'TESTING': True,
+        'CACHE_DIR': str(tmp_path / 'cache'),
+    })
+    with app.app_context():
+        # Остаётся последняя оценка, агрегаты пересчитаны
+        assert db.session.execute(db.select(Rating.id, Rating.rating)).all() == [(2, 5)]
+        indexes = set(db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        assert {'ux_rating_user_movie', 'ux_rating_user_show'} <= indexes
+        assert db.session.execute(db.select(Show.rating_sum, Show.rating_count)).one() == (5, 1)
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+# Очереди писем и упаковки до переноса на таблицу job (миграция 12)
+OUTBOX_SCHEMA = """
+CREATE TABLE outbox_message (
+    id INTEGER PRIMARY KEY, subject VARCHAR(255) NOT NULL, sender VARCHAR(255), recipients JSON NOT NULL,
+    body TEXT NOT NULL, status VARCHAR(20) NOT NULL, attempts INTEGER NOT NULL, next_attempt_at DATETIME NOT NULL,
+    claim_token VARCHAR(32), claimed_at DATETIME, last_error TEXT, created_at DATETIME NOT NULL, sent_at DATETIME
+);
+INSERT INTO outbox_message VALUES
+    (1, 'Reset', NULL, '["a@example.com"]', 'body', 'pending', 2, '2024-01-01', NULL, NULL, 'timeout', '2024-01-01', NULL),
+    (2, 'Sent', NULL, '["b@example.com"]', 'body', 'sent', 1, '2024-01-01', NULL, NULL, NULL, '2024-01-01', '2024-01-01');
+ALTER TABLE video_package ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE video_package ADD COLUMN next_attempt_at DATETIME NOT NULL DEFAULT '2024-01-01';
+ALTER TABLE video_package ADD COLUMN claimed_at DATETIME;
+CREATE INDEX ix_video_package_status_next_attempt ON video_package (status, next_attempt_at);
+INSERT INTO video_package (id, content_type, content_id, status, version, created_at, updated_at) VALUES
+    (1, 'movie', 1, 'processing', NULL, '2024-01-01', '2024-01-01'),
+    (2, 'movie', 2, 'ready', 'v1', '2024-01-01', '2024-01-01');
+"""
+
+
+def test_queued_mail_and_packages_move_to_jobs(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'queues.db'}",
+        'AUTO_MIGRATE': False,
+        'TESTING': True,
+        'CACHE_DIR': str(tmp_path / 'cache'),
+    })
+    with app.app_context():
+        upgrade_schema(target=11)
+        connection = db.session.connection().connection.driver_connection
+        connection.executescript(OUTBOX_SCHEMA)
+
+        assert upgrade_schema(target=12) == [(12, 'queues_on_jobs')]
+        assert current_version() == 12
+        jobs = {job.name: job for job in Job.query}
+        assert set(jobs) == {'mail.send', 'packaging.package'}
+        assert jobs['mail.send'].payload == {
+            'subject': 'Reset', 'recipients': ['a@example.com'], 'body': 'body', 'sender': None,
+        }
+        package = db.session.get(VideoPackage, 1)
+        assert package.status == 'pending'
+        assert jobs['packaging.package'].payload == {'package_id': 1, 'token': package.claim_token}
+        assert db.session.get(VideoPackage, 2).version == 'v1'
+
+        tables = set(db.inspect(db.session.connection()).get_table_names())
+        assert 'outbox_message' not in tables
+        columns = {column['name'] for column in db.inspect(db.session.connection()).get_columns('video_package')}
+        assert not columns & {'attempts', 'next_attempt_at', 'claimed_at'}
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
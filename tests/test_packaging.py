@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from app.extensions import db
+from app.jobs import JobWorker
+from app.models import Job, Movie, VideoPackage
+from app.packaging import PackagingError, enqueue_packaging
+
+RENDITIONS = [{'name': '360p', 'width': 640, 'height': 360, 'bandwidth': 985600}]
+
+
+@pytest.fixture
+def movie_id(app, tmp_path, monkeypatch):
+    source = tmp_path / 'movie.mp4'
+    source.write_bytes(b'video')
+    monkeypatch.setattr('app.packaging.video_file_path', lambda video_url: str(source) if video_url else None)
+    with app.app_context():
+        movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='movie.mp4')
+        db.session.add(movie)
+        db.session.commit()
+        return movie.id
+
+
+def _fake_package_video(calls, before_finish=None):
+    def package_video(source_path, output_dir):
+        os.makedirs(os.path.join(output_dir, '360p'))
+        calls.append(os.path.basename(output_dir))
+        if before_finish is not None:
+            before_finish()
+        return RENDITIONS
+    return package_video
+
+
+def _drain(app):
+    with app.app_context():
+        return JobWorker(app).drain()
+
+
+def _package(app, movie_id):
+    with app.app_context():
+        package = db.session.scalar(db.select(VideoPackage).filter_by(content_type='movie', content_id=movie_id))
+        db.session.expunge(package)
+        return package
+
+
+def _versions(app, movie_id):
+    return sorted(os.listdir(os.path.join(app.config['PACKAGING_DIR'], 'movie', str(movie_id))))
+
+
+def test_repackaging_switches_version_and_removes_previous(app, movie_id, monkeypatch):
+    calls = []
+    monkeypatch.setattr('app.packaging.package_video', _fake_package_video(calls))
+    for _ in range(2):
+        with app.app_context():
+            enqueue_packaging('movie', movie_id)
+        assert _drain(app) == (1, 0)
+
+    package = _package(app, movie_id)
+    assert (package.status, package.version, package.renditions) == ('ready', calls[-1], RENDITIONS)
+    assert _versions(app, movie_id) == [calls[-1]]
+
+
+def test_superseded_run_discards_its_result(app, movie_id, monkeypatch):
+    calls = []
+
+    def enqueue_again():
+        # Видео поставили заново, пока шло кодирование: результат этой попытки устарел
+        if len(calls) == 1:
+            with app.app_context():
+                enqueue_packaging('movie', movie_id)
+
+    monkeypatch.setattr('app.packaging.package_video', _fake_package_video(calls, before_finish=enqueue_again))
+    with app.app_context():
+        first_token = enqueue_packaging('movie', movie_id).claim_token
+
+    assert _drain(app) == (2, 0)
+    package = _package(app, movie_id)
+    assert package.claim_token != first_token
+    assert (package.status, package.version) == ('ready', calls[1])
+    # Каталог устаревшей попытки удалён, каталог новой не тронут
+    assert _versions(app, movie_id) == [calls[1]]
+    with app.app_context():
+        results = [job.result for job in Job.query.filter_by(name='packaging.package').order_by(Job.id)]
+    assert results == [{'superseded': True}, {'version': calls[1], 'renditions': 1}]
+
+
+def test_failed_encode_is_retried_by_job_queue(app, movie_id, monkeypatch):
+    def failing(source_path, output_dir):
+        raise PackagingError('ffmpeg failed for 360p: boom')
+
+    monkeypatch.setattr('app.packaging.package_video', failing)
+    with app.app_context():
+        enqueue_packaging('movie', movie_id)
+    assert _drain(app) == (0, 1)
+
+    package = _package(app, movie_id)
+    assert (package.status, package.version, package.last_error) == ('failed', None, 'ffmpeg failed for 360p: boom')
+    with app.app_context():
+        job = Job.query.filter_by(name='packaging.package').one()
+        assert (job.status, job.attempts) == ('queued', 1)
+
+
+def test_missing_source_fails_without_retry(app, movie_id, monkeypatch):
+    monkeypatch.setattr('app.packaging.video_file_path', lambda video_url: None)
+    with app.app_context():
+        enqueue_packaging('movie', movie_id)
+    assert _drain(app) == (0, 1)
+
+    assert _package(app, movie_id).status == 'failed'
+    with app.app_context():
+        job = Job.query.filter_by(name='packaging.package').one()
+        assert (job.status, job.last_error) == ('failed', 'source video not found')
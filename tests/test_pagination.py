@@ -0,0 +1,70 @@
+import re
+
+import pytest
+
+from app.extensions import db
+from app.models import Movie
+from app.pagination import decode_cursor, encode_cursor, paginate_keyset
+
+
+@pytest.fixture
+def movies(app):
+    with app.app_context():
+        # Одинаковые рейтинги и NULL проверяют порядок по id и замену NULL нулём
+        ratings = [9.0, 8.0, 8.0, 8.0, None, 7.5, None]
+        db.session.add_all([
+            Movie(title=f'M{number}', description='d', thumbnail_url='t.jpg', video_url='m.mp4',
+                  external_rating=rating, year=2000 + number)
+            for number, rating in enumerate(ratings)
+        ])
+        db.session.commit()
+        return db.session.scalars(
+            db.select(Movie.title).order_by(db.func.coalesce(Movie.external_rating, 0).desc(), Movie.id.desc())
+        ).all()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(7.5, 42)) == (7.5, 42)
+    for cursor in ('garbage', encode_cursor('text', 1), encode_cursor(1, 'id')):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_keyset_pages_cover_catalog_once(app, movies):
+    with app.app_context():
+        seen, cursor = [], None
+        while True:
+            items, cursor = paginate_keyset(Movie, 'rating', cursor, per_page=2)
+            seen.extend(movie.title for movie in items)
+            if cursor is None:
+                break
+        assert seen == movies
+
+
+def test_list_page_links_next_cursor(app, client, movies):
+    app.config['LIST_PER_PAGE'] = 4
+    response = client.get('/list?type=movie&sort=rating')
+    assert response.status_code == 200
+    assert all(f'>{title}<'.encode() in response.data for title in movies[:4])
+
+    next_url = re.search(rb'href="(/list\?[^"]*cursor=[^"]+)"', response.data).group(1).decode().replace('&amp;', '&')
+    response = client.get(next_url)
+    assert all(f'>{title}<'.encode() in response.data for title in movies[4:])
+    assert b'cursor=' not in response.data
+    assert client.get('/list?type=movie&cursor=broken').status_code == 400
+
+
+def test_api_list_streams_pages(client, movies):
+    seen, cursor = [], None
+    while True:
+        url = '/api/list?type=movie&sort=rating&limit=3&fields=title'
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        seen.extend(item['title'] for item in response.json['items'])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert seen == movies
+
+    assert client.get('/api/list?fields=password').status_code == 400
+    assert client.get('/api/list?cursor=broken').status_code == 400
@@ -0,0 +1,59 @@
+import pytest
+
+from app.extensions import db
+from app.models import Comment, Movie, Season, Show, Episode
+from app.queries import assert_max_queries
+
+
+def _show_with_seasons(seasons, episodes):
+    show = Show(title='Long show', description='d', genre='Drama', year=2001, thumbnail_url='t.jpg')
+    db.session.add(show)
+    db.session.flush()
+    for season_number in range(1, seasons + 1):
+        season = Season(show_id=show.id, season_number=season_number)
+        db.session.add(season)
+        db.session.flush()
+        db.session.add_all([
+            Episode(season_id=season.id, episode_number=number, title=f'E{number}', video_url='e.mp4')
+            for number in range(1, episodes + 1)
+        ])
+    db.session.commit()
+    return show.id
+
+
+@pytest.mark.parametrize('seasons', [1, 20])
+def test_watch_show_query_budget(app, client, user, seasons):
+    with app.app_context():
+        show_id = _show_with_seasons(seasons, episodes=5)
+        db.session.add_all([Comment(content=f'c{i}', user_id=user, show_id=show_id) for i in range(5)])
+        db.session.commit()
+
+        # Сериал с сезонами, серии с HLS-версиями, комментарии с авторами — число
+        # запросов не зависит от количества сезонов
+        with assert_max_queries(4):
+            response = client.get(f'/watch/show/{show_id}')
+    assert response.status_code == 200
+    assert b'Season 1' in response.data
+
+
+def test_watch_movie_query_budget(app, client, user):
+    with app.app_context():
+        movie = Movie(title='Film', description='d', genre='Drama', year=2001, thumbnail_url='t.jpg', video_url='m.mp4')
+        db.session.add(movie)
+        db.session.flush()
+        movie_id = movie.id
+        db.session.add_all([Comment(content=f'c{i}', user_id=user, movie_id=movie_id) for i in range(5)])
+        db.session.commit()
+
+        # Фильм вместе с HLS-версией и комментарии с авторами
+        with assert_max_queries(2):
+            response = client.get(f'/watch/movie/{movie_id}')
+    assert response.status_code == 200
+
+
+def test_assert_max_queries_reports_statements(app):
+    with app.app_context():
+        with pytest.raises(AssertionError, match='Expected at most 1 queries, got 2'):
+            with assert_max_queries(1):
+                db.session.execute(db.select(Movie.id)).all()
+                db.session.execute(db.select(Show.id)).all()
@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from app import create_app
+from app.extensions import db
+from app.models import Movie, Rating, User
+from app import ratings
+from app.ratings import rate_content_batch, rebuild_rating_aggregates
+
+
+@pytest.fixture
+def second_app(app):
+    # Второй экземпляр приложения со своими пулами к той же базе, как второй процесс сервера
+    other = create_app(dict(app.config))
+    yield other
+    with other.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_concurrent_batches_keep_aggregates_consistent(app, second_app, monkeypatch):
+    with app.app_context():
+        user = User(username='viewer', email='viewer@example.com')
+        user.set_password('secret-password')
+        movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='m.mp4')
+        db.session.add_all([user, movie])
+        db.session.commit()
+        user_id, movie_id = user.id, movie.id
+
+    # Обе транзакции доходят до записи, не видя оценок друг друга
+    barrier = threading.Barrier(2, timeout=10)
+    upsert_ratings = ratings.upsert_ratings
+
+    def upsert_after_barrier(content_type, rows):
+        barrier.wait()
+        upsert_ratings(content_type, rows)
+
+    monkeypatch.setattr(ratings, 'upsert_ratings', upsert_after_barrier)
+
+    errors = []
+
+    def rate(instance, value):
+        try:
+            with instance.app_context():
+                rate_content_batch(user_id, [{'content_type': 'movie', 'content_id': movie_id, 'rating': value}])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=rate, args=args) for args in ((app, 4), (second_app, 8))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(20)
+    assert not errors
+
+    with app.app_context():
+        value = db.session.scalar(db.select(Rating.rating))
+        assert db.session.execute(db.select(Movie.rating_sum, Movie.rating_count)).one() == (value, 1)
+
+
+def _movie_and_users(count):
+    users = []
+    for number in range(count):
+        user = User(username=f'viewer{number}', email=f'viewer{number}@example.com')
+        user.set_password('secret-password')
+        users.append(user)
+    movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='m.mp4', external_rating=7.0)
+    db.session.add_all([movie, *users])
+    db.session.commit()
+    return movie, [user.id for user in users]
+
+
+def _aggregates(movie_id):
+    return db.session.execute(
+        db.select(Movie.rating_sum, Movie.rating_count, Movie.average_rating).where(Movie.id == movie_id)
+    ).one()
+
+
+def test_orm_events_maintain_aggregates(app):
+    with app.app_context():
+        movie, (first, second) = _movie_and_users(2)
+        movie_id = movie.id
+        first_rating = Rating(user_id=first, movie_id=movie_id, rating=8)
+        second_rating = Rating(user_id=second, movie_id=movie_id, rating=5)
+        db.session.add_all([first_rating, second_rating])
+        db.session.commit()
+        # (6.5 + 7.0) / 2 = 6.75 → 6.8
+        assert _aggregates(movie_id) == (13, 2, 6.8)
+
+        # Объект истёк после commit — прежняя оценка всё равно учитывается
+        second_rating.rating = 9
+        db.session.commit()
+        assert _aggregates(movie_id) == (17, 2, 7.8)
+
+        db.session.delete(first_rating)
+        db.session.commit()
+        assert _aggregates(movie_id) == (9, 1, 8.0)
+
+        movie = db.session.get(Movie, movie_id)
+        db.session.refresh(movie)
+        assert movie.average_rating == 8.0
+
+
+def test_rebuild_rating_aggregates(app):
+    with app.app_context():
+        movie, (first, second) = _movie_and_users(2)
+        movie_id = movie.id
+        db.session.add_all([
+            Rating(user_id=first, movie_id=movie_id, rating=4),
+            Rating(user_id=second, movie_id=movie_id, rating=6),
+        ])
+        db.session.commit()
+        db.session.execute(db.update(Movie).values(rating_sum=0, rating_count=0))
+        db.session.commit()
+
+        rebuild_rating_aggregates(batch_size=1)
+        assert _aggregates(movie_id) == (10, 2, 6.0)
+
+
+def test_average_rating_sorts_in_sql(app):
+    with app.app_context():
+        movie, (user_id,) = _movie_and_users(1)
+        other = Movie(title='Ronin', description='d', thumbnail_url='t.jpg', video_url='r.mp4', external_rating=9.0)
+        db.session.add(other)
+        db.session.add(Rating(user_id=user_id, movie_id=movie.id, rating=1))
+        db.session.commit()
+        titles = db.session.scalars(db.select(Movie.title).order_by(Movie.average_rating.desc())).all()
+        assert titles == ['Ronin', 'Heat']
+
+
+def test_average_rating_expression_on_postgresql():
+    # round(double precision, integer) в PostgreSQL не существует
+    index = next(index for index in Movie.__table__.indexes if index.name == 'ix_movie_average_rating')
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert ddl.startswith('CREATE INDEX ix_movie_average_rating ON movie (round(CAST(')
+    assert ddl.endswith('AS NUMERIC), 1), id)')
+
+    query = str(db.select(Movie.id).order_by(Movie.average_rating.desc()).compile(dialect=postgresql.dialect()))
+    assert 'ORDER BY round(CAST(' in query
@@ -0,0 +1,82 @@
+from app import create_app
+from app.cache import invalidate_catalog
+from app.extensions import db
+from app.models import Movie, Rating, Recommendation, User
+from app.recommendations import build_recommendations, get_recommendations, invalidate_recommendations
+
+
+def _catalog():
+    users = []
+    for number in range(3):
+        user = User(username=f'viewer{number}', email=f'viewer{number}@example.com')
+        user.set_password('secret-password')
+        users.append(user)
+    movies = [
+        Movie(title=title, description='d', thumbnail_url='t.jpg', video_url='m.mp4', external_rating=rating)
+        for title, rating in (('Heat', 8.0), ('Ronin', 7.0), ('Thief', 6.0), ('Collateral', 5.0))
+    ]
+    db.session.add_all(users + movies)
+    db.session.commit()
+    return [user.id for user in users], {movie.title: movie.id for movie in movies}
+
+
+def _titles(items):
+    return [item.title for item in items]
+
+
+def test_build_recommends_neighbours_first(app):
+    with app.app_context():
+        (first, second, _), movies = _catalog()
+        # Оба оценили Thief, второй ещё и Collateral — первому он рекомендуется раньше топа
+        db.session.add_all([
+            Rating(user_id=first, movie_id=movies['Thief'], rating=9),
+            Rating(user_id=second, movie_id=movies['Thief'], rating=8),
+            Rating(user_id=second, movie_id=movies['Collateral'], rating=8),
+        ])
+        db.session.commit()
+
+        assert build_recommendations(limit=3) == 5
+        assert _titles(get_recommendations(first, 'movie')) == ['Collateral', 'Heat', 'Ronin']
+
+        # Оценённый контент убирается из готового списка
+        invalidate_recommendations(first, 'movie', content_id=movies['Collateral'])
+        db.session.commit()
+        assert _titles(get_recommendations(first, 'movie')) == ['Heat', 'Ronin']
+        assert db.session.scalar(db.select(db.func.count()).select_from(Recommendation)) == 4
+
+
+def test_fallback_top_follows_catalog_changes(app):
+    with app.app_context():
+        (_, _, newcomer), movies = _catalog()
+        assert _titles(get_recommendations(newcomer, 'movie'))[:2] == ['Heat', 'Ronin']
+
+        db.session.add(Movie(title='Sicario', description='d', thumbnail_url='t.jpg', video_url='s.mp4',
+                             external_rating=9.5))
+        db.session.commit()
+        invalidate_catalog()
+        assert _titles(get_recommendations(newcomer, 'movie'))[:2] == ['Sicario', 'Heat']
+
+
+def test_rebuild_in_another_process_reaches_cached_lists(app):
+    # Второй процесс (команда flask или worker.py): та же база и тот же каталог кэша
+    other = create_app({
+        key: app.config[key] for key in (
+            'SQLALCHEMY_DATABASE_URI', 'TESTING', 'CACHE_DIR', 'JOBS_BACKGROUND', 'WATCH_EVENTS_ASYNC',
+        )
+    })
+    try:
+        with app.app_context():
+            (first, _, _), movies = _catalog()
+            db.session.add(Rating(user_id=first, movie_id=movies['Heat'], rating=9))
+            db.session.commit()
+            assert _titles(get_recommendations(first, 'movie'))[:2] == ['Heat', 'Ronin']
+        with other.app_context():
+            build_recommendations(limit=3)
+        with app.app_context():
+            assert 'Heat' not in _titles(get_recommendations(first, 'movie'))
+    finally:
+        other.extensions['external_ratings'].stop()
+        with other.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
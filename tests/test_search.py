@@ -0,0 +1,71 @@
+from app.extensions import db
+from app.models import Movie
+from app.search import search_content
+
+
+def test_search_does_not_wait_for_open_write_transaction(app):
+    with app.app_context():
+        db.session.add(Movie(title='Heat', description='Heist drama', genre='Crime', year=1995,
+                             thumbnail_url='t.jpg', video_url='m.mp4'))
+        db.session.commit()
+
+        # Единственное соединение записи SQLite занято незавершённой транзакцией
+        with db.engine.connect() as writer:
+            writer.execute(db.update(Movie).values(year=1996))
+            items, has_next = search_content('heat', 'movie')
+            writer.rollback()
+
+        assert [movie.title for movie in items] == ['Heat']
+        assert not has_next
+
+
+def _add_movies(*movies):
+    db.session.add_all([
+        Movie(title=title, description=description, genre=genre, year=2000, thumbnail_url='t.jpg', video_url='m.mp4')
+        for title, description, genre in movies
+    ])
+    db.session.commit()
+
+
+def _titles(query, **options):
+    items, has_next = search_content(query, 'movie', **options)
+    return [movie.title for movie in items], has_next
+
+
+def test_prefix_and_typo_matching(app):
+    with app.app_context():
+        _add_movies(
+            ('Interstellar', 'Space travel through a wormhole', 'Science fiction'),
+            ('Heat', 'Heist drama in Los Angeles', 'Crime'),
+        )
+        assert _titles('inters') == (['Interstellar'], False)
+        # Слово с опечаткой заменяется похожими словами из словаря индекса
+        assert _titles('intersteller') == (['Interstellar'], False)
+        assert _titles('wormhole space') == (['Interstellar'], False)
+        assert _titles('nothing like this') == ([], False)
+
+
+def test_title_ranks_above_description(app):
+    with app.app_context():
+        _add_movies(
+            ('Ocean documentary', 'A film about whales', 'Documentary'),
+            ('Whales', 'Ocean life', 'Documentary'),
+        )
+        assert _titles('whales')[0] == ['Whales', 'Ocean documentary']
+
+
+def test_index_follows_changes_and_pages(app):
+    with app.app_context():
+        _add_movies(*((f'Heat {number}', 'Heist drama', 'Crime') for number in range(3)))
+        first_page, has_next = _titles('heat', per_page=2)
+        second_page, _ = _titles('heat', page=2, per_page=2)
+        assert has_next and len(first_page) == 2 and len(second_page) == 1
+        assert sorted(first_page + second_page) == ['Heat 0', 'Heat 1', 'Heat 2']
+
+        movie = db.session.scalar(db.select(Movie).filter_by(title='Heat 0'))
+        movie.title = 'Ronin'
+        db.session.commit()
+        db.session.delete(db.session.scalar(db.select(Movie).filter_by(title='Heat 1')))
+        db.session.commit()
+        assert _titles('heat') == (['Heat 2'], False)
+        assert _titles('ronin') == (['Ronin'], False)
@@ -0,0 +1,29 @@
+import io
+import os
+
+import pytest
+
+from app.storage import LocalStorage, StorageBackend
+
+
+def test_storage_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+
+def test_local_storage_keeps_keys_inside_root(tmp_path):
+    storage = LocalStorage(str(tmp_path / 'storage'), concurrency=1)
+    path = storage.upload(io.BytesIO(b'data'), 'videos/movie/1-movie.mp4')
+    assert path == os.path.join(str(tmp_path / 'storage'), 'videos', 'movie', '1-movie.mp4')
+
+    for key in ('../secret', 'videos/../../secret', '/etc/passwd', ''):
+        with pytest.raises(ValueError):
+            storage.url_for(key)
+
+
+def test_local_storage_rejects_symlink_outside_root(tmp_path):
+    root = tmp_path / 'storage'
+    root.mkdir()
+    (root / 'outside').symlink_to(tmp_path)
+    with pytest.raises(ValueError):
+        LocalStorage(str(root)).url_for('outside/secret')
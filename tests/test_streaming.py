@@ -0,0 +1,112 @@
+import pytest
+from werkzeug.wsgi import FileWrapper
+
+from app.extensions import db
+from app.models import Movie
+
+DATA = bytes(range(256)) * 40  # 10240 байт
+
+
+@pytest.fixture
+def movie_id(app, tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    (videos / 'movie.mp4').write_bytes(DATA)
+    monkeypatch.setattr('app.streaming.get_videos_root', lambda: str(videos))
+    app.config.update(STREAM_MAX_RANGE_SIZE=1000, STREAM_CHUNK_SIZE=300)
+    with app.app_context():
+        movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='movie.mp4')
+        db.session.add(movie)
+        db.session.commit()
+        return movie.id
+
+
+def _get(client, movie_id, **headers):
+    return client.get(f'/stream/movie/{movie_id}', headers=headers)
+
+
+def test_full_file(client, movie_id):
+    response = _get(client, movie_id)
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.content_length == len(DATA)
+
+
+@pytest.mark.parametrize('header, start, stop', [
+    ('bytes=100-199', 100, 200),
+    ('bytes=-100', len(DATA) - 100, len(DATA)),
+    ('bytes=-100000', 0, len(DATA)),
+    # Открытый диапазон ограничен STREAM_MAX_RANGE_SIZE
+    ('bytes=5000-', 5000, 6000),
+    ('bytes=10000-', 10000, len(DATA)),
+    ('bytes=100-100000', 100, len(DATA)),
+    # Соседние отрезки склеиваются в один
+    ('bytes=0-99,100-149,150-199', 0, 200),
+])
+def test_single_range(client, movie_id, header, start, stop):
+    response = _get(client, movie_id, Range=header)
+    assert response.status_code == 206
+    assert response.data == DATA[start:stop]
+    assert response.headers['Content-Range'] == f'bytes {start}-{stop - 1}/{len(DATA)}'
+    assert response.content_length == stop - start
+
+
+def test_single_range_through_file_wrapper(client, movie_id):
+    wrapped = []
+
+    def file_wrapper(f, chunk_size):
+        wrapped.append(f)
+        return FileWrapper(f, chunk_size)
+
+    response = client.get(
+        f'/stream/movie/{movie_id}', headers={'Range': 'bytes=1000-2499'},
+        environ_overrides={'wsgi.file_wrapper': file_wrapper},
+    )
+    assert response.status_code == 206
+    assert response.data == DATA[1000:2500]
+    # Отрезок не читается дальше своего конца
+    assert type(wrapped[0]).__name__ == '_FileRange'
+
+
+def test_multiple_ranges(client, movie_id):
+    response = _get(client, movie_id, Range='bytes=0-9,500-509')
+    assert response.status_code == 206
+    boundary = response.mimetype_params['boundary']
+    assert response.mimetype == 'multipart/byteranges'
+    assert response.content_length == len(response.data)
+    body = response.data
+    assert body.endswith(f'\r\n--{boundary}--\r\n'.encode())
+    assert f'Content-Range: bytes 0-9/{len(DATA)}\r\n\r\n'.encode() + DATA[0:10] in body
+    assert f'Content-Range: bytes 500-509/{len(DATA)}\r\n\r\n'.encode() + DATA[500:510] in body
+
+
+def test_overlapping_ranges_return_whole_file(client, movie_id):
+    # Пересекающиеся диапазоны parse_range_header отвергает, Range игнорируется
+    response = _get(client, movie_id, Range='bytes=0-99,50-149')
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_unsatisfiable_range(client, movie_id):
+    response = _get(client, movie_id, Range=f'bytes={len(DATA)}-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_if_range(client, movie_id):
+    etag = _get(client, movie_id).headers['ETag']
+
+    response = _get(client, movie_id, Range='bytes=0-9', **{'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == DATA[:10]
+
+    # Файл изменился — отдаётся целиком
+    response = _get(client, movie_id, Range='bytes=0-9', **{'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_not_modified(client, movie_id):
+    etag = _get(client, movie_id).headers['ETag']
+    assert _get(client, movie_id, **{'If-None-Match': etag}).status_code == 304
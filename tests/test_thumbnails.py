@@ -0,0 +1,68 @@
+import io
+import os
+
+from PIL import Image
+
+from app.extensions import db
+from app.models import Movie
+from app.thumbnails import backfill_thumbnails, save_thumbnail, thumbnail_dir, variant_filename
+
+
+def _image():
+    data = io.BytesIO()
+    Image.new('RGB', (800, 1200), 'red').save(data, format='JPEG')
+    data.seek(0)
+    return data
+
+
+def test_variant_names_follow_size_and_quality(app, tmp_path):
+    app.config.update(THUMBNAIL_DIR=str(tmp_path / 'thumbnails'), THUMBNAIL_WORKERS=0)
+    with app.test_request_context():
+        fields = save_thumbnail(_image())
+        digest = fields['thumbnail_hash']
+        assert variant_filename(digest, 'card').endswith('-card-360x540-q80.webp')
+        db.session.add(Movie(title='Heat', description='d', thumbnail_url=fields['thumbnail_url'],
+                             thumbnail_hash=digest, video_url='m.mp4'))
+        db.session.commit()
+
+        app.config['THUMBNAIL_QUALITY'] = 60
+        card = os.path.join(thumbnail_dir(), *variant_filename(digest, 'card').split('/'))
+        assert not os.path.exists(card)
+
+        # Сохранённый исходник позволяет перестроить варианты под новые настройки
+        assert backfill_thumbnails() == (1, 0)
+        assert os.path.exists(card)
+        assert db.session.scalar(db.select(Movie.thumbnail_url)).endswith('-large-720x1080-q60.webp')
+        assert backfill_thumbnails() == (0, 0)
+
+
+def test_only_variants_are_served(app, client):
+    app.config['THUMBNAIL_WORKERS'] = 0
+    with app.test_request_context():
+        digest = save_thumbnail(_image())['thumbnail_hash']
+        card = variant_filename(digest, 'card')
+    # Исходник с EXIF хранится вне раздаваемого каталога
+    assert not os.path.exists(os.path.join(app.config['THUMBNAIL_DIR'], digest[:2], f'{digest}.source'))
+    assert os.path.exists(os.path.join(app.config['THUMBNAIL_SOURCE_DIR'], digest[:2], f'{digest}.source'))
+
+    assert client.get(f'/thumbnails/{card}').status_code == 200
+    assert client.get(f'/thumbnails/{digest[:2]}/{digest}.source').status_code == 404
+    assert client.get(f'/thumbnails/{digest[:2]}/notes.txt').status_code == 404
+
+
+def test_rebuild_moves_legacy_source_out_of_served_dir(app):
+    app.config['THUMBNAIL_WORKERS'] = 0
+    with app.test_request_context():
+        fields = save_thumbnail(_image())
+        digest = fields['thumbnail_hash']
+        db.session.add(Movie(title='Heat', description='d', thumbnail_url=fields['thumbnail_url'],
+                             thumbnail_hash=digest, video_url='m.mp4'))
+        db.session.commit()
+        source = os.path.join(app.config['THUMBNAIL_SOURCE_DIR'], digest[:2], f'{digest}.source')
+        legacy = os.path.join(thumbnail_dir(), digest[:2], f'{digest}.source')
+        os.replace(source, legacy)
+
+        app.config['THUMBNAIL_QUALITY'] = 60
+        assert backfill_thumbnails() == (1, 0)
+        assert os.path.exists(source)
+        assert not os.path.exists(legacy)
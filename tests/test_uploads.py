@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import pytest
+
+from app.extensions import db
+from app.jobs import JobWorker
+from app.models import Job, Movie
+
+
+@pytest.fixture
+def video_dir(app, tmp_path, monkeypatch):
+    # Видео пишутся во временный каталог, а не в app/static/videos
+    path = tmp_path / 'videos'
+    path.mkdir()
+    monkeypatch.setattr('app.uploads.get_video_dir', lambda content_type, season=None: str(path))
+    app.config.update(STORAGE_REPLICATE_VIDEOS=True, STORAGE_LOCAL_ROOT=str(tmp_path / 'storage'))
+    monkeypatch.setattr('app.external_ratings._fetch_rating', lambda title: 7.5)
+    return path
+
+
+def _drain(app):
+    with app.app_context():
+        JobWorker(app).drain()
+
+
+def _start_upload(client, title, data, sha256=None):
+    response = client.post('/upload/init/movie', json={
+        'filename': 'movie.mp4', 'size': len(data), 'sha256': sha256 or hashlib.sha256(data).hexdigest(),
+        'title': title, 'description': 'Description', 'genre': 'Drama', 'year': 2001,
+    })
+    assert response.status_code == 201, response.json
+    upload_id = response.json['upload_id']
+    response = client.put(f'/upload/{upload_id}', data=data, headers={'Upload-Offset': '0'})
+    assert response.status_code == 200, response.json
+    return upload_id
+
+
+def _upload(app, client, title, data):
+    upload_id = _start_upload(client, title, data)
+    response = client.post(f'/upload/{upload_id}/finalize')
+    assert response.status_code == 202, response.json
+    _drain(app)
+    response = client.post(f'/upload/{upload_id}/finalize')
+    assert response.status_code == 201, response.json
+    return response.json['content_id']
+
+
+def test_same_filename_does_not_overwrite_another_video(app, client, user, login, video_dir):
+    login(user)
+    first_id = _upload(app, client, 'First', b'first video')
+    second_id = _upload(app, client, 'Second', b'second video')
+
+    with app.app_context():
+        first, second = db.session.get(Movie, first_id), db.session.get(Movie, second_id)
+        assert first.video_url != second.video_url
+        with open(first.video_url, 'rb') as f:
+            assert f.read() == b'first video'
+        with open(second.video_url, 'rb') as f:
+            assert f.read() == b'second video'
+        assert os.path.basename(first.video_url).endswith('-movie.mp4')
+
+        keys = {job.payload['key'] for job in Job.query.filter_by(name='storage.upload_file')}
+        assert len(keys) == 2
+
+
+def test_finalize_is_checked_in_background_and_safe_to_retry(app, client, user, login, video_dir):
+    login(user)
+    upload_id = _start_upload(client, 'Retried', b'retried video')
+
+    first = client.post(f'/upload/{upload_id}/finalize')
+    assert first.status_code == 202, first.json
+    assert first.json['status'] == 'finalizing'
+    # Клиент не дождался ответа и повторил запрос — новая задача не ставится
+    second = client.post(f'/upload/{upload_id}/finalize')
+    assert second.status_code == 202
+    assert second.json['job'] == first.json['job'] == first.headers['Location']
+
+    _drain(app)
+    done = [client.post(f'/upload/{upload_id}/finalize') for _ in range(2)]
+    assert [response.status_code for response in done] == [201, 201]
+    assert done[0].json['content_id'] == done[1].json['content_id']
+    assert client.get(first.json['job']).json['status'] == 'succeeded'
+    assert client.get(f'/upload/{upload_id}').json['status'] == 'complete'
+
+    with app.app_context():
+        assert Movie.query.filter_by(title='Retried').count() == 1
+        assert Job.query.filter_by(name='uploads.finalize').count() == 1
+
+
+def test_checksum_mismatch_fails_upload(app, client, user, login, video_dir):
+    login(user)
+    upload_id = _start_upload(client, 'Broken', b'broken video', sha256='0' * 64)
+    assert client.post(f'/upload/{upload_id}/finalize').status_code == 202
+
+    _drain(app)
+    response = client.post(f'/upload/{upload_id}/finalize')
+    assert response.status_code == 422
+    assert response.json['status'] == 'failed'
+    assert response.json['error'] == 'File checksum mismatch'
+    assert not os.listdir(app.config['UPLOAD_TMP_DIR'])
+    with app.app_context():
+        assert Movie.query.filter_by(title='Broken').count() == 0
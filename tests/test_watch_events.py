@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import Movie, Show, User, UserPreference, WatchHistory
+from app.watch_events import WatchEventBuffer, flush_watch_events
+
+
+def _catalog():
+    users = [User(username=f'viewer{number}', email=f'viewer{number}@example.com') for number in range(2)]
+    for user in users:
+        user.set_password('secret-password')
+    movies = [Movie(title=title, description='d', thumbnail_url='t.jpg', video_url='m.mp4') for title in ('Heat', 'Ronin')]
+    show = Show(title='Dark', description='d', thumbnail_url='t.jpg')
+    db.session.add_all(users + movies + [show])
+    db.session.commit()
+    return [user.id for user in users], [movie.id for movie in movies], show.id
+
+
+def test_flush_writes_batch_and_keeps_latest_preferences(app):
+    with app.app_context():
+        (first, second), (heat, ronin), dark = _catalog()
+        db.session.add(UserPreference(user_id=first, genre='drama', last_watched_movie=heat))
+        db.session.commit()
+
+        now = datetime.utcnow()
+        # Порядок в пачке не совпадает с порядком просмотра
+        flush_watch_events([
+            (first, heat, None, now + timedelta(seconds=2)),
+            (first, ronin, None, now),
+            (first, None, dark, now + timedelta(seconds=1)),
+            (second, ronin, None, now),
+        ])
+
+        assert WatchHistory.query.count() == 4
+        preferences = {preference.user_id: preference for preference in UserPreference.query}
+        assert len(preferences) == 2
+        assert (preferences[first].last_watched_movie, preferences[first].last_watched_show) == (heat, dark)
+        assert preferences[first].genre == 'drama'
+        assert (preferences[second].last_watched_movie, preferences[second].last_watched_show) == (ronin, None)
+
+
+def test_buffer_writes_pending_events_on_stop(app, monkeypatch):
+    batches = []
+    flush = flush_watch_events
+
+    def failing_first_batch(events):
+        batches.append(len(events))
+        if len(batches) == 1:
+            raise RuntimeError('database is down')
+        flush(events)
+
+    monkeypatch.setattr('app.watch_events.flush_watch_events', failing_first_batch)
+    with app.app_context():
+        (first, _), (heat, _), dark = _catalog()
+
+    # Интервал больше длительности теста: пачки пишутся только по размеру и при остановке
+    buffer = WatchEventBuffer(app, batch_size=2, flush_interval=60)
+    for _ in range(3):
+        buffer.record(first, 'movie', heat)
+    buffer.record(first, 'show', dark)
+    buffer.record(first, 'movie', heat)
+    buffer.stop()
+
+    assert not buffer._thread.is_alive()
+    assert sum(batches) == 5 and max(batches) == 2
+    with app.app_context():
+        # Упавшая пачка теряется, но поток продолжает писать следующие
+        assert WatchHistory.query.count() == 3
+
+
+def test_full_queue_drops_events_without_blocking(app, monkeypatch):
+    buffer = WatchEventBuffer(app, max_queue=2)
+    monkeypatch.setattr(buffer, '_ensure_started', lambda: None)
+    for _ in range(3):
+        buffer.record(1, 'movie', 1)
+    assert buffer.dropped == 1
+    assert buffer._queue.qsize() == 2
+
+
+def test_watch_page_records_event_through_buffer(app, client, user, login):
+    app.config['WATCH_EVENTS_ASYNC'] = True
+    with app.app_context():
+        movie = Movie(title='Heat', description='d', thumbnail_url='t.jpg', video_url='m.mp4')
+        db.session.add(movie)
+        db.session.commit()
+        movie_id = movie.id
+
+    login(user)
+    assert client.get(f'/watch/movie/{movie_id}').status_code == 200
+    app.extensions['watch_events'].stop()
+
+    with app.app_context():
+        assert [(row.user_id, row.movie_id) for row in WatchHistory.query] == [(user, movie_id)]
+        assert db.session.scalar(db.select(UserPreference.last_watched_movie)) == movie_id
@@ -0,0 +1,24 @@
+import argparse
+import signal
+
+from app import create_app
+from app.jobs import JobWorker
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Исполнитель фоновых задач из таблицы job.")
+    parser.add_argument("--concurrency", type=int, default=None, help="По умолчанию JOBS_CONCURRENCY.")
+    parser.add_argument("--pool", choices=("thread", "process"), default=None, help="По умолчанию JOBS_POOL.")
+    args = parser.parse_args()
+
+    app = create_app()
+    if app.config["CACHE_BACKEND"] == "memory":
+        # Сброс кэша из задач остался бы в этом процессе и не дошёл бы до сервера
+        raise SystemExit("CACHE_BACKEND=memory is per process: use CACHE_BACKEND=filesystem or redis "
+                         "to run jobs in a separate worker.")
+    worker = JobWorker(app, concurrency=args.concurrency, pool=args.pool)
+    # SIGTERM от systemd/docker: новые задачи не берём, запущенные дорабатывают
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.serve()
+    except KeyboardInterrupt:
+        worker.stop()